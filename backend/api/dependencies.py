@@ -1,5 +1,16 @@
-from fastapi import Depends, HTTPException, status
+import os
+from typing import Tuple
+from fastapi import Depends, HTTPException, UploadFile, status
 from config.app import get_settings, Settings
+from utils.file_handler import (
+    stream_upload_to_file,
+    probe_image,
+    UploadTooLargeError,
+    ImageTooLargeError,
+    InvalidImageError
+)
+from utils.memory_budget import MemoryBudgetExceededError
+from utils.render_pool import get_render_pool, PoolSaturatedError, WorkerCrashedError
 
 async def get_api_settings() -> Settings:
     """API設定の依存関係"""
@@ -13,3 +24,55 @@ async def validate_file_size(file_size: int, settings: Settings = Depends(get_ap
             status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
             detail=f"File size exceeds maximum allowed size ({max_size / 1024 / 1024:.1f}MB)"
         )
+
+async def receive_image_upload(file: UploadFile, file_path: str, max_bytes: int) -> Tuple[int, int, str]:
+    """
+    アップロードをストリーミング保存し、ヘッダーから画像サイズを検証
+    上限超過は413、画像でないものは400（いずれも保存済みファイルは削除）
+    本文が上限を大きく超える場合は、ここに来る前に UploadSizeLimitMiddleware が受信を打ち切る
+    """
+    try:
+        await stream_upload_to_file(file, file_path, max_bytes)
+        return probe_image(file_path)
+    except (UploadTooLargeError, ImageTooLargeError, InvalidImageError) as e:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        status_code = (
+            status.HTTP_400_BAD_REQUEST if isinstance(e, InvalidImageError)
+            else status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        )
+        raise HTTPException(status_code=status_code, detail=str(e))
+
+def submit_to_render_pool(fn, *args, **kwargs):
+    """
+    レンダリングプールへ投入して Future を返す（満杯時は503 + Retry-After）
+    memory_estimate がジョブ単独のメモリ上限を超える場合は、待っても実行できないため413
+    """
+    try:
+        return get_render_pool().submit(fn, *args, **kwargs)
+    except MemoryBudgetExceededError as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"{e}. Please try with a smaller image or region."
+        )
+    except PoolSaturatedError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy processing other images. Please retry shortly.",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+def worker_crashed_error(error: WorkerCrashedError) -> HTTPException:
+    """ワーカーの異常終了（プールは作り直し済み）を503 + Retry-After にする"""
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Image processing was interrupted. Please retry shortly.",
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+async def run_in_render_pool(fn, *args, **kwargs):
+    """レンダリングプールで実行（満杯時・ワーカー異常終了時は503 + Retry-After）"""
+    try:
+        return await submit_to_render_pool(fn, *args, **kwargs)
+    except WorkerCrashedError as e:
+        raise worker_crashed_error(e)
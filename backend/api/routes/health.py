@@ -1,5 +1,10 @@
 from fastapi import APIRouter, Depends
 from config.app import get_settings, Settings
+from utils.render_pool import get_render_pool
+from utils.job_store import get_job_store
+from utils.result_store import get_result_store
+from utils.render_cache import get_render_cache
+from utils.artifact_index import get_artifact_index
 import psutil
 import os
 
@@ -22,6 +27,7 @@ async def health_check(settings: Settings = Depends(get_settings)):
         critical_threshold = 450  # 450MB (512MBの88%)
         
         status = "ok"
+        render_pool = get_render_pool()
         if memory_mb > critical_threshold:
             status = "critical"
         elif memory_mb > warning_threshold:
@@ -42,7 +48,18 @@ async def health_check(settings: Settings = Depends(get_settings)):
                 "max_upload_mb": settings.MAX_UPLOAD_SIZE / 1024 / 1024,
                 "single_preview_mode": getattr(settings, 'ENABLE_SINGLE_PREVIEW_MODE', True),
                 "quality_level": "high"  # 高品質維持を示す
-            }
+            },
+            # デコード済み画像・キャンバスのキャッシュはワーカー内にあるため、ワーカーから受け取った値を合算
+            "caches": render_pool.cache_stats(),
+            "render_workers": [
+                {"pid": snapshot["pid"], "rss": snapshot["rss"], "peak_rss": snapshot["peak_rss"]}
+                for snapshot in render_pool.worker_stats()
+            ],
+            "render_pool": render_pool.stats(),
+            "jobs": get_job_store().stats(),
+            "results": get_result_store().stats(),
+            "render_cache": get_render_cache().stats(),
+            "artifacts": get_artifact_index().stats()
         }
     except Exception as e:
         return {
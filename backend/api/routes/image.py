@@ -1,52 +1,69 @@
 import os
+import copy
 import uuid
 import shutil
+import asyncio
+import anyio
 from typing import Optional, Dict, Any
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, BackgroundTasks, Depends, status
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends, Request, status
+from fastapi.responses import Response, StreamingResponse
 import numpy as np
 from PIL import Image
 import io
-from api.dependencies import validate_file_size, get_api_settings
-from config.app import Settings
-from utils.file_handler import save_upload_file, get_file_path, delete_old_files
-from utils.optimized_processor import process_hidden_image_optimized
+from api.dependencies import (
+    get_api_settings,
+    receive_image_upload,
+    run_in_render_pool,
+    submit_to_render_pool,
+    worker_crashed_error
+)
+from config.app import Settings, get_settings
+from core.geometry import preview_target_size
+from utils.encoders import get_encoder, negotiate_output_format, media_type_for_filename
+from utils.http_cache import artifact_response, file_digest
+from utils.render_cache import get_render_cache, render_cache_key, CACHE_HIT, CACHE_MISS, CACHE_SHARED
+from utils.result_store import get_result_store, stored_result_response
+from utils.artifact_index import get_artifact_index
+from utils.file_handler import get_file_path, probe_image_header, wait_for_render_output, follow_render_output
+from utils.logger import get_logger
+from utils.memory_budget import MemoryEstimate, estimate_render_peak
+from utils.metrics import observe_render
+from utils.timing import server_timing_header
+from utils.optimized_processor import process_hidden_image_optimized, render_preview_optimized, new_result_filename
+from utils.render_pool import WorkerCrashedError
 
 router = APIRouter()
+logger = get_logger(__name__)
 
 @router.post("/upload")
 async def upload_image(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     settings: Settings = Depends(get_api_settings)
 ):
-    """画像をアップロードして処理用に保存"""
+    """画像をアップロードして処理用に保存（チャンク単位で保存し、デコード前にサイズを検証）"""
     try:
-        # ファイルサイズの検証
-        file_content = await file.read()
-        await validate_file_size(len(file_content), settings)
-        
-        # ファイルを一時保存
-        image = Image.open(io.BytesIO(file_content))
+        # ファイルをストリーミング保存（受信中にサイズ上限を適用）
         filename = f"{uuid.uuid4()}.png"
-        file_path = await save_upload_file(io.BytesIO(file_content), filename)
+        file_path = get_file_path(filename)
+        width, height, _ = await receive_image_upload(file, file_path, settings.MAX_UPLOAD_SIZE)
         
-        # 古いファイルのクリーンアップをバックグラウンドで実行
-        background_tasks.add_task(delete_old_files, settings.TEMP_FILE_EXPIRY)
+        # 生成物インデックスに登録（期限切れの削除は定期スイーパーが行う）
+        get_artifact_index().record(filename)
         
         return {
             "success": True,
             "filename": filename,
-            "width": image.width,
-            "height": image.height,
+            "width": width,
+            "height": height,
             "url": f"/uploads/{filename}"
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@router.post("/process")
-async def process_image(
-    background_tasks: BackgroundTasks,
+async def parse_process_form(
+    request: Request,
     filename: str = Form(...),
     region_x: int = Form(...),
     region_y: int = Form(...),
@@ -73,173 +90,319 @@ async def process_image(
     # 形状パラメータを追加
     shape_type: str = Form("rectangle"),          # 形状タイプ（rectangle, circle, star, heart, japanese, arabesque）
     shape_params: str = Form("{}"),               # 形状パラメータ（JSON文字列）
-    settings: Settings = Depends(get_api_settings)
-):
-    """画像を処理してモアレ効果を適用（最適化パラメータ拡張版）"""
-    try:
-        # デバッグ用ログ
-        print(f"🚀 Optimized process request received:")
-        print(f"  filename: {filename}")
-        print(f"  region: ({region_x}, {region_y}, {region_width}, {region_height})")
-        print(f"  pattern_type: {pattern_type}")
-        print(f"  stripe_method: {stripe_method}")
-        print(f"  resize_method: {resize_method}")
-        print(f"  add_border: {add_border}")
-        print(f"  border_width: {border_width}")
-        print(f"  overlay_ratio: {overlay_ratio}")
-        print(f"  strength: {strength}")
-        print(f"  opacity: {opacity} (optimized to 0.0)")
-        print(f"  enhancement_factor: {enhancement_factor}")
-        print(f"  frequency: {frequency}")
-        print(f"  blur_radius: {blur_radius} (optimized to 0)")
-        print(f"  contrast_boost: {contrast_boost}")
-        print(f"  color_shift: {color_shift}")
-        print(f"  sharpness_boost: {sharpness_boost} (new parameter)")
-        print(f"  stripe_color1: {stripe_color1}")
-        print(f"  stripe_color2: {stripe_color2}")
-        
-        # ファイルパスの取得と確認
-        file_path = get_file_path(filename)
-        print(f"  file_path: {file_path}")
-        
-        if not os.path.exists(file_path):
-            print(f"❌ File not found: {file_path}")
-            raise HTTPException(status_code=404, detail=f"File not found: {filename}")
-        
-        # ファイルサイズとアクセス権確認
-        file_size = os.path.getsize(file_path)
-        print(f"  file_size: {file_size} bytes")
-        
-        # 領域情報の構築と検証
-        region = (region_x, region_y, region_width, region_height)
-        
-        # 領域の妥当性チェック
-        if region_width <= 0 or region_height <= 0:
-            raise HTTPException(status_code=400, detail="Invalid region dimensions")
-        
-        if region_x < 0 or region_y < 0:
-            raise HTTPException(status_code=400, detail="Invalid region position")
-        
-        # boolean値の変換（文字列から真偽値へ）
-        add_border_bool = add_border.lower() in ('true', '1', 'yes', 'on')
-        print(f"  add_border_bool: {add_border_bool}")
-        
-        # 処理パラメータの検証
-        valid_pattern_types = ["horizontal", "vertical"]
-        if pattern_type not in valid_pattern_types:
-            pattern_type = "horizontal"
-            print(f"  Invalid pattern_type, using default: {pattern_type}")
-        
-        valid_stripe_methods = [
-            "overlay", "high_frequency", "moire_pattern", "adaptive", 
-            "adaptive_subtle", "adaptive_strong", "adaptive_minimal",
-            "perfect_subtle", "ultra_subtle", "near_perfect",
-            "color_preserving", "hue_preserving", "blended", "hybrid_overlay"
-        ]
-        if stripe_method not in valid_stripe_methods:
-            stripe_method = "overlay"
-            print(f"  Invalid stripe_method, using default: {stripe_method}")
-        
-        valid_resize_methods = ["contain", "cover", "stretch"]
-        if resize_method not in valid_resize_methods:
-            resize_method = "contain"
-            print(f"  Invalid resize_method, using default: {resize_method}")
-        
-        # 最適化パラメータの範囲チェック
-        if opacity < 0.0 or opacity > 1.0:
-            opacity = max(0.0, min(1.0, opacity))
-            print(f"  Opacity adjusted to valid range: {opacity}")
-        
-        if blur_radius < 0 or blur_radius > 50:
-            blur_radius = max(0, min(50, blur_radius))
-            print(f"  Blur radius adjusted to valid range: {blur_radius}")
-        
-        if sharpness_boost < -2.0 or sharpness_boost > 2.0:
-            sharpness_boost = max(-2.0, min(2.0, sharpness_boost))
-            print(f"  Sharpness boost adjusted to valid range: {sharpness_boost}")
-        
-        print(f"✅ Starting optimized image processing...")
-        
-        # 最適化パラメータ辞書を作成
-        processing_params = {
-            'strength': strength,
-            'opacity': opacity,
-            'enhancement_factor': enhancement_factor,
-            'frequency': frequency,
-            'blur_radius': blur_radius,
-            'contrast_boost': contrast_boost,
-            'color_shift': color_shift,
-            'overlay_ratio': overlay_ratio,
-            'sharpness_boost': sharpness_boost,  # 新しいパラメータを追加
-            'stripe_color1': stripe_color1,      # 縞色1を追加
-            'stripe_color2': stripe_color2       # 縞色2を追加
-        }
-        
-        print(f"📊 Optimized processing parameters: {processing_params}")
-        
-        # メモリ最適化版の画像処理を実行
-        result_files = process_hidden_image_optimized(
-            file_path,
-            region,
-            pattern_type,
-            stripe_method,
-            resize_method,
-            add_border_bool,
-            border_width,
-            overlay_ratio,
-            processing_params,  # 最適化パラメータを渡す
-            stripe_color1,      # 縞色1
-            stripe_color2,      # 縞色2
-            shape_type,         # 形状タイプ
-            shape_params        # 形状パラメータ（JSON文字列）
-        )
-        
-        print(f"✅ Optimized processing completed. Result: {result_files}")
-        
+    # プレビューモード（縮小キャンバスで描画して画像を直接返す）
+    preview: str = Form("false"),
+    preview_size: int = Form(0),                  # プレビューの長辺（0で既定値）
+    # 出力形式（空の場合は Accept ヘッダーと設定値から決定）
+    output_format: str = Form(""),                # png / webp
+    encoder_tier: str = Form("")                  # fastest / balanced / smallest
+) -> Dict[str, Any]:
+    """処理リクエストのフォームを検証して処理引数にまとめる（/api/process と /api/jobs で共用）"""
+    # デバッグ用ログ（DEBUG レベルの場合のみ出力）
+    logger.debug(
+        "🚀 Optimized process request received: filename=%s, region=(%d, %d, %d, %d), "
+        "pattern_type=%s, stripe_method=%s, resize_method=%s, add_border=%s, border_width=%s, shape_type=%s",
+        filename, region_x, region_y, region_width, region_height,
+        pattern_type, stripe_method, resize_method, add_border, border_width, shape_type
+    )
+    
+    # ファイルパスの取得と確認
+    file_path = get_file_path(filename)
+    
+    if not os.path.exists(file_path):
+        logger.info("❌ File not found: %s", file_path)
+        raise HTTPException(status_code=404, detail=f"File not found: {filename}")
+    
+    # 領域の妥当性チェック
+    if region_width <= 0 or region_height <= 0:
+        raise HTTPException(status_code=400, detail="Invalid region dimensions")
+    
+    if region_x < 0 or region_y < 0:
+        raise HTTPException(status_code=400, detail="Invalid region position")
+    
+    # boolean値の変換（文字列から真偽値へ）
+    add_border_bool = add_border.lower() in ('true', '1', 'yes', 'on')
+    
+    # 処理パラメータの検証
+    valid_pattern_types = ["horizontal", "vertical"]
+    if pattern_type not in valid_pattern_types:
+        pattern_type = "horizontal"
+        logger.debug("  Invalid pattern_type, using default: %s", pattern_type)
+    
+    valid_stripe_methods = [
+        "overlay", "high_frequency", "moire_pattern", "adaptive", 
+        "adaptive_subtle", "adaptive_strong", "adaptive_minimal",
+        "perfect_subtle", "ultra_subtle", "near_perfect",
+        "color_preserving", "hue_preserving", "blended", "hybrid_overlay",
+        "gradation"
+    ]
+    if stripe_method not in valid_stripe_methods:
+        stripe_method = "overlay"
+        logger.debug("  Invalid stripe_method, using default: %s", stripe_method)
+    
+    valid_resize_methods = ["contain", "cover", "stretch"]
+    if resize_method not in valid_resize_methods:
+        resize_method = "contain"
+        logger.debug("  Invalid resize_method, using default: %s", resize_method)
+    
+    # 最適化パラメータの範囲チェック
+    if opacity < 0.0 or opacity > 1.0:
+        opacity = max(0.0, min(1.0, opacity))
+        logger.debug("  Opacity adjusted to valid range: %s", opacity)
+    
+    if blur_radius < 0 or blur_radius > 50:
+        blur_radius = max(0, min(50, blur_radius))
+        logger.debug("  Blur radius adjusted to valid range: %s", blur_radius)
+    
+    if sharpness_boost < -2.0 or sharpness_boost > 2.0:
+        sharpness_boost = max(-2.0, min(2.0, sharpness_boost))
+        logger.debug("  Sharpness boost adjusted to valid range: %s", sharpness_boost)
+    
+    # 最適化パラメータ辞書を作成
+    processing_params = {
+        'strength': strength,
+        'opacity': opacity,
+        'enhancement_factor': enhancement_factor,
+        'frequency': frequency,
+        'blur_radius': blur_radius,
+        'contrast_boost': contrast_boost,
+        'color_shift': color_shift,
+        'overlay_ratio': overlay_ratio,
+        'sharpness_boost': sharpness_boost,  # 新しいパラメータを追加
+        'stripe_color1': stripe_color1,      # 縞色1を追加
+        'stripe_color2': stripe_color2       # 縞色2を追加
+    }
+    
+    logger.debug("📊 Optimized processing parameters: %s", processing_params)
+    
+    # プレビューサイズ（長辺を設定の上限内に収める）
+    preview_canvas_size = None
+    if preview.lower() in ('true', '1', 'yes', 'on'):
+        settings = get_settings()
+        preview_dimension = preview_size if preview_size > 0 else settings.PREVIEW_DIMENSION
+        preview_dimension = max(64, min(settings.PREVIEW_MAX_DIMENSION, preview_dimension))
+        preview_canvas_size = preview_target_size(preview_dimension)
+        logger.debug("  preview: %dx%d", *preview_canvas_size)
+    
+    # 出力形式（明示指定 > Accept ヘッダー > 設定値）と圧縮段階
+    settings = get_settings()
+    encoder = get_encoder(
+        negotiate_output_format(output_format, request.headers.get("accept"), settings.RESULT_OUTPUT_FORMAT),
+        encoder_tier or (settings.PREVIEW_ENCODER_TIER if preview_canvas_size else settings.RESULT_ENCODER_TIER)
+    )
+    logger.debug("  encoder: %s/%s", encoder.output_format, encoder.tier)
+    
+    memory_estimate = render_memory_estimate(
+        file_path, (region_x, region_y, region_width, region_height),
+        stripe_method, resize_method, shape_type, preview_canvas_size
+    )
+    
+    return {
+        "file_path": file_path,
+        "region": (region_x, region_y, region_width, region_height),
+        "pattern_type": pattern_type,
+        "stripe_method": stripe_method,
+        "resize_method": resize_method,
+        "add_border": add_border_bool,
+        "border_width": border_width,
+        "overlay_ratio": overlay_ratio,
+        "processing_params": processing_params,
+        "stripe_color1": stripe_color1,
+        "stripe_color2": stripe_color2,
+        "shape_type": shape_type,
+        "shape_params": shape_params,
+        "preview_size": preview_canvas_size,
+        "encoder": encoder,
+        "memory_estimate": memory_estimate
+    }
+
+def render_memory_estimate(file_path: str, region, stripe_method: str, resize_method: str,
+                           shape_type: str, preview_size=None) -> Optional[MemoryEstimate]:
+    """ヘッダーの画像サイズ・モードと処理条件からピークメモリを見積もる（読めない画像は見積もらない）"""
+    header = probe_image_header(file_path)
+    if header is None:
+        return None
+    source_size, source_mode = header
+    kind = "preview" if preview_size else "render"
+    model_bytes = estimate_render_peak(
+        source_size, source_mode, region, resize_method, stripe_method, shape_type, preview_size
+    )
+    logger.debug("  memory estimate: %.1fMB (%s:%s)", model_bytes / 1024 / 1024, kind, stripe_method)
+    return MemoryEstimate(f"{kind}:{stripe_method}", model_bytes)
+
+def render_arguments(process_request: Dict[str, Any]) -> tuple:
+    """process_hidden_image_optimized に渡す位置引数"""
+    return (
+        process_request["file_path"],
+        process_request["region"],
+        process_request["pattern_type"],
+        process_request["stripe_method"],
+        process_request["resize_method"],
+        process_request["add_border"],
+        process_request["border_width"],
+        process_request["overlay_ratio"],
+        process_request["processing_params"],  # 最適化パラメータを渡す
+        process_request["stripe_color1"],      # 縞色1
+        process_request["stripe_color2"],      # 縞色2
+        process_request["shape_type"],         # 形状タイプ
+        process_request["shape_params"]        # 形状パラメータ（JSON文字列）
+    )
+
+def render_options(process_request: Dict[str, Any]) -> Dict[str, Any]:
+    """process_hidden_image_optimized に渡すキーワード引数（出力形式と圧縮段階）"""
+    encoder = process_request["encoder"]
+    return {"output_format": encoder.output_format, "encoder_tier": encoder.tier}
+
+def render_cache_params(process_request: Dict[str, Any]) -> Dict[str, Any]:
+    """レンダリング結果キャッシュのキーに含めるパラメータ（アップロード内容は別途ハッシュ）"""
+    encoder = process_request["encoder"]
+    return {
+        "region": process_request["region"],
+        "pattern_type": process_request["pattern_type"],
+        "stripe_method": process_request["stripe_method"],
+        "resize_method": process_request["resize_method"],
+        "add_border": process_request["add_border"],
+        "border_width": process_request["border_width"],
+        "overlay_ratio": process_request["overlay_ratio"],
+        "processing_params": process_request["processing_params"],
+        "stripe_color1": process_request["stripe_color1"],
+        "stripe_color2": process_request["stripe_color2"],
+        "shape_type": process_request["shape_type"],
+        "shape_params": process_request["shape_params"],
+        "output_format": encoder.output_format,
+        "encoder_tier": encoder.tier
+    }
+
+async def resolve_render_cache_key(process_request: Dict[str, Any]) -> str:
+    """アップロード内容のハッシュ（ファイルごとに1回だけ計算）とパラメータからキーを作成"""
+    upload_digest = await anyio.to_thread.run_sync(file_digest, process_request["file_path"])
+    return render_cache_key(upload_digest, render_cache_params(process_request))
+
+def cached_process_response(key: str) -> Optional[Dict[str, Any]]:
+    """キャッシュ済みのレスポンスを取得（結果ファイルが期限切れで消えていれば破棄）"""
+    render_cache = get_render_cache()
+    response_data = render_cache.lookup(key)
+    if response_data is None:
+        return None
+    
+    result_filename = response_data["processing_info"]["filename"]
+    if get_result_store().get(result_filename) is None and not os.path.exists(get_file_path(result_filename)):
+        render_cache.invalidate(key)
+        return None
+    return response_data
+
+def build_process_response(process_request: Dict[str, Any], result_files: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    処理結果を確認してレスポンスを構築
+    メモリ上の結果（"result_data"）は結果ストアに登録し、ディスクの存在確認は行わない
+    """
+    if not result_files or "result" not in result_files:
+        raise HTTPException(status_code=500, detail="Processing failed: No result generated")
+    
+    result_filename = result_files["result"]
+    result_data = result_files.pop("result_data", None)
+    
+    if result_data is not None:
+        stored = get_result_store().put(result_filename, result_data, process_request["encoder"].media_type)
+        result_file_size = stored.size
+        logger.debug("✅ Result stored in memory: %s (%d bytes)", result_filename, result_file_size)
+    else:
         # 結果ファイルの存在確認
-        if not result_files or "result" not in result_files:
-            raise HTTPException(status_code=500, detail="Processing failed: No result generated")
-        
-        result_filename = result_files["result"]
         result_file_path = get_file_path(result_filename)
-        
         if not os.path.exists(result_file_path):
-            print(f"❌ Result file not found: {result_file_path}")
+            logger.error("❌ Result file not found: %s", result_file_path)
             raise HTTPException(status_code=500, detail="Processing failed: Result file not created")
         
         result_file_size = os.path.getsize(result_file_path)
-        print(f"✅ Result file created: {result_filename} ({result_file_size} bytes)")
-        
-        # 古いファイルのクリーンアップをバックグラウンドで実行
-        background_tasks.add_task(delete_old_files, settings.TEMP_FILE_EXPIRY)
-        
-        # 結果のURLを構築
-        result_urls = {
-            "result": f"/uploads/{result_filename}"
-        }
-        
-        print(f"✅ Optimized processing completed successfully. URLs: {result_urls}")
-        
-        # レスポンスを構築
-        response_data = {
-            "success": True,
-            "urls": result_urls,
-            "message": "最適化パラメータによる処理が完了しました",
-            "processing_info": {
-                "filename": result_filename,
-                "file_size": result_file_size,
-                "pattern_type": pattern_type,
-                "stripe_method": stripe_method,
-                "parameters_used": processing_params,
-                "optimization_applied": {
-                    "opacity_optimized": opacity == 0.0,
-                    "blur_optimized": blur_radius == 0,
-                    "sharpness_boost_applied": sharpness_boost != 0.0
-                }
+        get_artifact_index().record(result_filename, result_file_size)
+        logger.debug("✅ Result file created: %s (%d bytes)", result_filename, result_file_size)
+    
+    # 結果のURLを構築
+    result_urls = {
+        "result": f"/uploads/{result_filename}"
+    }
+    
+    processing_params = process_request["processing_params"]
+    processing_info = result_files.get("processing_info", {})
+    observe_render("full", process_request["stripe_method"], processing_info.get("timings"))
+    return {
+        "success": True,
+        "urls": result_urls,
+        "message": "最適化パラメータによる処理が完了しました",
+        "processing_info": {
+            "filename": result_filename,
+            "file_size": result_file_size,
+            "pattern_type": process_request["pattern_type"],
+            "stripe_method": process_request["stripe_method"],
+            "parameters_used": processing_params,
+            "encoding": processing_info.get("encoding"),
+            "timings": processing_info.get("timings"),
+            "optimization_applied": {
+                "opacity_optimized": processing_params["opacity"] == 0.0,
+                "blur_optimized": processing_params["blur_radius"] == 0,
+                "sharpness_boost_applied": processing_params["sharpness_boost"] != 0.0
             }
         }
+    }
+
+@router.post("/process")
+async def process_image(
+    response: Response,
+    process_request: Dict[str, Any] = Depends(parse_process_form),
+    settings: Settings = Depends(get_api_settings)
+):
+    """
+    画像を処理してモアレ効果を適用（最適化パラメータ拡張版）
+    preview=true の場合は縮小キャンバスで同じ処理を行い、保存せずに PNG を直接返す
+    フェーズごとの所要時間は processing_info.timings と Server-Timing ヘッダーで返す
+    """
+    try:
+        if process_request["preview_size"]:
+            return await render_preview(process_request)
+        
+        # 同一アップロード・同一パラメータの結果は再利用し、実行中の同一処理は完了を待つ
+        render_cache = get_render_cache()
+        cache_key = await resolve_render_cache_key(process_request)
+        
+        response_data = cached_process_response(cache_key)
+        if response_data is not None:
+            logger.debug("♻️ Render cache hit: %s", response_data["processing_info"]["filename"])
+            response_data["processing_info"]["render_cache"] = CACHE_HIT
+            # 今回のリクエストではレンダリングしていないため、計測値はヘッダーに含めない
+            response.headers["Server-Timing"] = server_timing_header(None, CACHE_HIT)
+            return response_data
+        
+        pending = render_cache.inflight(cache_key)
+        if pending is not None:
+            logger.debug("⏳ Identical render in flight, waiting for it")
+            response_data = copy.deepcopy(await asyncio.shield(pending))
+            response_data["processing_info"]["render_cache"] = CACHE_SHARED
+            response.headers["Server-Timing"] = server_timing_header(
+                response_data["processing_info"].get("timings"), CACHE_SHARED
+            )
+            return response_data
+        
+        # メモリ最適化版の画像処理をレンダリングプールで実行（満杯時は503）
+        render_cache.begin(cache_key)
+        try:
+            result_files = await run_in_render_pool(
+                process_hidden_image_optimized,
+                *render_arguments(process_request),
+                **render_options(process_request),
+                result_in_memory=settings.RESULT_STORE_MAX_BYTES > 0,
+                memory_estimate=process_request["memory_estimate"]
+            )
+            response_data = build_process_response(process_request, result_files)
+        except BaseException as e:
+            render_cache.fail(cache_key, e)
+            raise
+        render_cache.finish(cache_key, response_data)
+        response_data["processing_info"]["render_cache"] = CACHE_MISS
+        response.headers["Server-Timing"] = server_timing_header(
+            response_data["processing_info"].get("timings"), CACHE_MISS
+        )
         
-        print(f"📤 Sending optimized response: {response_data}")
+        logger.debug("📤 Sending optimized response: %s", response_data)
         
         return response_data
         
@@ -248,32 +411,112 @@ async def process_image(
         raise
         
     except Exception as e:
-        print(f"❌ Unexpected optimized processing error: {str(e)}")
-        print(f"❌ Error type: {type(e)}")
-        import traceback
-        traceback.print_exc()
-        
-        # 詳細なエラー情報を含むレスポンス
-        error_detail = {
-            "error": str(e),
-            "error_type": type(e).__name__,
-            "processing_stage": "optimized_processing"
-        }
+        logger.exception("❌ Unexpected optimized processing error (%s): %s", type(e).__name__, e)
         
         raise HTTPException(
             status_code=500, 
             detail=f"Optimized processing failed: {str(e)}"
         )
 
+async def render_preview(process_request: Dict[str, Any]) -> Response:
+    """スライダー操作用の縮小プレビューを描画して画像を返す（最終ダウンロード用ではない）"""
+    result = await run_in_render_pool(
+        render_preview_optimized,
+        *render_arguments(process_request),
+        **render_options(process_request),
+        preview_size=process_request["preview_size"],
+        memory_estimate=process_request["memory_estimate"]
+    )
+    processing_info = result.get("processing_info", {})
+    observe_render("preview", process_request["stripe_method"], processing_info.get("timings"))
+    canvas_width, canvas_height = processing_info.get("canvas_size", process_request["preview_size"])
+    encoding = processing_info.get("encoding", {})
+    return Response(
+        content=result["preview"],
+        media_type=process_request["encoder"].media_type,
+        headers={
+            "Cache-Control": "no-store",
+            "Vary": "Accept",
+            "X-Preview-Size": f"{canvas_width}x{canvas_height}",
+            "X-Processing-Time": f"{processing_info.get('processing_time', 0.0):.4f}",
+            "X-Encoding": f"{encoding.get('format')}/{encoding.get('tier')}",
+            "X-Encode-Time": f"{encoding.get('encode_time', 0.0):.4f}",
+            "Server-Timing": server_timing_header(processing_info.get("timings"))
+        }
+    )
+
+def _finish_stream(result_filename: str, stripe_method: str, future: "asyncio.Future"):
+    """ストリーミング処理の完了時に生成物を登録して処理時間を記録"""
+    if future.cancelled() or future.exception() is not None:
+        return
+    get_artifact_index().record(result_filename)
+    observe_render("stream", stripe_method, future.result().get("processing_info", {}).get("timings"))
+
+@router.post("/process/stream")
+async def process_image_stream(
+    process_request: Dict[str, Any] = Depends(parse_process_form),
+    settings: Settings = Depends(get_api_settings)
+):
+    """
+    画像を処理して結果画像をそのままストリーミングで返す（パラメータは /api/process と同じ）
+    合成済みの行バンドが書き出され次第送信を開始し、保存後の URL は X-Result-Url ヘッダーで通知する
+    （WebP は全行の合成後にエンコードされるため、送信開始はエンコード完了後になる）
+    """
+    # ファイル名を先に決めてワーカーに渡し、書き込み中のファイルを追従する
+    encoder = process_request["encoder"]
+    result_filename = new_result_filename(encoder.extension)
+    result_path = get_file_path(result_filename)
+    
+    render_future = submit_to_render_pool(
+        process_hidden_image_optimized,
+        *render_arguments(process_request),
+        **render_options(process_request),
+        result_filename=result_filename,
+        memory_estimate=process_request["memory_estimate"]
+    )
+    
+    # 書き込み開始前の失敗（読み込み・パターン生成）は通常のエラーレスポンスにする
+    await wait_for_render_output(result_path, render_future)
+    if render_future.done() and render_future.exception() is not None:
+        error = render_future.exception()
+        if isinstance(error, WorkerCrashedError):
+            raise worker_crashed_error(error)
+        logger.error("❌ Streaming processing failed before output: %s", error)
+        raise HTTPException(status_code=500, detail=f"Optimized processing failed: {str(error)}")
+    
+    # 書き込み完了後に生成物インデックスへ登録
+    render_future.add_done_callback(
+        lambda f: _finish_stream(result_filename, process_request["stripe_method"], f)
+    )
+    
+    return StreamingResponse(
+        follow_render_output(result_path, render_future),
+        media_type=encoder.media_type,
+        headers={
+            "Vary": "Accept",
+            "X-Result-Filename": result_filename,
+            "X-Result-Url": f"/uploads/{result_filename}",
+            "Cache-Control": "no-store"
+        }
+    )
+
 @router.get("/download/{filename}")
-async def download_image(filename: str):
-    """生成された画像をダウンロード"""
+async def download_image(filename: str, request: Request):
+    """
+    生成された画像をダウンロード（メモリ上の結果を優先）
+    内容ハッシュの ETag による 304 と、Range 指定による部分取得（206）に対応
+    """
+    download_name = f"pozt_{filename}"
+    stored = get_result_store().get(filename)
+    if stored is not None:
+        return await stored_result_response(request.headers, filename, stored, download_name=download_name)
+    
     file_path = get_file_path(filename)
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="File not found")
     
-    return FileResponse(
-        file_path, 
-        media_type="image/png",
-        filename=f"pozt_{filename}"
+    get_artifact_index().touch(filename)
+    return await artifact_response(
+        request.headers, filename, media_type_for_filename(filename),
+        path=file_path, download_name=download_name
     )
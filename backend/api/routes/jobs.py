@@ -0,0 +1,182 @@
+import asyncio
+import json
+from typing import Any, Dict
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+from api.dependencies import get_api_settings
+from api.routes.image import (
+    parse_process_form,
+    render_arguments,
+    render_options,
+    build_process_response,
+    resolve_render_cache_key,
+    cached_process_response
+)
+from config.app import Settings
+from utils.job_store import get_job_store, TERMINAL_STATES
+from utils.logger import get_logger
+from utils.optimized_processor import process_hidden_image_optimized, PROCESSING_PHASES
+from utils.render_cache import get_render_cache, CACHE_HIT, CACHE_MISS, CACHE_SHARED
+from utils.memory_budget import MemoryBudgetExceededError
+from utils.render_pool import get_render_pool, JobProgress, PoolSaturatedError
+
+router = APIRouter()
+logger = get_logger(__name__)
+
+# SSE のポーリング間隔と keep-alive 間隔（秒）
+EVENT_POLL_INTERVAL = 0.25
+EVENT_KEEPALIVE_INTERVAL = 15.0
+
+
+def _complete_job(job_id: str, response_data: Dict[str, Any], cache_status: str):
+    """処理結果をジョブレコードへ記録"""
+    processing_info = response_data["processing_info"]
+    # レコードには参照に必要な最小限の情報のみ保持
+    get_job_store().complete(job_id, {
+        "url": response_data["urls"]["result"],
+        "filename": processing_info["filename"],
+        "file_size": processing_info["file_size"],
+        "render_cache": cache_status,
+        "timings": processing_info.get("timings")
+    })
+    logger.debug("✅ Job %s completed (%s): %s", job_id, cache_status, processing_info["filename"])
+
+
+def _fail_job(job_id: str, error: BaseException):
+    """処理失敗をジョブレコードへ記録"""
+    if isinstance(error, HTTPException):
+        get_job_store().fail(job_id, str(error.detail))
+        return
+    logger.error("❌ Job %s failed: %s", job_id, error)
+    get_job_store().fail(job_id, str(error) or type(error).__name__)
+
+
+def _finish_job(job_id: str, process_request: Dict[str, Any], cache_key: str, future: "asyncio.Future"):
+    """レンダリング完了時にジョブレコードへ結果を記録し、同じ処理を待つリクエストへ配る"""
+    render_cache = get_render_cache()
+    try:
+        response_data = build_process_response(process_request, future.result())
+    except BaseException as e:
+        render_cache.fail(cache_key, e)
+        _fail_job(job_id, e)
+        return
+    render_cache.finish(cache_key, response_data)
+    _complete_job(job_id, response_data, CACHE_MISS)
+
+
+def _follow_shared_render(job_id: str, future: "asyncio.Future"):
+    """実行中の同一処理の完了をジョブレコードへ反映"""
+    if future.cancelled():
+        _fail_job(job_id, RuntimeError("Identical render was cancelled"))
+    elif future.exception() is not None:
+        _fail_job(job_id, future.exception())
+    else:
+        _complete_job(job_id, future.result(), CACHE_SHARED)
+
+
+def _submit_job(job_id: str, process_request: Dict[str, Any], cache_key: str, render_pool, settings: Settings):
+    """レンダリングプールへ投入（満杯時はジョブを破棄して503、メモリ上限を超える画像は413）"""
+    job_store = get_job_store()
+    try:
+        future = render_pool.submit(
+            process_hidden_image_optimized,
+            *render_arguments(process_request),
+            **render_options(process_request),
+            result_in_memory=settings.RESULT_STORE_MAX_BYTES > 0,
+            progress_callback=JobProgress(job_id),
+            memory_estimate=process_request["memory_estimate"]
+        )
+    except MemoryBudgetExceededError as e:
+        job_store.discard(job_id)
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except PoolSaturatedError as e:
+        job_store.discard(job_id)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy processing other images. Please retry shortly.",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+    get_render_cache().begin(cache_key)
+    future.add_done_callback(lambda f: _finish_job(job_id, process_request, cache_key, f))
+
+
+@router.post("/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def create_job(
+    process_request: Dict[str, Any] = Depends(parse_process_form),
+    settings: Settings = Depends(get_api_settings)
+):
+    """
+    処理ジョブを登録してすぐにジョブIDを返す（パラメータは /api/process と同じ）
+    同一条件の結果があれば完了済みのジョブを返し、実行中の同一処理があればその完了を待つ
+    """
+    job_store = get_job_store()
+    render_pool = get_render_pool()
+    render_cache = get_render_cache()
+    cache_key = await resolve_render_cache_key(process_request)
+
+    job = job_store.create(len(PROCESSING_PHASES))
+    cached_response = cached_process_response(cache_key)
+    pending = render_cache.inflight(cache_key) if cached_response is None else None
+    if cached_response is not None:
+        _complete_job(job.id, cached_response, CACHE_HIT)
+    elif pending is not None:
+        pending.add_done_callback(lambda f: _follow_shared_render(job.id, f))
+    else:
+        _submit_job(job.id, process_request, cache_key, render_pool, settings)
+
+    return {
+        "success": True,
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/api/jobs/{job.id}",
+        "events_url": f"/api/jobs/{job.id}/events"
+    }
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """ジョブの状態と結果を取得"""
+    job = get_job_store().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job.to_dict()
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, request: Request):
+    """フェーズの遷移を Server-Sent Events で配信（完了・失敗で終了）"""
+    job_store = get_job_store()
+    if job_store.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+
+    async def event_stream():
+        last_version = -1
+        idle_time = 0.0
+        while True:
+            job = job_store.get(job_id)
+            if job is None:
+                yield "event: expired\ndata: {}\n\n"
+                return
+
+            if job.version != last_version:
+                last_version = job.version
+                idle_time = 0.0
+                event = job.status if job.status in TERMINAL_STATES else "phase"
+                yield f"event: {event}\ndata: {json.dumps(job.to_dict())}\n\n"
+                if job.status in TERMINAL_STATES:
+                    return
+            elif idle_time >= EVENT_KEEPALIVE_INTERVAL:
+                idle_time = 0.0
+                yield ": keep-alive\n\n"
+
+            if await request.is_disconnected():
+                return
+            await asyncio.sleep(EVENT_POLL_INTERVAL)
+            idle_time += EVENT_POLL_INTERVAL
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
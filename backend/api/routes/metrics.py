@@ -0,0 +1,90 @@
+from typing import Any, Dict, List
+from fastapi import APIRouter
+from fastapi.responses import Response
+from utils.artifact_index import get_artifact_index
+from utils.job_store import get_job_store
+from utils.metrics import REQUEST_METRICS, Sample, process_memory_snapshot, render_exposition
+from utils.render_cache import get_render_cache
+from utils.render_pool import get_render_pool
+from utils.result_store import get_result_store
+
+router = APIRouter()
+
+EXPOSITION_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _cache_samples(name: str, stats: Dict[str, Any]) -> List[Sample]:
+    lookups = stats["hits"] + stats["misses"]
+    samples = [
+        Sample("cache_hits_total", "counter", "Cache hits", stats["hits"], cache=name),
+        Sample("cache_misses_total", "counter", "Cache misses", stats["misses"], cache=name),
+        Sample("cache_hit_ratio", "gauge", "Cache hit ratio since start",
+               stats["hits"] / lookups if lookups else 0.0, cache=name),
+        Sample("cache_entries", "gauge", "Cache entries", stats["entries"], cache=name)
+    ]
+    if "bytes" in stats:
+        samples.append(Sample("cache_bytes", "gauge", "Cache size in bytes", stats["bytes"], cache=name))
+    return samples
+
+
+def collect_samples() -> List[Sample]:
+    """取得時点のキャッシュ・プール・メモリの値を集める"""
+    render_pool = get_render_pool()
+    worker_stats = render_pool.worker_stats()
+    samples: List[Sample] = []
+
+    # キャッシュ（デコード済み画像・キャンバス・マスクはワーカーごとの値を合算）
+    for name, stats in render_pool.cache_stats().items():
+        samples.extend(_cache_samples(name, stats))
+    samples.extend(_cache_samples("results", get_result_store().stats()))
+    samples.extend(_cache_samples("render_results", get_render_cache().stats()))
+
+    # レンダリングプール
+    pool_stats = render_pool.stats()
+    for key in ("workers", "busy_workers", "queue_depth", "in_flight", "max_queue"):
+        samples.append(Sample(f"render_pool_{key}", "gauge", f"Render pool {key.replace('_', ' ')}", pool_stats[key]))
+    for key in ("completed", "failed", "rejected", "worker_crashes"):
+        samples.append(Sample(f"render_pool_{key}_total", "counter", f"Render pool tasks {key}", pool_stats[key]))
+    samples.append(Sample("render_pool_max_wait_seconds", "gauge", "Longest queue wait since start",
+                          pool_stats["max_wait_ms"] / 1000))
+
+    # メモリ予算（見積もりの予約量と補正係数）
+    memory_stats = pool_stats["memory"]
+    for key in ("limit_bytes", "resident_bytes", "budget_bytes", "reserved_bytes", "max_reserved_bytes",
+                "waiting"):
+        samples.append(Sample(f"memory_budget_{key}", "gauge", f"Memory budget {key.replace('_', ' ')}",
+                              memory_stats[key]))
+    for key in ("waited", "rejected"):
+        samples.append(Sample(f"memory_budget_{key}_total", "counter", f"Tasks {key} by the memory budget",
+                              memory_stats[key]))
+    for estimate_key, factor in memory_stats["calibration"].items():
+        samples.append(Sample("memory_estimate_calibration", "gauge", "Measured/estimated peak memory factor",
+                              factor, estimate=estimate_key))
+
+    # プロセスのメモリ（最大値は各プロセスの RSS の最高水位）
+    memory = process_memory_snapshot()
+    samples.append(Sample("process_rss_bytes", "gauge", "Resident set size", memory["rss"], role="main"))
+    samples.append(Sample("process_peak_rss_bytes", "gauge", "Resident set size high-water mark",
+                          memory["peak_rss"], role="main"))
+    for snapshot in worker_stats:
+        pid = snapshot["pid"]
+        samples.append(Sample("process_rss_bytes", "gauge", "Resident set size", snapshot["rss"],
+                              role="worker", pid=pid))
+        samples.append(Sample("process_peak_rss_bytes", "gauge", "Resident set size high-water mark",
+                              snapshot["peak_rss"], role="worker", pid=pid))
+
+    # ジョブ・生成物
+    for job_status, count in get_job_store().stats().items():
+        samples.append(Sample("jobs", "gauge", "Jobs by status", count, status=job_status))
+    artifact_stats = get_artifact_index().stats()
+    samples.append(Sample("artifact_files", "gauge", "Artifacts on disk", artifact_stats["files"]))
+    samples.append(Sample("artifact_bytes", "gauge", "Artifact bytes on disk", artifact_stats["bytes"]))
+    samples.append(Sample("result_spills_total", "counter", "Results spilled from memory to disk",
+                          get_result_store().stats()["spills"]))
+    return samples
+
+
+@router.get("/metrics")
+async def metrics():
+    """Prometheus 形式のメトリクス（レイテンシ・キャッシュヒット率・プール状況・メモリ）"""
+    return Response(render_exposition(REQUEST_METRICS, collect_samples()), media_type=EXPOSITION_MEDIA_TYPE)
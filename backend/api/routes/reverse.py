@@ -1,240 +1,234 @@
 # backend/api/routes/reverse.py - 超軽量・512MB制限対応版
 import os
+import time
 import uuid
 import gc
 import sys
 import psutil
 from typing import Optional
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, BackgroundTasks, Depends, status
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, BackgroundTasks, Depends, Request, status
 from fastapi.responses import FileResponse
 import numpy as np
 from PIL import Image
 import io
-from api.dependencies import validate_file_size, get_api_settings
+from api.dependencies import get_api_settings, receive_image_upload, run_in_render_pool
 from config.app import Settings
-from utils.file_handler import save_upload_file, get_file_path, delete_old_files
+from utils.encoders import EncoderSpec, get_encoder, negotiate_output_format, write_encoded_array
+from utils.artifact_index import get_artifact_index
+from utils.file_handler import get_file_path, probe_image_header
+from utils.logger import get_logger
+from utils.memory_budget import MemoryEstimate, estimate_reverse_peak, reverse_extraction_method
+from utils.metrics import REVERSE_LATENCY
+from utils.render_pool import get_render_pool
 from patterns.reverse import (
     extract_hidden_image_from_moire, 
     enhance_extracted_image_optimized
 )
 
 router = APIRouter()
+logger = get_logger(__name__)
 
-# **512MB制限対応: メモリ監視設定**
-MEMORY_WARNING_THRESHOLD = 350  # 350MB
-MEMORY_CRITICAL_THRESHOLD = 450  # 450MB  
+# **512MB制限対応: 実行前にピークメモリを見積もってレンダリングプールのメモリ予算から予約する**
 MAX_FILE_SIZE = 3 * 1024 * 1024  # 3MBに制限（従来の10MBから大幅削減）
 
+# 抽出処理のフェーズ名（progress_callback で通知）
+REVERSE_PHASES = ("load", "extract", "enhance", "encode")
+
 def get_memory_usage():
     """現在のメモリ使用量を取得（MB単位）"""
     process = psutil.Process(os.getpid())
     return process.memory_info().rss / 1024 / 1024
 
-def check_memory_safety():
-    """メモリ安全性をチェック"""
-    current_memory = get_memory_usage()
-    if current_memory > MEMORY_CRITICAL_THRESHOLD:
-        raise HTTPException(
-            status_code=507,
-            detail=f"Insufficient memory available ({current_memory:.1f}MB used). Please try with a smaller image."
+def reverse_memory_estimate(source_path: str, extraction_method: str) -> Optional[MemoryEstimate]:
+    """ヘッダーの画像サイズ・モードから抽出処理のピークメモリを見積もる（読めない画像は見積もらない）"""
+    header = probe_image_header(source_path)
+    if header is None:
+        return None
+    source_size, source_mode = header
+    method = reverse_extraction_method(source_size, extraction_method)
+    return MemoryEstimate(f"reverse:{method}", estimate_reverse_peak(source_size, source_mode, method))
+
+def extract_hidden_image_to_file(source_path: str, extraction_method: str, enhancement_level: float,
+                                 apply_enhancement: bool, enhancement_method: str, result_path: str,
+                                 encoder: EncoderSpec = None, progress_callback=None):
+    """
+    デコード→抽出→強調→保存を一括実行（レンダリングプールのワーカーで実行）
+    encoder 省略時は PNG の fastest で保存
+    progress_callback(phase_index, phase) は各フェーズの開始時に呼び出す（REVERSE_PHASES）
+    不正な画像の場合は ValueError
+    """
+    def begin_phase(phase_index):
+        if progress_callback is not None:
+            progress_callback(phase_index, REVERSE_PHASES[phase_index - 1])
+
+    begin_phase(1)
+    # **メモリ対策2: 画像読み込みの最適化**
+    try:
+        with Image.open(source_path) as image:
+            original_size = image.size
+            
+            # **メモリ対策3: 積極的なサイズ制限**
+            max_dimension = 800  # さらに小さく制限
+            if max(image.width, image.height) > max_dimension:
+                ratio = max_dimension / max(image.width, image.height)
+                new_size = (int(image.width * ratio), int(image.height * ratio))
+                image = image.resize(new_size, Image.Resampling.LANCZOS)
+                logger.debug("  Resized from %s to %s for memory safety", original_size, image.size)
+            
+            # **メモリ対策4: RGB統一（メモリ使用量予測可能）**
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            
+            # **メモリ対策5: 最小限の配列変換**
+            image_array = np.array(image, dtype=np.uint8)
+        
+        gc.collect()
+        
+    except Exception as e:
+        gc.collect()
+        raise ValueError(f"Invalid image file: {str(e)}")
+    
+    # **メモリ対策: フーリエ解析を小画像のみに制限**
+    if extraction_method == "fourier_analysis" and max(image_array.shape[:2]) > 512:
+        logger.warning("  ⚠️ Fourier analysis switched to pattern_subtraction for large images")
+        extraction_method = "pattern_subtraction"
+    
+    # **超軽量処理実行**
+    begin_phase(2)
+    extracted_image = extract_hidden_image_from_moire(
+        image_array, 
+        method=extraction_method, 
+        enhancement_level=enhancement_level
+    )
+    
+    # 入力画像を即座に削除
+    del image_array
+    gc.collect()
+    logger.debug("✅ Extraction completed")
+    
+    # **メモリ対策8: 強調処理の条件分岐**
+    begin_phase(3)
+    enhancement_applied = False
+    if apply_enhancement:
+        final_image = enhance_extracted_image_optimized(
+            extracted_image, 
+            method=enhancement_method
         )
-    return current_memory
+        del extracted_image  # 元画像を削除
+        enhancement_applied = True
+        logger.debug("✅ Enhancement applied")
+    else:
+        final_image = extracted_image
+        logger.debug("✅ No enhancement applied (memory efficient)")
+    
+    # **メモリ対策9: 結果保存の最適化（配列から直接エンコード、既定は高速設定）**
+    begin_phase(4)
+    if encoder is None:
+        encoder = get_encoder("png", "fastest")
+    result_size = (final_image.shape[1], final_image.shape[0])
+    encoding = write_encoded_array(result_path, encoder, np.ascontiguousarray(final_image))
+    
+    # 最終画像を削除
+    del final_image
+    gc.collect()
+    
+    return {
+        "extraction_method": extraction_method,
+        "enhancement_applied": enhancement_applied,
+        "original_size": original_size,
+        "result_size": result_size,
+        "encoding": encoding,
+        "worker_memory_mb": get_memory_usage()
+    }
 
 @router.post("/reverse")
 async def reverse_moire_image_ultra_light(
+    request: Request,
     background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     extraction_method: str = Form("pattern_subtraction"),  # デフォルトを最軽量に変更
     enhancement_level: float = Form(1.5),  # デフォルト値を軽減
     enhancement_method: str = Form("histogram_equalization"),
     apply_enhancement: str = Form("false"),  # デフォルトでOFF
+    output_format: str = Form(""),  # png / webp（空の場合は Accept ヘッダーと設定値から決定）
+    encoder_tier: str = Form(""),  # fastest / balanced / smallest（空の場合は設定値）
     settings: Settings = Depends(get_api_settings)
 ):
     """
     モアレ効果画像から隠し画像を抽出（512MB制限対応・超軽量版）
+    デコード以降の重い処理はレンダリングプールで実行する
     """
     initial_memory = get_memory_usage()
-    print(f"🚀 Ultra-light reverse processing started (Initial memory: {initial_memory:.1f}MB)")
-    print(f"  Method: {extraction_method}")
-    print(f"  Enhancement: {enhancement_level}")
-    print(f"  Apply enhancement: {apply_enhancement}")
-    
-    # **メモリ安全性チェック1: 処理開始前**
-    check_memory_safety()
+    logger.debug("🚀 Ultra-light reverse processing started (Initial memory: %.1fMB)", initial_memory)
+    logger.debug("  Method: %s", extraction_method)
+    logger.debug("  Enhancement: %s", enhancement_level)
+    logger.debug("  Apply enhancement: %s", apply_enhancement)
     
     try:
-        # **メモリ対策1: ファイルサイズを厳しく制限**
-        file_content = await file.read()
-        if len(file_content) > MAX_FILE_SIZE:
-            raise HTTPException(
-                status_code=413,
-                detail=f"File size ({len(file_content)/1024/1024:.1f}MB) exceeds 3MB limit for memory efficiency"
-            )
+        # **メモリ対策1: チャンク単位で一時保存し、受信中にサイズ上限を適用**
+        source_path = get_file_path(f"reverse_src_{uuid.uuid4().hex[:8]}.upload")
+        source_width, source_height, _ = await receive_image_upload(file, source_path, MAX_FILE_SIZE)
         
-        print(f"  File size: {len(file_content)} bytes ({len(file_content)/1024/1024:.2f}MB)")
-        
-        # **メモリ対策2: 画像読み込みの最適化**
-        try:
-            image_bytes = io.BytesIO(file_content)
-            
-            with Image.open(image_bytes) as image:
-                original_size = image.size
-                
-                # **メモリ対策3: 積極的なサイズ制限**
-                max_dimension = 800  # さらに小さく制限
-                if max(image.width, image.height) > max_dimension:
-                    ratio = max_dimension / max(image.width, image.height)
-                    new_size = (int(image.width * ratio), int(image.height * ratio))
-                    image = image.resize(new_size, Image.Resampling.LANCZOS)
-                    print(f"  Resized from {original_size} to {image.size} for memory safety")
-                
-                # **メモリ対策4: RGB統一（メモリ使用量予測可能）**
-                if image.mode != 'RGB':
-                    image = image.convert('RGB')
-                
-                # **メモリ対策5: 最小限の配列変換**
-                image_array = np.array(image, dtype=np.uint8)
-                
-            # ファイル内容を即座に削除
-            del file_content, image_bytes
-            gc.collect()
-            
-            current_memory = get_memory_usage()
-            print(f"  Memory after image load: {current_memory:.1f}MB")
-            
-        except Exception as e:
-            gc.collect()
-            raise HTTPException(status_code=400, detail=f"Invalid image file: {str(e)}")
-        
-        # **メモリ安全性チェック2: 画像読み込み後**
-        check_memory_safety()
+        source_file_size = os.path.getsize(source_path)
+        logger.debug("  File size: %s bytes (%.2fMB), %sx%s", source_file_size, source_file_size/1024/1024, source_width, source_height)
         
         # **メモリ対策6: パラメータ検証の簡素化**
         valid_methods = ["pattern_subtraction", "frequency_filtering", "adaptive_detection", "fourier_analysis"]
         if extraction_method not in valid_methods:
             extraction_method = "pattern_subtraction"  # 最軽量をデフォルト
         
-        # **メモリ対策: フーリエ解析を小画像のみに制限**
-        if extraction_method == "fourier_analysis" and max(image_array.shape[:2]) > 512:
-            print("  ⚠️ Fourier analysis switched to pattern_subtraction for large images")
-            extraction_method = "pattern_subtraction"
-        
         enhancement_level = max(0.5, min(3.0, enhancement_level))  # 範囲をより制限
         apply_enhancement_bool = apply_enhancement.lower() in ('true', '1', 'yes', 'on')
         
-        print(f"✅ Starting ultra-light processing...")
+        logger.debug("✅ Starting ultra-light processing...")
         
-        # **メモリ対策7: 処理実行前のメモリクリーンアップ**
-        gc.collect()
+        encoder = get_encoder(
+            negotiate_output_format(output_format, request.headers.get("accept"), settings.RESULT_OUTPUT_FORMAT),
+            encoder_tier or settings.REVERSE_ENCODER_TIER
+        )
+        result_filename = f"reversed_{uuid.uuid4().hex[:8]}.{encoder.extension}"  # ファイル名をさらに短縮
+        result_path = get_file_path(result_filename)
         
+        started_at = time.perf_counter()
         try:
-            # **メモリ安全性チェック3: 処理直前**
-            processing_memory = get_memory_usage()
-            print(f"  Memory before processing: {processing_memory:.1f}MB")
-            
-            if processing_memory > MEMORY_WARNING_THRESHOLD:
-                print(f"  ⚠️ Memory warning: {processing_memory:.1f}MB used")
-                # 強制ガベージコレクション
-                for _ in range(3):
-                    gc.collect()
-            
-            # **超軽量処理実行**
-            extracted_image = extract_hidden_image_from_moire(
-                image_array, 
-                method=extraction_method, 
-                enhancement_level=enhancement_level
+            worker_info = await run_in_render_pool(
+                extract_hidden_image_to_file,
+                source_path,
+                extraction_method,
+                enhancement_level,
+                apply_enhancement_bool,
+                enhancement_method,
+                result_path,
+                encoder,
+                memory_estimate=reverse_memory_estimate(source_path, extraction_method)
             )
-            
-            # 入力画像を即座に削除
-            del image_array
-            gc.collect()
-            
-            processing_complete_memory = get_memory_usage()
-            print(f"✅ Extraction completed (Memory: {processing_complete_memory:.1f}MB)")
-            
-            # **メモリ対策8: 強調処理の条件分岐**
-            if apply_enhancement_bool:
-                # メモリ使用量をチェック
-                current_mem = get_memory_usage()
-                if current_mem > MEMORY_WARNING_THRESHOLD:
-                    print("  ⚠️ Skipping enhancement due to memory constraints")
-                    final_image = extracted_image
-                else:
-                    enhanced_image = enhance_extracted_image_optimized(
-                        extracted_image, 
-                        method=enhancement_method
-                    )
-                    del extracted_image  # 元画像を削除
-                    final_image = enhanced_image
-                    print(f"✅ Enhancement applied")
-            else:
-                final_image = extracted_image
-                print(f"✅ No enhancement applied (memory efficient)")
-                
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except HTTPException:
+            raise
         except Exception as processing_error:
-            # 処理エラー時のメモリクリーンアップ
-            if 'image_array' in locals():
-                del image_array
-            if 'extracted_image' in locals():
-                del extracted_image
-            gc.collect()
-            
-            print(f"❌ Processing error: {str(processing_error)}")
+            logger.error("❌ Processing error: %s", processing_error)
             raise HTTPException(
                 status_code=500,
                 detail=f"Ultra-light processing failed: {str(processing_error)}"
             )
+        finally:
+            os.remove(source_path)
         
-        # **メモリ対策9: 結果保存の最適化**
-        try:
-            result_filename = f"reversed_{uuid.uuid4().hex[:8]}.png"  # ファイル名をさらに短縮
-            result_path = get_file_path(result_filename)
-            
-            # PIL変換（メモリ効率重視）
-            if len(final_image.shape) == 3:
-                result_pil = Image.fromarray(final_image, 'RGB')
-            else:
-                result_pil = Image.fromarray(final_image, 'L')
-            
-            # 最終画像を削除
-            del final_image
-            gc.collect()
-            
-            # PNG保存（軽量設定）
-            result_pil.save(
-                result_path, 
-                "PNG", 
-                optimize=False,  # 高速化優先
-                compress_level=1  # 最低圧縮（高速）
-            )
-            
-            result_file_size = os.path.getsize(result_path)
-            final_memory = get_memory_usage()
-            
-            print(f"✅ Result saved: {result_filename} ({result_file_size} bytes)")
-            print(f"  Final memory usage: {final_memory:.1f}MB")
-            
-        except Exception as save_error:
-            # 保存エラー時のクリーンアップ
-            if 'final_image' in locals():
-                del final_image
-            if 'result_pil' in locals():
-                del result_pil
-            gc.collect()
-            
-            print(f"❌ Save error: {str(save_error)}")
-            raise HTTPException(
-                status_code=500,
-                detail=f"Failed to save result: {str(save_error)}"
-            )
+        result_file_size = os.path.getsize(result_path)
+        final_memory = get_memory_usage()
+        extraction_method = worker_info["extraction_method"]
+        REVERSE_LATENCY.observe(time.perf_counter() - started_at, extraction_method)
+        original_size = worker_info["original_size"]
+        result_size = worker_info["result_size"]
         
-        # **メモリ対策10: 最終クリーンアップ**
-        if 'result_pil' in locals():
-            del result_pil
-        gc.collect()
+        logger.info("✅ Result saved: %s (%s bytes)", result_filename, result_file_size)
+        logger.debug("  Final memory usage: %.1fMB", final_memory)
+        
+        # 生成物インデックスに登録（期限切れの削除は定期スイーパーが行う）
+        get_artifact_index().record(result_filename, result_file_size)
         
         # バックグラウンドタスク
-        background_tasks.add_task(delete_old_files, settings.TEMP_FILE_EXPIRY)
         background_tasks.add_task(gc.collect)
         
         # **メモリ効率的なレスポンス**
@@ -249,11 +243,13 @@ async def reverse_moire_image_ultra_light(
                 "extraction_method": extraction_method,
                 "enhancement_level": enhancement_level,
                 "enhancement_method": enhancement_method if apply_enhancement_bool else "none",
-                "original_size": f"{original_size[0]}x{original_size[1]}" if 'original_size' in locals() else "unknown",
-                "result_size": f"{result_pil.width}x{result_pil.height}" if 'result_pil' in locals() else "unknown",
+                "original_size": f"{original_size[0]}x{original_size[1]}",
+                "result_size": f"{result_size[0]}x{result_size[1]}",
+                "encoding": worker_info["encoding"],
                 "memory_optimization": {
                     "initial_memory_mb": f"{initial_memory:.1f}",
                     "final_memory_mb": f"{final_memory:.1f}",
+                    "worker_memory_mb": f"{worker_info['worker_memory_mb']:.1f}",
                     "memory_saved_mb": f"{memory_saved:.1f}",
                     "max_file_size_mb": MAX_FILE_SIZE / 1024 / 1024,
                     "ultra_lightweight": True,
@@ -262,7 +258,7 @@ async def reverse_moire_image_ultra_light(
             }
         }
         
-        print(f"📤 Ultra-light processing response sent")
+        logger.debug("📤 Ultra-light processing response sent")
         return response_data
         
     except HTTPException:
@@ -272,9 +268,7 @@ async def reverse_moire_image_ultra_light(
     except Exception as e:
         # 予期しないエラー時の完全クリーンアップ
         gc.collect()
-        print(f"❌ Unexpected error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Unexpected error: %s", e)
         
         raise HTTPException(
             status_code=500, 
@@ -350,6 +344,7 @@ async def get_reverse_methods_ultra_light():
 async def get_performance_stats_ultra_light():
     """パフォーマンス統計を取得（512MB制限対応版）"""
     current_memory = get_memory_usage()
+    memory_stats = get_render_pool().memory_budget.stats()
     
     return {
         "current_memory_usage": f"{current_memory:.1f} MB",
@@ -367,8 +362,8 @@ async def get_performance_stats_ultra_light():
         "performance_limits": {
             "max_image_dimension": "800px",
             "max_file_size": "3MB", 
-            "memory_warning_threshold": f"{MEMORY_WARNING_THRESHOLD}MB",
-            "memory_critical_threshold": f"{MEMORY_CRITICAL_THRESHOLD}MB"
+            "memory_budget_mb": round(memory_stats["budget_bytes"] / 1024 / 1024, 1),
+            "memory_reserved_mb": round(memory_stats["reserved_bytes"] / 1024 / 1024, 1)
         },
         "recommendations": {
             "best_method": "pattern_subtraction",
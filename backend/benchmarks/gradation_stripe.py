@@ -0,0 +1,127 @@
+"""
+グラデーション縞のベンチマーク - ベクトル化版と画素単位ループ（ベクトル化前の実装）を比較する
+ループ版は小さい領域で計測して画素あたりの時間から全体の時間を推定し、
+同じ領域で両者の出力差（最大 LSB）を確認して JSON で出力する
+
+使い方（backend ディレクトリで実行）:
+    python -m benchmarks.gradation_stripe --output gradation_stripe.json
+    python -m benchmarks.gradation_stripe --size 2430x3240 --iterations 5
+出力差が許容値（1 LSB）を超えた場合は終了コード 1 を返す
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import time
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from patterns.base import create_gradation_stripe_base
+from tests.make_pattern_reference import PATTERN_TYPES, reference_gradation_stripe_loop
+from utils.logger import ROOT_LOGGER_NAME
+
+DEFAULT_SIZE = (1000, 1000)
+DEFAULT_REFERENCE_SIZE = (200, 200)
+DEFAULT_SEED = 0
+MAX_DIFF_LSB = 1
+
+
+def run_benchmark(size: Tuple[int, int], reference_size: Tuple[int, int], iterations: int,
+                  seed: int = DEFAULT_SEED) -> Dict[str, Any]:
+    """縞の向きごとに計測してレポート（JSON化可能な辞書）を返す"""
+    width, height = size
+    print(f"🏃 Starting gradation stripe benchmark: {width}x{height} × {iterations} iterations", file=sys.stderr)
+
+    rng = np.random.default_rng(seed)
+    test_image = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    reference_image = np.ascontiguousarray(test_image[:reference_size[1], :reference_size[0]])
+
+    results = {}
+    for pattern_type in PATTERN_TYPES:
+        times = []
+        for _ in range(iterations):
+            start_time = time.perf_counter()
+            result = create_gradation_stripe_base(test_image, pattern_type)
+            times.append(time.perf_counter() - start_time)
+            del result
+
+        start_time = time.perf_counter()
+        reference = reference_gradation_stripe_loop(reference_image, pattern_type)
+        reference_time = time.perf_counter() - start_time
+
+        vectorized = create_gradation_stripe_base(reference_image, pattern_type)
+        max_diff = int(np.abs(vectorized.astype(np.int16) - reference.astype(np.int16)).max())
+
+        loop_estimate = reference_time * test_image.shape[0] * test_image.shape[1] / reference.shape[0] / reference.shape[1]
+        vectorized_time = float(np.min(times))
+
+        results[pattern_type] = {
+            "vectorized_avg_s": float(np.mean(times)),
+            "vectorized_min_s": vectorized_time,
+            "loop_estimated_s": loop_estimate,
+            "speedup": round(loop_estimate / max(vectorized_time, 1e-9), 1),
+            "max_diff_lsb": max_diff
+        }
+        print(f"  {pattern_type}: {vectorized_time:.4f}s vs ~{loop_estimate:.2f}s (loop), "
+              f"max diff {max_diff} LSB", file=sys.stderr)
+
+    print("🏁 Gradation stripe benchmark completed", file=sys.stderr)
+    return {
+        "meta": {
+            "created_at": int(time.time()),
+            "size": [width, height],
+            "reference_size": list(reference_size),
+            "seed": seed,
+            "iterations": iterations,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "cpu_count": os.cpu_count(),
+            "machine": platform.machine()
+        },
+        "pattern_types": results
+    }
+
+
+def _parse_size(value: str) -> Tuple[int, int]:
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the vectorized gradation stripe against the pixel loop")
+    parser.add_argument("--size", type=_parse_size, default=DEFAULT_SIZE, help="Input image size WxH")
+    parser.add_argument("--reference-size", type=_parse_size, default=DEFAULT_REFERENCE_SIZE,
+                        help="Region WxH timed with the pixel loop (extrapolated to --size)")
+    parser.add_argument("--iterations", type=int, default=3, help="Measured runs of the vectorized version")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Random input seed")
+    parser.add_argument("--output", help="Write the JSON report to this file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    # 処理ごとの INFO ログは計測結果の出力と混ざるため抑制
+    logging.getLogger(ROOT_LOGGER_NAME).setLevel(logging.WARNING)
+
+    report = run_benchmark(args.size, args.reference_size, args.iterations, args.seed)
+
+    exit_code = 0
+    mismatches = [name for name, stats in report["pattern_types"].items() if stats["max_diff_lsb"] > MAX_DIFF_LSB]
+    if mismatches:
+        exit_code = 1
+        print(f"❌ Output differs from the pixel loop by more than {MAX_DIFF_LSB} LSB: {', '.join(mismatches)}",
+              file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
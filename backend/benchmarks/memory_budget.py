@@ -0,0 +1,429 @@
+"""
+メモリ予算の検証 - 最悪ケースの入力で処理全体を実行し、512MB に収まるかを確認する
+合成・抽出の各パイプラインを1シナリオずつ新しいプロセスで実行し、RLIMIT_AS でアドレス空間を制限した上で
+フェーズごとのピーク（RSS・tracemalloc・NumPy 配列）を計測して、どのフェーズがピークを決めているかを出力する
+
+アドレス空間の上限は既定で「読み込み直後の仮想サイズ + (予算 - 読み込み直後の RSS)」とし、
+RSS が予算に達する分だけの増加を許可する（共有ライブラリの予約領域で予算を使い切らないようにするため）
+
+使い方（backend ディレクトリで実行）:
+    python -m benchmarks.memory_budget --output memory_budget.json
+    python -m benchmarks.memory_budget --address-space-mb 0 --pipelines reverse
+予算超過・メモリ不足のシナリオがある場合は終了コード 1 を返す
+"""
+import argparse
+import contextlib
+import gc
+import itertools
+import json
+import logging
+import math
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from benchmarks.render_pipeline import create_synthetic_photo, STRIPE_METHODS, SHAPE_TYPES
+
+DEFAULT_BUDGET_MB = 512
+DEFAULT_SEED = 20240601
+
+# 合成は負荷の高い縞模様メソッドと最も複雑な形状（arabesque）を全面領域で実行
+FORWARD_STRIPE_METHODS = ("overlay", "adaptive", "hybrid_overlay", "color_preserving", "gradation")
+FORWARD_SHAPE_TYPES = ("arabesque",)
+EXTRACTION_METHODS = ("fourier_analysis", "pattern_subtraction", "frequency_filtering", "adaptive_detection")
+
+# フーリエ解析が縮小なしで実行される最大の長辺（これを超えると pattern_subtraction に切り替わる）
+FOURIER_MAX_DIMENSION = 512
+
+
+class PhaseMemoryRecorder:
+    """
+    フェーズ開始の通知（progress_callback）ごとに直前のフェーズのピークを記録する
+    - rss_peak_bytes: VmHWM をフェーズ開始時にリセットした区間内の RSS 最大値（OpenCV・PIL の確保も含む）
+    - traced_peak_bytes: tracemalloc の区間内の最大値（Python オブジェクト + NumPy 配列）
+    - numpy_peak_bytes: traced_peak_bytes からフェーズ開始時の NumPy 以外の確保量を引いた推定値
+    - numpy_live_bytes: フェーズ終了時に残っている NumPy 配列の合計
+    """
+
+    def __init__(self, trace: bool):
+        self.trace = trace
+        self.phases: Dict[str, Dict[str, int]] = {}
+        self.current: Optional[str] = None
+        self._other_traced_at_start = 0
+
+    def _traced_by_domain(self) -> Tuple[int, int]:
+        """(NumPy 配列の確保量, それ以外の確保量)"""
+        snapshot = tracemalloc.take_snapshot()
+        numpy_bytes = sum(trace.size for trace in snapshot.traces if trace.domain == np.lib.tracemalloc_domain)
+        other_bytes = sum(trace.size for trace in snapshot.traces if trace.domain != np.lib.tracemalloc_domain)
+        return numpy_bytes, other_bytes
+
+    def begin(self, phase: str):
+        from utils.metrics import reset_peak_rss
+
+        self.finish()
+        self.current = phase
+        if self.trace:
+            _, self._other_traced_at_start = self._traced_by_domain()
+            tracemalloc.reset_peak()
+        reset_peak_rss()
+
+    def __call__(self, phase_index: int, phase: str):
+        self.begin(phase)
+
+    def finish(self):
+        from utils.metrics import peak_rss_bytes, process_memory_snapshot
+
+        if self.current is None:
+            return
+        stats = {"rss_peak_bytes": peak_rss_bytes() or process_memory_snapshot()["peak_rss"]}
+        if self.trace:
+            _, traced_peak = tracemalloc.get_traced_memory()
+            numpy_live, _ = self._traced_by_domain()
+            stats.update({
+                "traced_peak_bytes": traced_peak,
+                "numpy_peak_bytes": max(0, traced_peak - self._other_traced_at_start),
+                "numpy_live_bytes": numpy_live
+            })
+        self.phases[self.current] = stats
+        self.current = None
+
+
+def _vm_size_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/status", "r") as status_file:
+            for line in status_file:
+                if line.startswith("VmSize:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def _is_memory_error(error: Optional[BaseException]) -> bool:
+    """
+    MemoryError と、OpenCV の確保失敗（cv2.error: Insufficient memory / Failed to allocate）
+    別の例外に包まれている場合（読み込み失敗の ValueError など）も原因をたどって判定する
+    """
+    while error is not None:
+        if isinstance(error, MemoryError):
+            return True
+        message = str(error).lower()
+        if isinstance(error, cv2.error) and ("memory" in message or "allocate" in message):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def run_scenario(scenario: Dict[str, Any], budget_bytes: int, address_space_bytes: Optional[int],
+                 trace: bool, work_dir: str) -> Dict[str, Any]:
+    """
+    シナリオを1件実行してフェーズごとのピークを返す（新しいプロセスで呼び出す）
+    アドレス空間の制限はモジュール読み込み後に設定する（ワーカーの起動時と同じ状態から計測するため）
+    address_space_bytes: None は予算から自動計算、0 は制限なし
+    """
+    import resource
+
+    with contextlib.redirect_stdout(sys.stderr):
+        from config.app import get_settings
+        from utils.logger import ROOT_LOGGER_NAME
+        from utils.metrics import process_memory_snapshot
+        from utils.encoders import get_encoder
+        from utils.file_handler import get_file_path
+        from utils.optimized_processor import process_hidden_image_optimized
+        from api.routes.reverse import extract_hidden_image_to_file
+
+        logging.getLogger(ROOT_LOGGER_NAME).setLevel(logging.WARNING)
+        settings = get_settings()
+        gc.collect()
+        baseline = process_memory_snapshot()
+        vm_size = _vm_size_bytes()
+        if address_space_bytes is None and vm_size is not None:
+            address_space_bytes = vm_size + max(0, budget_bytes - baseline["rss"])
+        report = {
+            "baseline_rss_bytes": baseline["rss"],
+            "baseline_vm_size_bytes": vm_size,
+            "address_space_limit_bytes": address_space_bytes or None
+        }
+        if address_space_bytes:
+            _, hard_limit = resource.getrlimit(resource.RLIMIT_AS)
+            resource.setrlimit(resource.RLIMIT_AS, (address_space_bytes, hard_limit))
+        if trace:
+            tracemalloc.start()
+
+        recorder = PhaseMemoryRecorder(trace)
+        recorder.begin("setup")
+        started_at = time.perf_counter()
+        status, error = "ok", None
+        try:
+            if scenario["pipeline"] == "forward":
+                result = process_hidden_image_optimized(
+                    scenario["input_path"], tuple(scenario["region"]), "horizontal",
+                    scenario["stripe_method"], "contain",
+                    shape_type=scenario["shape_type"],
+                    progress_callback=recorder,
+                    result_in_memory=settings.RESULT_STORE_MAX_BYTES > 0
+                )
+                if "result_data" not in result:
+                    os.remove(get_file_path(result["result"]))
+            else:
+                result = extract_hidden_image_to_file(
+                    scenario["input_path"], scenario["extraction_method"], 1.5, True, "histogram_equalization",
+                    os.path.join(work_dir, f"reversed_{os.getpid()}.png"),
+                    get_encoder("png", settings.REVERSE_ENCODER_TIER),
+                    progress_callback=recorder
+                )
+                report["effective_extraction_method"] = result["extraction_method"]
+            del result
+        except BaseException as e:
+            status = "out_of_memory" if _is_memory_error(e) else "error"
+            error = f"{type(e).__name__}: {e}"
+        finally:
+            failed_phase = recorder.current
+            recorder.finish()
+            if trace:
+                tracemalloc.stop()
+
+    phases = recorder.phases
+    report.update({
+        "status": status,
+        "error": error,
+        "failed_phase": failed_phase if status != "ok" else None,
+        "elapsed_s": round(time.perf_counter() - started_at, 3),
+        "phases": phases,
+        "peak_rss_bytes": max(stats["rss_peak_bytes"] for stats in phases.values()),
+        "peak_phase": max(phases, key=lambda phase: phases[phase]["rss_peak_bytes"])
+    })
+    if trace:
+        report["numpy_peak_phase"] = max(phases, key=lambda phase: phases[phase]["numpy_peak_bytes"])
+    return report
+
+
+def _save_within_limit(image: Image.Image, path: str, max_bytes: int, image_format: str,
+                       qualities: Sequence[int] = (95, 90, 85, 80, 70, 60, 50)) -> int:
+    """上限以下になる最高画質で保存してファイルサイズを返す（PNG は1回のみ）"""
+    if image_format == "PNG":
+        image.save(path, "PNG", compress_level=6)
+        return os.path.getsize(path)
+    for quality in qualities:
+        image.save(path, "JPEG", quality=quality)
+        if os.path.getsize(path) <= max_bytes:
+            break
+    return os.path.getsize(path)
+
+
+def build_inputs(work_dir: str, seed: int) -> Dict[str, Dict[str, Any]]:
+    """
+    最悪ケースの入力画像を作成
+    - photo_10mb: アップロード上限（MAX_UPLOAD_SIZE）に近いノイズの多い写真
+    - photo_reverse_max: 抽出のアップロード上限（MAX_FILE_SIZE）に近い写真
+    - max_pixels_rgba: ピクセル数上限（MAX_IMAGE_PIXELS）ちょうどの RGBA PNG（圧縮しやすい内容で容量は小さい）
+    - fourier_max: フーリエ解析が縮小されずに実行される最大サイズ
+    """
+    from config.app import get_settings
+    from api.routes.reverse import MAX_FILE_SIZE
+
+    settings = get_settings()
+    inputs = {}
+
+    def add(name: str, array: np.ndarray, image_format: str, max_bytes: int):
+        path = os.path.join(work_dir, f"{name}.{'png' if image_format == 'PNG' else 'jpg'}")
+        with Image.fromarray(array) as image:
+            file_bytes = _save_within_limit(image, path, max_bytes, image_format)
+        inputs[name] = {
+            "path": path,
+            "size": [array.shape[1], array.shape[0]],
+            "mode": "RGBA" if array.shape[2] == 4 else "RGB",
+            "file_bytes": file_bytes,
+            "upload_limit_bytes": max_bytes,
+            "within_upload_limit": file_bytes <= max_bytes
+        }
+
+    # ノイズを強めて容量を上限に近づける（ピクセル数上限を超えない範囲）
+    photo = create_synthetic_photo((6000, 4500), seed)
+    photo = np.clip(photo + np.random.default_rng(seed).normal(0, 10, photo.shape), 0, 255).astype(np.uint8)
+    add("photo_10mb", photo, "JPEG", settings.MAX_UPLOAD_SIZE)
+    add("photo_reverse_max", cv2.resize(photo, (4032, 3024), interpolation=cv2.INTER_AREA), "JPEG", MAX_FILE_SIZE)
+    del photo
+
+    # 4:3 でピクセル数上限に収まる最大サイズ（縮小画像を最近傍補間で拡大し、容量を抑える）
+    width = int(math.sqrt(settings.MAX_IMAGE_PIXELS * 4 / 3))
+    height = settings.MAX_IMAGE_PIXELS // width
+    small = create_synthetic_photo((width // 8, height // 8), seed + 1)
+    large = cv2.resize(small, (width, height), interpolation=cv2.INTER_NEAREST)
+    rgba = np.dstack([large, np.full(large.shape[:2], 255, dtype=np.uint8)])
+    del large
+    add("max_pixels_rgba", rgba, "PNG", min(settings.MAX_UPLOAD_SIZE, MAX_FILE_SIZE))
+    del rgba
+
+    fourier_size = (FOURIER_MAX_DIMENSION, FOURIER_MAX_DIMENSION * 3 // 4)
+    add("fourier_max", create_synthetic_photo(fourier_size, seed + 2), "JPEG", MAX_FILE_SIZE)
+    return inputs
+
+
+def build_scenarios(inputs: Dict[str, Dict[str, Any]], pipelines: Sequence[str], stripe_methods: Sequence[str],
+                    shape_types: Sequence[str], extraction_methods: Sequence[str]) -> List[Dict[str, Any]]:
+    scenarios = []
+    if "forward" in pipelines:
+        # 全面領域（元画像全体を隠し画像として使う）
+        for input_name, stripe_method, shape_type in itertools.product(
+                ("photo_10mb", "max_pixels_rgba"), stripe_methods, shape_types):
+            width, height = inputs[input_name]["size"]
+            scenarios.append({
+                "name": f"forward/{input_name}/{stripe_method}/{shape_type}/full_region",
+                "pipeline": "forward",
+                "input": input_name,
+                "input_path": inputs[input_name]["path"],
+                "stripe_method": stripe_method,
+                "shape_type": shape_type,
+                "region": [0, 0, width, height]
+            })
+    if "reverse" in pipelines:
+        for input_name, extraction_method in itertools.product(
+                ("photo_reverse_max", "max_pixels_rgba", "fourier_max"), extraction_methods):
+            scenarios.append({
+                "name": f"reverse/{input_name}/{extraction_method}",
+                "pipeline": "reverse",
+                "input": input_name,
+                "input_path": inputs[input_name]["path"],
+                "extraction_method": extraction_method
+            })
+    return scenarios
+
+
+def run_isolated(scenario: Dict[str, Any], budget_bytes: int, address_space_bytes: Optional[int],
+                 trace: bool, work_dir: str) -> Dict[str, Any]:
+    """シナリオを新しいプロセスで実行（プロセスが異常終了した場合は crashed として記録）"""
+    context = multiprocessing.get_context("spawn")
+    try:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            return executor.submit(
+                run_scenario, scenario, budget_bytes, address_space_bytes, trace, work_dir
+            ).result()
+    except BrokenProcessPool as e:
+        return {"status": "crashed", "error": str(e) or "Worker process terminated abruptly", "phases": {}}
+
+
+def _mb(value: Optional[int]) -> str:
+    return f"{value / 1024 / 1024:.1f}MB" if value is not None else "-"
+
+
+def _describe_limit(address_space_bytes: Optional[int]) -> str:
+    if address_space_bytes is None:
+        return "auto"
+    return _mb(address_space_bytes) if address_space_bytes else "unlimited"
+
+
+def run_memory_budget(scenarios: List[Dict[str, Any]], inputs: Dict[str, Dict[str, Any]], budget_bytes: int,
+                      address_space_bytes: Optional[int], trace: bool, work_dir: str) -> Dict[str, Any]:
+    print(f"🧪 Starting memory budget check: {len(scenarios)} scenarios, budget {_mb(budget_bytes)}, "
+          f"RLIMIT_AS {_describe_limit(address_space_bytes)}", file=sys.stderr)
+
+    results = {}
+    for index, scenario in enumerate(scenarios, 1):
+        result = run_isolated(scenario, budget_bytes, address_space_bytes, trace, work_dir)
+        if result["status"] == "ok" and result["peak_rss_bytes"] > budget_bytes:
+            result["status"] = "over_budget"
+        results[scenario["name"]] = {
+            key: value for key, value in scenario.items() if key not in ("name", "input_path")
+        }
+        results[scenario["name"]].update(result)
+
+        status_icon = "✅" if result["status"] == "ok" else "❌"
+        print(f"  {status_icon} [{index}/{len(scenarios)}] {scenario['name']}: {result['status']}, "
+              f"peak {_mb(result.get('peak_rss_bytes'))} in {result.get('peak_phase') or result.get('failed_phase')}",
+              file=sys.stderr)
+        if result.get("error"):
+            print(f"     {result['error']}", file=sys.stderr)
+
+    completed = [(name, result) for name, result in results.items() if result.get("phases")]
+    worst = max(completed, key=lambda item: item[1]["peak_rss_bytes"], default=None)
+    failures = [name for name, result in results.items() if result["status"] != "ok"]
+    print(f"🏁 Memory budget check completed: {len(failures)} failure(s)", file=sys.stderr)
+    return {
+        "meta": {
+            "created_at": int(time.time()),
+            "budget_bytes": budget_bytes,
+            "address_space_limit": _describe_limit(address_space_bytes),
+            "tracemalloc": trace,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "machine": platform.machine()
+        },
+        "inputs": {name: {key: value for key, value in info.items() if key != "path"} for name, info in inputs.items()},
+        "scenarios": results,
+        "summary": {
+            "worst_scenario": worst[0] if worst else None,
+            "worst_phase": worst[1]["peak_phase"] if worst else None,
+            "worst_peak_rss_bytes": worst[1]["peak_rss_bytes"] if worst else None,
+            "failures": failures
+        }
+    }
+
+
+def _parse_list(value: Optional[str], allowed: Sequence[str], default: Sequence[str], name: str,
+                parser: argparse.ArgumentParser) -> Tuple[str, ...]:
+    if value is None:
+        return tuple(default)
+    items = tuple(item.strip() for item in value.split(",") if item.strip())
+    unknown = [item for item in items if item not in allowed]
+    if unknown:
+        parser.error(f"Unknown {name}: {', '.join(unknown)} (choose from {', '.join(allowed)})")
+    return items
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Check the forward and reverse pipelines against a memory budget")
+    parser.add_argument("--budget-mb", type=float, default=DEFAULT_BUDGET_MB,
+                        help="Peak RSS budget per worker process")
+    parser.add_argument("--address-space-mb", type=float, default=None,
+                        help="Absolute RLIMIT_AS applied after imports "
+                             "(default: post-import VmSize plus the RSS headroom left in the budget, 0 disables)")
+    parser.add_argument("--pipelines", help="Comma-separated pipelines: forward, reverse")
+    parser.add_argument("--stripe-methods", help="Comma-separated stripe methods for the forward pipeline")
+    parser.add_argument("--shape-types", help="Comma-separated shape types for the forward pipeline")
+    parser.add_argument("--extraction-methods", help="Comma-separated extraction methods for the reverse pipeline")
+    parser.add_argument("--no-tracemalloc", action="store_true",
+                        help="Measure RSS only (tracemalloc adds its own bookkeeping to the RSS)")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Synthetic input seed")
+    parser.add_argument("--output", help="Write the JSON report to this file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    pipelines = _parse_list(args.pipelines, ("forward", "reverse"), ("forward", "reverse"), "pipeline", parser)
+    stripe_methods = _parse_list(args.stripe_methods, STRIPE_METHODS, FORWARD_STRIPE_METHODS, "stripe method", parser)
+    shape_types = _parse_list(args.shape_types, SHAPE_TYPES, FORWARD_SHAPE_TYPES, "shape type", parser)
+    extraction_methods = _parse_list(args.extraction_methods, EXTRACTION_METHODS, EXTRACTION_METHODS,
+                                     "extraction method", parser)
+    budget_bytes = int(args.budget_mb * 1024 * 1024)
+    address_space_bytes = None if args.address_space_mb is None else int(args.address_space_mb * 1024 * 1024)
+
+    with tempfile.TemporaryDirectory(prefix="pozt_memory_") as work_dir:
+        print("🖼️ Creating worst-case inputs...", file=sys.stderr)
+        inputs = build_inputs(work_dir, args.seed)
+        scenarios = build_scenarios(inputs, pipelines, stripe_methods, shape_types, extraction_methods)
+        report = run_memory_budget(scenarios, inputs, budget_bytes, address_space_bytes,
+                                   not args.no_tracemalloc, work_dir)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 1 if report["summary"]["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,399 @@
+"""
+レンダリングパイプラインのベンチマーク - 本番サイズ（2430×3240）で処理全体を計測する
+縞模様メソッド × 形状 × リサイズ方法 × 領域サイズ × 写真の質感の組み合わせごとに、
+フェーズ別の中央値・p95 とピークメモリを JSON で出力し、保存済みのベースラインと比較する
+
+使い方（backend ディレクトリで実行）:
+    python -m benchmarks.render_pipeline --profile quick --save-baseline benchmarks/baseline.json
+    python -m benchmarks.render_pipeline --profile quick --baseline benchmarks/baseline.json
+    python -m benchmarks.render_pipeline --profile dense_edges --iterations 3
+回帰を検出した場合は終了コード 1 を返す
+"""
+import argparse
+import gc
+import itertools
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from config.app import get_settings
+from config.settings import TARGET_WIDTH, TARGET_HEIGHT
+from core.shape_masks import clear_shape_cache
+from utils.file_handler import get_file_path
+from utils.image_cache import clear_image_caches
+from utils.logger import ROOT_LOGGER_NAME
+from utils.metrics import peak_rss_bytes, process_memory_snapshot, reset_peak_rss
+from utils.optimized_processor import process_hidden_image_optimized
+
+STRIPE_METHODS = (
+    "overlay", "high_frequency", "moire_pattern", "adaptive",
+    "adaptive_subtle", "adaptive_strong", "adaptive_minimal",
+    "perfect_subtle", "ultra_subtle", "near_perfect",
+    "color_preserving", "hue_preserving", "blended", "hybrid_overlay",
+    "gradation"
+)
+SHAPE_TYPES = ("rectangle", "circle", "star", "heart", "hexagon", "japanese", "arabesque")
+RESIZE_METHODS = ("contain", "cover", "stretch")
+# 領域サイズ（元画像の幅・高さに対する比率、中央に配置）
+REGION_SIZES = {"small": 0.25, "medium": 0.5, "large": 0.8}
+# 写真の質感（センサーノイズの標準偏差）
+# noisy は高感度撮影のような粗い写真で、Canny エッジが全画素の 3 割前後になる（疎なエッジ前提の処理の確認用）
+PHOTO_TEXTURES = {"photo": 4.0, "noisy": 12.0}
+DEFAULT_TEXTURE = "photo"
+
+# quick は代表的な組み合わせのみ（CI・変更前後の比較用）、full は全組み合わせ
+PROFILES = {
+    "quick": {
+        "stripe_methods": ("overlay", "adaptive", "hybrid_overlay", "gradation"),
+        "shape_types": ("rectangle", "star", "japanese"),
+        "resize_methods": ("contain", "cover"),
+        "region_sizes": ("small", "large"),
+        "textures": (DEFAULT_TEXTURE,)
+    },
+    # 密なエッジでのテーブル参照（エッジ入力を持つ縞の生成方法のみ、通常の写真と比較）
+    "dense_edges": {
+        "stripe_methods": ("high_frequency", "moire_pattern", "adaptive", "perfect_subtle"),
+        "shape_types": ("rectangle",),
+        "resize_methods": ("contain",),
+        "region_sizes": ("large",),
+        "textures": tuple(PHOTO_TEXTURES)
+    },
+    "full": {
+        "stripe_methods": STRIPE_METHODS,
+        "shape_types": SHAPE_TYPES,
+        "resize_methods": RESIZE_METHODS,
+        "region_sizes": tuple(REGION_SIZES),
+        "textures": tuple(PHOTO_TEXTURES)
+    }
+}
+
+# 合成写真（横長にして contain / cover / stretch で結果が変わるようにする）
+DEFAULT_PHOTO_SIZE = (4032, 3024)
+DEFAULT_SEED = 20240601
+
+# 回帰判定の既定値（相対値と、計測誤差として無視する絶対値）
+DEFAULT_MAX_TIME_REGRESSION = 0.15
+DEFAULT_MIN_TIME_DELTA_MS = 5.0
+DEFAULT_MAX_MEMORY_REGRESSION = 0.10
+DEFAULT_MIN_MEMORY_DELTA_MB = 8.0
+
+
+def create_synthetic_photo(size: Tuple[int, int], seed: int = DEFAULT_SEED,
+                           noise_sigma: float = PHOTO_TEXTURES[DEFAULT_TEXTURE]) -> np.ndarray:
+    """
+    写真に近い統計を持つ決定的な合成画像（RGB）
+    低周波の色むら・空のようなグラデーション・輪郭のある図形・センサーノイズを重ねる
+    """
+    width, height = size
+    rng = np.random.default_rng(seed)
+
+    # 低周波の色むら（粗いグリッドを補間して拡大）
+    coarse = rng.uniform(40, 215, (9, 12, 3)).astype(np.float32)
+    photo = cv2.resize(coarse, (width, height), interpolation=cv2.INTER_CUBIC)
+
+    # 上から下への明るさのグラデーション
+    photo *= np.linspace(1.15, 0.8, height, dtype=np.float32)[:, None, None]
+
+    # 輪郭のある被写体（円と矩形）
+    for _ in range(24):
+        color = tuple(float(c) for c in rng.uniform(0, 255, 3))
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        if rng.random() < 0.5:
+            cv2.circle(photo, center, int(rng.integers(height // 40, height // 8)), color, -1, cv2.LINE_AA)
+        else:
+            corner = (center[0] + int(rng.integers(width // 30, width // 6)),
+                      center[1] + int(rng.integers(height // 30, height // 6)))
+            cv2.rectangle(photo, center, corner, color, -1, cv2.LINE_AA)
+    photo = cv2.GaussianBlur(photo, (0, 0), 1.5)
+
+    # センサーノイズ
+    photo += rng.normal(0, noise_sigma, photo.shape).astype(np.float32)
+    return np.clip(photo, 0, 255).astype(np.uint8)
+
+
+def region_for(photo_size: Tuple[int, int], region_size: str) -> Tuple[int, int, int, int]:
+    """元画像座標で中央に配置した領域 (x, y, width, height)"""
+    width, height = photo_size
+    ratio = REGION_SIZES[region_size]
+    region_width, region_height = int(width * ratio), int(height * ratio)
+    return (width - region_width) // 2, (height - region_height) // 2, region_width, region_height
+
+
+def summarize(values: Sequence[float]) -> Dict[str, float]:
+    """中央値・p95・最小値（ミリ秒）"""
+    array = np.asarray(values, dtype=np.float64)
+    return {
+        "median_ms": round(float(np.median(array)), 3),
+        "p95_ms": round(float(np.percentile(array, 95)), 3),
+        "min_ms": round(float(array.min()), 3)
+    }
+
+
+def run_case(photo_path: str, photo_size: Tuple[int, int], stripe_method: str, shape_type: str,
+             resize_method: str, region_size: str, iterations: int, warmup: int, cold: bool) -> Dict[str, Any]:
+    """
+    1つの組み合わせを計測
+    cold=True の場合は毎回キャッシュを破棄し、アップロード直後の初回処理として計測する
+    """
+    settings = get_settings()
+    region = region_for(photo_size, region_size)
+    phase_samples: Dict[str, List[float]] = {}
+    peak_rss = 0
+    peak_delta = 0
+    peak_scope = "case"
+
+    for iteration in range(warmup + iterations):
+        if cold:
+            clear_image_caches()
+            clear_shape_cache()
+        gc.collect()
+        if not reset_peak_rss():
+            peak_scope = "process"
+        rss_before = process_memory_snapshot()["rss"]
+
+        result = process_hidden_image_optimized(
+            photo_path, region, "horizontal", stripe_method, resize_method,
+            shape_type=shape_type,
+            result_in_memory=settings.RESULT_STORE_MAX_BYTES > 0
+        )
+
+        peak = peak_rss_bytes() or process_memory_snapshot()["peak_rss"]
+        if "result_data" not in result:
+            os.remove(get_file_path(result["result"]))
+        timings = result["processing_info"]["timings"]
+        del result
+
+        if iteration < warmup:
+            continue
+        for phase, duration_ms in timings.items():
+            phase_samples.setdefault(phase, []).append(duration_ms)
+        peak_rss = max(peak_rss, peak)
+        peak_delta = max(peak_delta, peak - rss_before)
+
+    return {
+        "stripe_method": stripe_method,
+        "shape_type": shape_type,
+        "resize_method": resize_method,
+        "region_size": region_size,
+        "region": list(region),
+        "phases": {phase: summarize(values) for phase, values in phase_samples.items()},
+        "peak_rss_bytes": peak_rss,
+        "peak_rss_delta_bytes": peak_delta,
+        "peak_rss_scope": peak_scope
+    }
+
+
+def case_key(stripe_method: str, shape_type: str, resize_method: str, region_size: str,
+             texture: str = DEFAULT_TEXTURE) -> str:
+    """通常の写真のキーは質感を付けない（質感を追加する前のベースラインと比較できるように）"""
+    key = f"{stripe_method}/{shape_type}/{resize_method}/{region_size}"
+    return key if texture == DEFAULT_TEXTURE else f"{key}/{texture}"
+
+
+def run_benchmark(matrix: Dict[str, Sequence[str]], photo_size: Tuple[int, int] = DEFAULT_PHOTO_SIZE,
+                  iterations: int = 5, warmup: int = 1, cold: bool = True,
+                  seed: int = DEFAULT_SEED) -> Dict[str, Any]:
+    """組み合わせ全体を計測してレポート（JSON化可能な辞書）を返す"""
+    textures = matrix.get("textures", (DEFAULT_TEXTURE,))
+    cases = list(itertools.product(
+        textures, matrix["stripe_methods"], matrix["shape_types"], matrix["resize_methods"], matrix["region_sizes"]
+    ))
+    print(f"🏃 Starting render pipeline benchmark: {len(cases)} cases × {iterations} iterations "
+          f"({TARGET_WIDTH}x{TARGET_HEIGHT}, {'cold' if cold else 'warm'} caches)", file=sys.stderr)
+
+    started_at = time.time()
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="pozt_bench_") as work_dir:
+        photo_paths = {}
+        for texture in textures:
+            photo_paths[texture] = os.path.join(work_dir, f"synthetic_{seed}_{texture}.jpg")
+            Image.fromarray(create_synthetic_photo(photo_size, seed, PHOTO_TEXTURES[texture])).save(
+                photo_paths[texture], "JPEG", quality=92
+            )
+
+        for index, (texture, stripe_method, shape_type, resize_method, region_size) in enumerate(cases, 1):
+            key = case_key(stripe_method, shape_type, resize_method, region_size, texture)
+            results[key] = run_case(photo_paths[texture], photo_size, stripe_method, shape_type, resize_method,
+                                    region_size, iterations, warmup, cold)
+            results[key]["texture"] = texture
+            total = results[key]["phases"]["total"]
+            print(f"  [{index}/{len(cases)}] {key}: median {total['median_ms']:.1f}ms, "
+                  f"p95 {total['p95_ms']:.1f}ms, peak Δ{results[key]['peak_rss_delta_bytes'] / 1024 / 1024:.1f}MB",
+                  file=sys.stderr)
+
+    print(f"🏁 Render pipeline benchmark completed in {time.time() - started_at:.1f}s", file=sys.stderr)
+    return {
+        "meta": {
+            "created_at": int(started_at),
+            "target_size": [TARGET_WIDTH, TARGET_HEIGHT],
+            "photo_size": list(photo_size),
+            "seed": seed,
+            "iterations": iterations,
+            "warmup": warmup,
+            "cold": cold,
+            "matrix": {name: list(values) for name, values in matrix.items()},
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "cpu_count": os.cpu_count(),
+            "machine": platform.machine()
+        },
+        "cases": results
+    }
+
+
+def compare_with_baseline(report: Dict[str, Any], baseline: Dict[str, Any],
+                          max_time_regression: float = DEFAULT_MAX_TIME_REGRESSION,
+                          min_time_delta_ms: float = DEFAULT_MIN_TIME_DELTA_MS,
+                          max_memory_regression: float = DEFAULT_MAX_MEMORY_REGRESSION,
+                          min_memory_delta_mb: float = DEFAULT_MIN_MEMORY_DELTA_MB) -> List[Dict[str, Any]]:
+    """
+    ベースラインと比較して回帰の一覧を返す
+    フェーズごとの中央値・p95 と、ピークメモリの増加量（処理前の RSS との差）を比較する
+    相対値と絶対値の両方のしきい値を超えた場合のみ回帰とする（短いフェーズの揺らぎを無視するため）
+    """
+    regressions = []
+    baseline_cases = baseline.get("cases", {})
+    for key, case in report["cases"].items():
+        base_case = baseline_cases.get(key)
+        if base_case is None:
+            continue
+
+        for phase, stats in case["phases"].items():
+            base_stats = base_case["phases"].get(phase)
+            if base_stats is None:
+                continue
+            for metric in ("median_ms", "p95_ms"):
+                current, previous = stats[metric], base_stats[metric]
+                if current - previous > min_time_delta_ms and current > previous * (1 + max_time_regression):
+                    regressions.append({
+                        "case": key, "metric": f"{phase}.{metric}",
+                        "baseline": previous, "current": current,
+                        "change": round(current / previous - 1, 4) if previous else None
+                    })
+
+        current, previous = case["peak_rss_delta_bytes"], base_case["peak_rss_delta_bytes"]
+        if (current - previous > min_memory_delta_mb * 1024 * 1024
+                and current > previous * (1 + max_memory_regression)):
+            regressions.append({
+                "case": key, "metric": "peak_rss_delta_bytes",
+                "baseline": previous, "current": current,
+                "change": round(current / previous - 1, 4) if previous else None
+            })
+    return regressions
+
+
+def _parse_list(value: Optional[str], allowed: Sequence[str], name: str) -> Optional[Tuple[str, ...]]:
+    if value is None:
+        return None
+    items = tuple(item.strip() for item in value.split(",") if item.strip())
+    unknown = [item for item in items if item not in allowed]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"Unknown {name}: {', '.join(unknown)} (choose from {', '.join(allowed)})")
+    return items
+
+
+def _parse_size(value: str) -> Tuple[int, int]:
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the full render pipeline at the production canvas size")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="full",
+                        help="Matrix preset (full: every combination, quick: representative subset, "
+                             "dense_edges: edge-driven stripes on a noisy photo)")
+    parser.add_argument("--stripe-methods", help="Comma-separated stripe methods (overrides the profile)")
+    parser.add_argument("--shape-types", help="Comma-separated shape types (overrides the profile)")
+    parser.add_argument("--resize-methods", help="Comma-separated resize methods (overrides the profile)")
+    parser.add_argument("--region-sizes", help="Comma-separated region sizes: small, medium, large")
+    parser.add_argument("--textures", help="Comma-separated photo textures: photo, noisy (dense edges)")
+    parser.add_argument("--iterations", type=int, default=5, help="Measured runs per case")
+    parser.add_argument("--warmup", type=int, default=1, help="Unmeasured runs per case")
+    parser.add_argument("--warm", action="store_true",
+                        help="Keep decode/canvas/mask caches between runs (slider adjustments instead of first render)")
+    parser.add_argument("--photo-size", type=_parse_size, default=DEFAULT_PHOTO_SIZE, help="Synthetic photo size WxH")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Synthetic photo seed")
+    parser.add_argument("--output", help="Write the JSON report to this file (default: stdout)")
+    parser.add_argument("--baseline", help="Baseline report to compare against")
+    parser.add_argument("--save-baseline", help="Also write the report to this file as the new baseline")
+    parser.add_argument("--max-time-regression", type=float, default=DEFAULT_MAX_TIME_REGRESSION,
+                        help="Allowed relative increase of a phase median/p95 (0.15 = 15%%)")
+    parser.add_argument("--min-time-delta-ms", type=float, default=DEFAULT_MIN_TIME_DELTA_MS,
+                        help="Ignore increases smaller than this many milliseconds")
+    parser.add_argument("--max-memory-regression", type=float, default=DEFAULT_MAX_MEMORY_REGRESSION,
+                        help="Allowed relative increase of the peak memory delta")
+    parser.add_argument("--min-memory-delta-mb", type=float, default=DEFAULT_MIN_MEMORY_DELTA_MB,
+                        help="Ignore peak memory increases smaller than this many MB")
+    args = parser.parse_args(argv)
+
+    try:
+        matrix = dict(PROFILES[args.profile])
+        overrides = {
+            "stripe_methods": _parse_list(args.stripe_methods, STRIPE_METHODS, "stripe method"),
+            "shape_types": _parse_list(args.shape_types, SHAPE_TYPES, "shape type"),
+            "resize_methods": _parse_list(args.resize_methods, RESIZE_METHODS, "resize method"),
+            "region_sizes": _parse_list(args.region_sizes, tuple(REGION_SIZES), "region size"),
+            "textures": _parse_list(args.textures, tuple(PHOTO_TEXTURES), "photo texture")
+        }
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    matrix.update({name: values for name, values in overrides.items() if values})
+
+    # 処理ごとの INFO ログは計測結果の出力と混ざるため抑制
+    logging.getLogger(ROOT_LOGGER_NAME).setLevel(logging.WARNING)
+
+    report = run_benchmark(matrix, args.photo_size, args.iterations, args.warmup, not args.warm, args.seed)
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(
+            report, baseline, args.max_time_regression, args.min_time_delta_ms,
+            args.max_memory_regression, args.min_memory_delta_mb
+        )
+        report["comparison"] = {
+            "baseline": args.baseline,
+            "compared_cases": len(set(report["cases"]) & set(baseline.get("cases", {}))),
+            "thresholds": {
+                "max_time_regression": args.max_time_regression,
+                "min_time_delta_ms": args.min_time_delta_ms,
+                "max_memory_regression": args.max_memory_regression,
+                "min_memory_delta_mb": args.min_memory_delta_mb
+            },
+            "regressions": regressions
+        }
+        if regressions:
+            exit_code = 1
+            print(f"❌ {len(regressions)} regression(s) against {args.baseline}", file=sys.stderr)
+            for regression in regressions:
+                print(f"  {regression['case']} {regression['metric']}: "
+                      f"{regression['baseline']} → {regression['current']}", file=sys.stderr)
+        else:
+            print(f"✅ No regressions against {args.baseline}", file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            f.write(output + "\n")
+        print(f"💾 Baseline saved: {args.save_baseline}", file=sys.stderr)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
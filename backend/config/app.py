@@ -7,20 +7,64 @@ class Settings(BaseSettings):
     """アプリケーション設定（高品質維持・プレビュー削減版）"""
     APP_NAME: str = "pozt"
     DEBUG: bool = True
+    LOG_LEVEL: str = "INFO"  # 診断ログのレベル（DEBUG でパラメータやフェーズごとの詳細を出力）
+    METRICS_ENABLED: bool = True  # /metrics（Prometheus 形式）の公開とリクエスト計測
+    # /metrics もアクセス制御（許可ドメインからのセッション）の対象
+    # 設定すると、スクレイパーは "Authorization: Bearer <トークン>" を付けてアクセス制御を通らずに取得できる
+    # （Prometheus の scrape_config では authorization: {credentials: <トークン>} を指定）
+    METRICS_BEARER_TOKEN: str = ""
     API_PREFIX: str = "/api"
     STATIC_DIR: str = "static"
     
     # CORS設定
     CORS_ORIGINS: List[str] = ["*"]
-    
+
+    # アクセス制御（セッションは作成から一定時間で失効）
+    ACCESS_SESSION_TIMEOUT: int = 1800         # 30分
+    ACCESS_SESSION_MAX_ENTRIES: int = 10_000   # 保持するセッション数の上限（超過分は失効の近い順に破棄）
+
     # 画像設定（高品質維持）
     TARGET_WIDTH: int = 2430   # 元のサイズを維持
     TARGET_HEIGHT: int = 3240  # 元のサイズを維持
     MAX_UPLOAD_SIZE: int = 10 * 1024 * 1024  # 10MBに設定
+    MAX_IMAGE_PIXELS: int = 40_000_000       # デコード前に拒否するピクセル数（解凍爆弾対策）
+    UPLOAD_CHUNK_SIZE: int = 256 * 1024      # アップロード受信のチャンクサイズ
     
     # ファイル管理
     TEMP_FILE_EXPIRY: int = 3600  # 1時間（秒）
-    
+    ARTIFACT_INDEX_PATH: str = "artifact_index.json"  # 生成物インデックスの保存先（static/ の外に置く）
+    ARTIFACT_DISK_MAX_BYTES: int = 256 * 1024 * 1024  # static/ の生成物の合計上限（超過分は最終アクセスの古い順に削除）
+    ARTIFACT_SWEEP_INTERVAL: int = 60  # 期限切れ・上限超過を削除する間隔（秒）
+    JOB_SWEEP_INTERVAL: int = 60       # 期限切れのジョブレコードを削除する間隔（秒）
+
+    # キャッシュ設定（512MB環境向けの上限）
+    DECODED_CACHE_MAX_BYTES: int = 48 * 1024 * 1024  # デコード済みアップロード画像
+    CANVAS_CACHE_MAX_BYTES: int = 72 * 1024 * 1024   # 固定サイズキャンバス（約3枚分）
+
+    # レンダリングプール設定（0でプロセスを使わず単一スレッド実行）
+    RENDER_WORKERS: int = 1
+    RENDER_QUEUE_SIZE: int = 4
+    RENDER_POOL_START_METHOD: str = "spawn"
+    # サービス全体（親プロセス + ワーカー）のメモリ上限（0で制御しない）
+    # 実行中ジョブの見積もりの合計は、上限から計測した常駐分（各プロセスの RSS・キャッシュ）を引いた残りに収める
+    # 残り全体でも足りないジョブは413。RENDER_WORKERS=1 ではジョブが1つずつ実行されるため、この判定だけが効く
+    RENDER_MEMORY_LIMIT: int = 512 * 1024 * 1024
+    MEMORY_CALIBRATION_WINDOW: int = 20            # 見積もりの補正に使う直近の計測数（処理方法ごと）
+
+    # 結果画像の保存設定（行バンド単位で合成・エンコード）
+    RESULT_BAND_ROWS: int = 256              # 1バンドの行数（作業バッファは 幅 × 行数 × 3 バイト）
+    RESULT_OUTPUT_FORMAT: str = "png"        # 既定の出力形式（png / webp、Accept ヘッダーで webp に切り替え可）
+    RESULT_ENCODER_TIER: str = "balanced"    # 圧縮段階（fastest / balanced / smallest）
+    PREVIEW_ENCODER_TIER: str = "fastest"    # プレビューの圧縮段階
+    REVERSE_ENCODER_TIER: str = "fastest"    # 隠し画像抽出結果の圧縮段階
+    RESULT_STORE_MAX_BYTES: int = 32 * 1024 * 1024  # メモリに保持する結果画像の上限（超過分はディスクへ退避、0で常にディスク）
+    RENDER_CACHE_MAX_BYTES: int = 1024 * 1024  # 同一条件の処理結果レスポンスのキャッシュ上限（内容ハッシュ + パラメータで照合）
+    RESULT_STREAM_POLL_INTERVAL: float = 0.02  # 書き込み中ファイルの追従間隔（秒）
+
+    # プレビュー描画設定（スライダー操作用の縮小レンダリング、長辺のピクセル数）
+    PREVIEW_DIMENSION: int = 800       # 既定の長辺（2430×3240 → 600×800）
+    PREVIEW_MAX_DIMENSION: int = 1200  # クライアントが指定できる長辺の上限
+
     # メモリ最適化設定（プレビュー削減のみ）
     ENABLE_SINGLE_PREVIEW_MODE: bool = True  # プレビューを1つのみ生成
     
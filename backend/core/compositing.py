@@ -0,0 +1,53 @@
+"""
+合成処理 - 固定サイズキャンバスへのパターン・形状・枠の書き込み
+全体キャンバスは作らず、行バンドごとに合成する（compose_bands）
+共有（キャッシュ済み）キャンバスは読み取り専用のまま参照し、全体の複製は発生しない
+"""
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+from core.image_utils import black_border_rects
+
+
+def compose_bands(base: np.ndarray, region, pattern: np.ndarray, mask: Optional[np.ndarray] = None,
+                  border_width: int = 0, band_rows: int = 256) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    合成結果を行バンドごとに生成する（全体キャンバスは作らない）
+    base（読み取り専用のままでよい）のバンドを1つの作業バッファへ複製し、
+    領域と重なる行だけパターン（mask 指定時は形状合成）と枠を書き込む
+    (開始行, バンド配列) を返す。バンド配列は次の反復で上書きされる
+    """
+    height, width = base.shape[:2]
+    x, y, region_width, region_height = region
+    rects = black_border_rects(height, width, region, border_width) if border_width > 0 else []
+
+    band_rows = max(1, band_rows)
+    buffer = np.empty((min(band_rows, height),) + base.shape[1:], dtype=np.uint8)
+
+    for band_top in range(0, height, band_rows):
+        band_bottom = min(height, band_top + band_rows)
+        band = buffer[:band_bottom - band_top]
+        band[...] = base[band_top:band_bottom]
+
+        # 領域と重なる行（パターンは領域座標）
+        top, bottom = max(y, band_top), min(y + region_height, band_bottom)
+        if top < bottom:
+            target = band[top - band_top:bottom - band_top, x:x + region_width]
+            if mask is None:
+                target[...] = pattern[top - y:bottom - y]
+            else:
+                # target = pattern * (mask / 255) + target * (1 - mask / 255)（uint8 へ切り捨て）
+                weight = mask[top - y:bottom - y] / 255.0
+                if target.ndim == 3:
+                    weight = weight[:, :, np.newaxis]
+                blended = pattern[top - y:bottom - y] * weight + target * (1 - weight)
+                np.copyto(target, blended, casting='unsafe')
+
+        # 枠（合成結果の上に描画）
+        for rect_top, rect_bottom, rect_left, rect_right in rects:
+            top, bottom = max(rect_top, band_top), min(rect_bottom, band_bottom)
+            if top < bottom:
+                band[top - band_top:bottom - band_top, rect_left:rect_right] = 0
+
+        yield band_top, band
@@ -6,13 +6,19 @@ import tempfile
 from PIL import Image
 import numpy as np
 from core.image_utils import ensure_pil
+from utils.encoders import get_encoder, encode_array
 from config.settings import TARGET_WIDTH, TARGET_HEIGHT
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
 
 def save_as_png(img_array, filename_prefix="hidden_image"):
-    """画像をPNG形式で保存（最高品質）"""
+    """画像をPNG形式で保存（最小サイズ設定のエンコーダー）"""
     try:
         # PIL画像に変換
         img_pil = ensure_pil(img_array)
+        if img_pil.mode not in ("L", "RGB", "RGBA"):
+            img_pil = img_pil.convert("RGBA" if "A" in img_pil.getbands() else "RGB")
         
         # ファイル名を生成
         timestamp = tempfile.gettempprefix()
@@ -22,17 +28,11 @@ def save_as_png(img_array, filename_prefix="hidden_image"):
         temp_dir = tempfile.gettempdir()
         output_path = os.path.join(temp_dir, filename)
         
-        # PNG保存オプション
-        png_info = img_pil.info
-        img_pil.save(
-            output_path, 
-            "PNG", 
-            optimize=True,      # ファイルサイズ最適化
-            compress_level=9,   # 最高圧縮レベル（品質は劣化しない）
-            **png_info         # メタデータを保持
-        )
+        # 可逆圧縮のため品質は劣化しない
+        with open(output_path, "wb") as out_file:
+            encode_array(get_encoder("png", "smallest"), np.asarray(img_pil), out_file)
         
         return output_path
     except Exception as e:
-        print(f"PNG保存エラー: {e}")
+        logger.error("❌ PNG保存エラー: %s", e)
         return None
@@ -0,0 +1,133 @@
+"""
+ジオメトリ計画 - 元画像から固定サイズキャンバスへの変換を一元管理
+contain / cover / stretch を1回のクロップ＋スケール変換として表現し、
+キャンバス生成と領域座標変換の両方で同じ計画を使う
+"""
+from typing import NamedTuple, Tuple
+
+import numpy as np
+from PIL import Image
+
+from config.settings import TARGET_WIDTH, TARGET_HEIGHT
+
+
+class CanvasGeometry(NamedTuple):
+    """元画像 → キャンバスの変換計画"""
+    source_size: Tuple[int, int]                     # 元画像サイズ (w, h)
+    target_size: Tuple[int, int]                     # キャンバスサイズ (w, h)
+    source_box: Tuple[float, float, float, float]    # 使用する元画像範囲 (left, top, right, bottom)
+    content_rect: Tuple[int, int, int, int]          # キャンバス上の描画先 (x, y, w, h)
+
+    @property
+    def scale(self) -> Tuple[float, float]:
+        """元画像座標 → キャンバス座標の倍率 (sx, sy)"""
+        left, top, right, bottom = self.source_box
+        _, _, content_w, content_h = self.content_rect
+        return content_w / (right - left), content_h / (bottom - top)
+
+    def map_region(self, region) -> Tuple[int, int, int, int]:
+        """元画像上の領域 (x, y, w, h) をキャンバス上の領域に変換（境界クリップ済み）"""
+        src_w, src_h = self.source_size
+        target_w, target_h = self.target_size
+
+        # 元画像の範囲内にクリップ
+        x, y, width, height = region
+        x = max(0, min(x, src_w - 1))
+        y = max(0, min(y, src_h - 1))
+        width = max(1, min(width, src_w - x))
+        height = max(1, min(height, src_h - y))
+
+        left, top, _, _ = self.source_box
+        content_x, content_y, _, _ = self.content_rect
+        scale_x, scale_y = self.scale
+
+        x_fixed = int(content_x + (x - left) * scale_x)
+        y_fixed = int(content_y + (y - top) * scale_y)
+        width_fixed = int(width * scale_x)
+        height_fixed = int(height * scale_y)
+
+        # キャンバス範囲内にクリップ
+        x_fixed = max(0, min(x_fixed, target_w - 1))
+        y_fixed = max(0, min(y_fixed, target_h - 1))
+        width_fixed = max(1, min(width_fixed, target_w - x_fixed))
+        height_fixed = max(1, min(height_fixed, target_h - y_fixed))
+
+        return x_fixed, y_fixed, width_fixed, height_fixed
+
+
+def plan_canvas_geometry(source_size, method: str = 'contain',
+                         target_size: Tuple[int, int] = (TARGET_WIDTH, TARGET_HEIGHT)) -> CanvasGeometry:
+    """リサイズ方法に応じたクロップ＋スケール変換を計算"""
+    orig_width, orig_height = source_size
+    target_width, target_height = target_size
+    full_box = (0.0, 0.0, float(orig_width), float(orig_height))
+
+    if method == 'stretch':
+        return CanvasGeometry(source_size, target_size, full_box, (0, 0, target_width, target_height))
+
+    orig_aspect = orig_width / orig_height
+    target_aspect = target_width / target_height
+
+    if method == 'cover':
+        # 画面を埋める：見える範囲だけを先にクロップしてからリサンプル
+        if orig_aspect > target_aspect:
+            new_height = target_height
+            new_width = int(target_height * orig_aspect)
+        else:
+            new_width = target_width
+            new_height = int(target_width / orig_aspect)
+
+        scale_x = new_width / orig_width
+        scale_y = new_height / orig_height
+        left = ((new_width - target_width) // 2) / scale_x
+        top = ((new_height - target_height) // 2) / scale_y
+        source_box = (left, top, left + target_width / scale_x, top + target_height / scale_y)
+        return CanvasGeometry(source_size, target_size, source_box, (0, 0, target_width, target_height))
+
+    # contain：アスペクト比保持（黒帯あり）
+    if orig_aspect > target_aspect:
+        new_width = target_width
+        new_height = max(1, int(target_width / orig_aspect))
+    else:
+        new_height = target_height
+        new_width = max(1, int(target_height * orig_aspect))
+
+    x_offset = (target_width - new_width) // 2
+    y_offset = (target_height - new_height) // 2
+    return CanvasGeometry(source_size, target_size, full_box, (x_offset, y_offset, new_width, new_height))
+
+
+def preview_target_size(max_dimension: int,
+                        target_size: Tuple[int, int] = (TARGET_WIDTH, TARGET_HEIGHT)) -> Tuple[int, int]:
+    """長辺を max_dimension に縮小したプレビュー用キャンバスサイズ（アスペクト比は固定サイズと同じ）"""
+    target_width, target_height = target_size
+    scale = min(1.0, max_dimension / max(target_width, target_height))
+    return max(1, round(target_width * scale)), max(1, round(target_height * scale))
+
+
+def render_canvas(img, geometry: CanvasGeometry, resample=Image.Resampling.LANCZOS) -> np.ndarray:
+    """
+    計画に従ってキャンバスを生成（リサンプルは1回のみ）
+    img は縮小済みでもよい（source_size との比率で範囲を換算する）
+    """
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    src_w, src_h = geometry.source_size
+    ratio_x = img.width / src_w
+    ratio_y = img.height / src_h
+    left, top, right, bottom = geometry.source_box
+    box = (left * ratio_x, top * ratio_y, right * ratio_x, bottom * ratio_y)
+
+    target_width, target_height = geometry.target_size
+    content_x, content_y, content_w, content_h = geometry.content_rect
+    resized = img.resize((content_w, content_h), resample, box=box)
+
+    if (content_w, content_h) == (target_width, target_height):
+        canvas = np.array(resized)
+    else:
+        canvas = np.zeros((target_height, target_width, 3), dtype=np.uint8)
+        canvas[content_y:content_y + content_h, content_x:content_x + content_w] = np.asarray(resized)
+
+    resized.close()
+    return canvas
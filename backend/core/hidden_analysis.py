@@ -0,0 +1,140 @@
+"""
+隠し画像の解析結果の共有 - リクエスト単位で1回だけ計算する遅延評価オブジェクト
+並列に動くパターン生成関数がそれぞれシャープネス処理・グレースケール化・コントラスト・
+Canny・二値化マスクを再計算しないよう、同じ解析オブジェクトを受け渡す
+"""
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import cv2
+import numpy as np
+from PIL import Image, ImageEnhance, ImageFilter
+
+from core.image_utils import ensure_array
+
+# 二値化マスクの閾値（暗い部分を抽出）
+MASK_THRESHOLD = 100
+
+
+class HiddenImageAnalysis:
+    """
+    隠し画像の解析結果（遅延評価・スレッドセーフ）
+    各マップは最初に要求された時点で1回だけ計算し、読み取り専用の配列として共有する
+    """
+
+    def __init__(self, hidden_img):
+        self.array = ensure_array(hidden_img)
+        self._cache: Dict[Hashable, Any] = {}
+        self._key_locks: Dict[Hashable, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def shape(self):
+        return self.array.shape
+
+    @property
+    def height(self) -> int:
+        return self.array.shape[0]
+
+    @property
+    def width(self) -> int:
+        return self.array.shape[1]
+
+    def _memo(self, key: Hashable, compute: Callable[[], Any]):
+        """キーごとに1回だけ計算（同じキーを並列に要求された場合は後着が待つ）"""
+        value = self._cache.get(key)
+        if value is not None:
+            return value
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            value = self._cache.get(key)
+            if value is None:
+                value = compute()
+                if isinstance(value, np.ndarray):
+                    value.setflags(write=False)
+                self._cache[key] = value
+        return value
+
+    def sharpened(self, sharpness_boost: float, blur_scale: float = 2.0) -> "HiddenImageAnalysis":
+        """
+        シャープネス調整後の解析オブジェクト
+        プラス値はシャープネス強化、マイナス値は |sharpness_boost| * blur_scale のぼかし
+        調整なし（|sharpness_boost| <= 0.001）の場合は自身を返す
+        """
+        if abs(sharpness_boost) <= 0.001:
+            return self
+
+        def compute():
+            hidden_pil = Image.fromarray(self.array.astype('uint8'))
+            if sharpness_boost > 0:
+                hidden_pil = ImageEnhance.Sharpness(hidden_pil).enhance(1.0 + sharpness_boost)
+            else:
+                hidden_pil = hidden_pil.filter(ImageFilter.GaussianBlur(radius=abs(sharpness_boost) * blur_scale))
+            return HiddenImageAnalysis(np.array(hidden_pil))
+
+        return self._memo(("sharpened", float(sharpness_boost), float(blur_scale)), compute)
+
+    @property
+    def gray_u8(self) -> np.ndarray:
+        """グレースケール（uint8）"""
+        def compute():
+            if self.array.ndim == 3:
+                return cv2.cvtColor(self.array.astype(np.uint8), cv2.COLOR_RGB2GRAY)
+            return self.gray.astype(np.uint8)
+        return self._memo("gray_u8", compute)
+
+    @property
+    def gray(self) -> np.ndarray:
+        """グレースケール（float32, 0-255）"""
+        def compute():
+            if self.array.ndim == 3:
+                return self.gray_u8.astype(np.float32)
+            return self.array.astype(np.float32)
+        return self._memo("gray", compute)
+
+    @property
+    def norm(self) -> np.ndarray:
+        """正規化グレースケール（0-1）"""
+        return self._memo("norm", lambda: self.gray / 255.0)
+
+    def contrast(self, factor: float) -> np.ndarray:
+        """コントラスト強調マップ clip((norm - 0.5) * factor + 0.5, 0, 1)"""
+        return self._memo(
+            ("contrast", float(factor)),
+            lambda: np.clip((self.norm - 0.5) * factor + 0.5, 0, 1)
+        )
+
+    def contrast_u8(self, factor: float) -> np.ndarray:
+        """コントラスト強調マップの8bit版（エッジ検出用）"""
+        return self._memo(
+            ("contrast_u8", float(factor)),
+            lambda: (self.contrast(factor) * 255).astype(np.uint8)
+        )
+
+    def edges(self, low: int, high: int, contrast: Optional[float] = None) -> np.ndarray:
+        """
+        Canny エッジ（uint8, 0/255）
+        contrast を指定した場合はそのコントラスト強調マップ、省略時はグレースケールから検出
+        """
+        def compute():
+            source = self.gray_u8 if contrast is None else self.contrast_u8(contrast)
+            return cv2.Canny(source, low, high)
+        key_contrast = None if contrast is None else float(contrast)
+        return self._memo(("edges", low, high, key_contrast), compute)
+
+    def blurred_mask(self, ksize: int = 5) -> np.ndarray:
+        """暗い部分の二値化マスク（反転）をぼかしたもの（float32, 0-255）"""
+        def compute():
+            _, binary_mask = cv2.threshold(self.gray, MASK_THRESHOLD, 255, cv2.THRESH_BINARY_INV)
+            return cv2.GaussianBlur(binary_mask, (ksize, ksize), 0)
+        return self._memo(("blurred_mask", ksize), compute)
+
+
+def get_hidden_analysis(hidden_img) -> HiddenImageAnalysis:
+    """解析オブジェクトを取得（既に解析オブジェクトの場合はそのまま共有）"""
+    if isinstance(hidden_img, HiddenImageAnalysis):
+        return hidden_img
+    return HiddenImageAnalysis(hidden_img)
@@ -4,6 +4,7 @@ import numpy as np
 from PIL import Image, ImageDraw
 import cv2
 from config.settings import TARGET_WIDTH, TARGET_HEIGHT
+from core.geometry import plan_canvas_geometry, render_canvas
 
 def ensure_array(img):
     """入力がPIL画像かnumpy配列かを確認し、numpy配列に変換（最適化版）"""
@@ -60,55 +61,10 @@ def detect_edges(img, low_threshold=80, high_threshold=150):
     return edges.astype(np.float32) / 255.0  # 正規化
 
 def resize_to_fixed_size(img, method='contain'):
-    """画像を固定サイズ（2430×3240）にリサイズ（高速化版）"""
+    """画像を固定サイズ（2430×3240）にリサイズ（ジオメトリ計画による1回リサンプル版）"""
     img_pil = ensure_pil(img)
-    
-    if method == 'stretch':
-        # 最高速：単純リサイズ
-        return img_pil.resize((TARGET_WIDTH, TARGET_HEIGHT), Image.Resampling.LANCZOS)
-    
-    orig_width, orig_height = img_pil.size
-    orig_aspect = orig_width / orig_height
-    target_aspect = TARGET_WIDTH / TARGET_HEIGHT
-    
-    if method == 'contain':
-        # アスペクト比保持（黒帯あり）
-        if orig_aspect > target_aspect:
-            new_width = TARGET_WIDTH
-            new_height = int(TARGET_WIDTH / orig_aspect)
-        else:
-            new_height = TARGET_HEIGHT
-            new_width = int(TARGET_HEIGHT * orig_aspect)
-        
-        # 高速リサイズ
-        resized = img_pil.resize((new_width, new_height), Image.Resampling.LANCZOS)
-        
-        # キャンバス作成と配置（PIL最適化）
-        canvas = Image.new('RGB', (TARGET_WIDTH, TARGET_HEIGHT), (0, 0, 0))
-        x_offset = (TARGET_WIDTH - new_width) // 2
-        y_offset = (TARGET_HEIGHT - new_height) // 2
-        canvas.paste(resized, (x_offset, y_offset))
-        
-        return canvas
-    
-    elif method == 'cover':
-        # 画面を埋める（クロップあり）
-        if orig_aspect > target_aspect:
-            new_height = TARGET_HEIGHT
-            new_width = int(TARGET_HEIGHT * orig_aspect)
-        else:
-            new_width = TARGET_WIDTH
-            new_height = int(TARGET_WIDTH / orig_aspect)
-        
-        # 高速リサイズ
-        resized = img_pil.resize((new_width, new_height), Image.Resampling.LANCZOS)
-        
-        # 中央クロップ
-        x_offset = (new_width - TARGET_WIDTH) // 2
-        y_offset = (new_height - TARGET_HEIGHT) // 2
-        cropped = resized.crop((x_offset, y_offset, x_offset + TARGET_WIDTH, y_offset + TARGET_HEIGHT))
-        
-        return cropped
+    geometry = plan_canvas_geometry(img_pil.size, method)
+    return Image.fromarray(render_canvas(img_pil, geometry))
 
 def calculate_resize_factors(orig_img, resize_method):
     """リサイズの比率とオフセットを計算（最適化版）"""
@@ -144,48 +100,49 @@ def calculate_resize_factors(orig_img, resize_method):
         scale_y = TARGET_HEIGHT / orig_height
         return scale_x, scale_y, scale_x, 0, 0
 
-def add_black_border(img, region, border_width=3):
-    """グレー領域の周りに黒い枠を追加（完全ベクトル化版）"""
-    if region is None:
-        return img
-    
-    result = ensure_array(img).copy()
+def black_border_rects(height, width, region, border_width=3):
+    """
+    領域の周りの黒枠を (top, bottom, left, right) の矩形リストで返す
+    画像の端に接している辺には枠を付けない
+    """
     x, y, w, h = region
     
-    # 画像サイズを取得
-    height, width = result.shape[:2]
-    
-    # **ベクトル化による境界計算**
-    # 境界座標計算（ベクトル化）
-    borders = np.array([
-        max(0, y - border_width),      # top
-        min(height, y + h + border_width),  # bottom
-        max(0, x - border_width),      # left
-        min(width, x + w + border_width)   # right
-    ])
-    
-    top, bottom, left, right = borders
+    # 上下枠は左右の枠幅を含めた範囲
+    left = max(0, x - border_width)
+    right = min(width, x + w + border_width)
     
-    # **完全ベクトル化による枠描画**
+    rects = []
     # 上枠（存在する場合）
     if y > 0:
-        top_border = max(0, y - border_width)
-        result[top_border:y, left:right] = 0
+        rects.append((max(0, y - border_width), y, left, right))
     
     # 下枠（存在する場合）
     if y + h < height:
-        bottom_border = min(height, y + h + border_width)
-        result[y+h:bottom_border, left:right] = 0
+        rects.append((y + h, min(height, y + h + border_width), left, right))
     
     # 左枠（存在する場合）
     if x > 0:
-        left_border = max(0, x - border_width)
-        result[y:y+h, left_border:x] = 0
+        rects.append((y, y + h, max(0, x - border_width), x))
     
     # 右枠（存在する場合）
     if x + w < width:
-        right_border = min(width, x + w + border_width)
-        result[y:y+h, x+w:right_border] = 0
+        rects.append((y, y + h, x + w, min(width, x + w + border_width)))
+    
+    return rects
+
+def add_black_border(img, region, border_width=3):
+    """グレー領域の周りに黒い枠を追加（完全ベクトル化版）"""
+    if region is None:
+        return img
+    
+    result = ensure_array(img).copy()
+    
+    # 画像サイズを取得
+    height, width = result.shape[:2]
+    
+    # 各辺の枠をスライスで塗りつぶし
+    for top, bottom, left, right in black_border_rects(height, width, region, border_width):
+        result[top:bottom, left:right] = 0
     
     return result
 
@@ -4,6 +4,9 @@
 import numpy as np
 from PIL import Image, ImageDraw
 from core.image_utils import ensure_array, ensure_pil
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
 
 def draw_region_preview(img, region, label="", color="red"):
     """画像に領域を描画して表示"""
@@ -46,7 +49,7 @@ def update_preview_with_region(img, evt):
         
         return preview, region
     except Exception as e:
-        print(f"Error in update_preview_with_region: {e}")
+        logger.error("❌ Error in update_preview_with_region: %s", e)
         return None, None
 
 def select_grid_position(img, grid_pos, current_region=None):
@@ -78,7 +81,7 @@ def select_grid_position(img, grid_pos, current_region=None):
         
         return preview, region, extracted
     except Exception as e:
-        print(f"グリッド選択エラー: {e}")
+        logger.error("❌ グリッド選択エラー: %s", e)
         return None, None, None
 
 def move_region(img, region, direction, step=20):
@@ -104,7 +107,7 @@ def move_region(img, region, direction, step=20):
         
         return preview, updated_region, extracted
     except Exception as e:
-        print(f"移動エラー: {e}")
+        logger.error("❌ 移動エラー: %s", e)
         return None, None, None
 
 def adjust_region_size(img, region, width, height):
@@ -127,7 +130,7 @@ def adjust_region_size(img, region, width, height):
         
         return preview, updated_region, extracted
     except Exception as e:
-        print(f"サイズ調整エラー: {e}")
+        logger.error("❌ サイズ調整エラー: %s", e)
         return None, None, None
 
 def update_region_position(img, region, x_pos, y_pos):
@@ -149,5 +152,5 @@ def update_region_position(img, region, x_pos, y_pos):
         
         return preview, updated_region, extracted
     except Exception as e:
-        print(f"位置更新エラー: {e}")
+        logger.error("❌ 位置更新エラー: %s", e)
         return None, None, None
@@ -6,7 +6,11 @@ import numpy as np
 import cv2
 from functools import lru_cache
 from typing import Tuple, Dict, Any, Optional
+import logging
 import math
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
 
 # メモリ効率を重視した最適化キャッシュ設定
 CACHE_SIZE = 64  # 128から64に削減（バランス重視）
@@ -28,6 +32,9 @@ MEMORY_WARNING_THRESHOLD = 100  # MB
 # 複雑な形状使用後の自動キャッシュクリア閾値
 COMPLEXITY_THRESHOLD = 4  # この値以上の複雑さでキャッシュ管理を厳格化
 
+# ピクセル単位の形状パラメータ（縮小プレビューではキャンバスと同じ倍率で縮める）
+PIXEL_SHAPE_PARAMS = ("center_x", "center_y", "radius")
+
 @lru_cache(maxsize=CACHE_SIZE)
 def create_circle_mask(width: int, height: int, center_x: Optional[float] = None, center_y: Optional[float] = None, radius: Optional[float] = None, rotation: float = 0.0) -> np.ndarray:
     """円形マスクの高速生成（ベクトル化）"""
@@ -53,13 +60,13 @@ def create_circle_mask(width: int, height: int, center_x: Optional[float] = None
 @lru_cache(maxsize=CACHE_SIZE)
 def create_star_mask(width: int, height: int, num_points: int = 5, inner_radius_ratio: float = 0.4, rotation: float = 0) -> np.ndarray:
     """星形マスクの高速生成（ベクトル化）"""
-    print(f"⭐ Creating star mask: {width}x{height}, points={num_points}, inner_ratio={inner_radius_ratio}, rotation={rotation}")
+    logger.debug("⭐ Creating star mask: %sx%s, points=%s, inner_ratio=%s, rotation=%s", width, height, num_points, inner_radius_ratio, rotation)
     
     center_x, center_y = width / 2, height / 2
     outer_radius = min(width, height) / 2 * 0.8
     inner_radius = outer_radius * inner_radius_ratio
     
-    print(f"⭐ Star geometry: center=({center_x:.1f}, {center_y:.1f}), outer_radius={outer_radius:.1f}, inner_radius={inner_radius:.1f}")
+    logger.debug("⭐ Star geometry: center=(%.1f, %.1f), outer_radius=%.1f, inner_radius=%.1f", center_x, center_y, outer_radius, inner_radius)
     
     # 角度配列の事前計算
     angle_step = 2 * math.pi / num_points
@@ -70,18 +77,19 @@ def create_star_mask(width: int, height: int, num_points: int = 5, inner_radius_
     star_x = center_x + radii * np.cos(angles)
     star_y = center_y + radii * np.sin(angles)
     
-    print(f"⭐ Star points: {len(star_x)} points generated")
+    logger.debug("⭐ Star points: %d points generated", len(star_x))
     
     # OpenCVによる高速ポリゴン描画
     mask = np.zeros((height, width), dtype=np.uint8)
     points = np.column_stack((star_x, star_y)).astype(np.int32)
     cv2.fillPoly(mask, [points], 255)
     
-    # マスクの統計情報をログ出力
-    white_pixels = np.sum(mask == 255)
-    total_pixels = width * height
-    coverage = (white_pixels / total_pixels) * 100
-    print(f"⭐ Star mask created: {white_pixels}/{total_pixels} pixels ({coverage:.1f}% coverage)")
+    # マスクの統計情報をログ出力（全画素の集計になるためデバッグ時のみ）
+    if logger.isEnabledFor(logging.DEBUG):
+        white_pixels = np.count_nonzero(mask == 255)
+        total_pixels = width * height
+        coverage = (white_pixels / total_pixels) * 100
+        logger.debug("⭐ Star mask created: %s/%s pixels (%.1f%% coverage)", white_pixels, total_pixels, coverage)
     
     return mask
 
@@ -270,11 +278,11 @@ def create_custom_shape_mask(width: int, height: int, shape_type: str, **params)
             else:
                 star_params['rotation'] = 0.0  # デフォルト値
             
-            print(f"🌟 Star mask parameters received: {params}")
-            print(f"🌟 Star mask mapped parameters: {star_params}")
+            logger.debug("🌟 Star mask parameters received: %s", params)
+            logger.debug("🌟 Star mask mapped parameters: %s", star_params)
             
             result = create_star_mask(width, height, **star_params)
-            print(f"🌟 Star mask created successfully with shape: {result.shape}")
+            logger.debug("🌟 Star mask created successfully with shape: %s", result.shape)
             
             # 星形は中程度の複雑さ - 大きいサイズの場合のみ注意
             if large_mask and memory_mb > MEMORY_WARNING_THRESHOLD * 0.5:
@@ -295,7 +303,7 @@ def create_custom_shape_mask(width: int, height: int, shape_type: str, **params)
             else:
                 heart_params['rotation'] = 0.0  # デフォルト値
 
-            print(f"💖 Heart mask parameters: {heart_params}")
+            logger.debug("💖 Heart mask parameters: %s", heart_params)
             result = create_heart_mask(width, height, **heart_params)
             # ハート形も中程度の複雑さ - 大きいサイズの場合のみ注意
             if large_mask and memory_mb > MEMORY_WARNING_THRESHOLD * 0.5:
@@ -314,7 +322,7 @@ def create_custom_shape_mask(width: int, height: int, shape_type: str, **params)
             else:
                 circle_params['rotation'] = 0.0  # デフォルト値
                 
-            print(f"⭕ Circle mask parameters: {circle_params}")
+            logger.debug("⭕ Circle mask parameters: %s", circle_params)
             return create_circle_mask(width, height, **circle_params)
             
         elif shape_type == "hexagon":
@@ -332,7 +340,7 @@ def create_custom_shape_mask(width: int, height: int, shape_type: str, **params)
             else:
                 hex_params['rotation'] = 0.0  # デフォルト値
                 
-            print(f"🔷 Hexagon mask parameters: {hex_params}")
+            logger.debug("🔷 Hexagon mask parameters: %s", hex_params)
             return create_hexagon_mask(width, height, **hex_params)
             
         elif shape_type == "japanese":
@@ -350,7 +358,7 @@ def create_custom_shape_mask(width: int, height: int, shape_type: str, **params)
             else:
                 japanese_params['rotation'] = 0.0  # デフォルト値
                 
-            print(f"🌸 Japanese mask parameters: {japanese_params}")
+            logger.debug("🌸 Japanese mask parameters: %s", japanese_params)
             result = create_traditional_japanese_mask(width, height, **japanese_params)
             # 和柄は複雑 - 使用後にキャッシュをクリア
             if memory_mb > MEMORY_WARNING_THRESHOLD * 0.3:
@@ -372,7 +380,7 @@ def create_custom_shape_mask(width: int, height: int, shape_type: str, **params)
             else:
                 arabesque_params['rotation'] = 0.0  # デフォルト値
                 
-            print(f"🌿 Arabesque mask parameters: {arabesque_params}")
+            logger.debug("🌿 Arabesque mask parameters: %s", arabesque_params)
             result = create_arabesque_mask(width, height, **arabesque_params)
             # アラベスクは最も複雑 - 必ず使用後にキャッシュをクリア
             clear_shape_cache("arabesque")
@@ -381,10 +389,10 @@ def create_custom_shape_mask(width: int, height: int, shape_type: str, **params)
             # デフォルトは円形（最も効率的）
             return create_circle_mask(width, height)
     except Exception as e:
-        print(f"❌ Shape mask generation error: {e}")
+        logger.error("❌ Shape mask generation error: %s", e)
         # メモリ不足の可能性がある場合は全キャッシュをクリア
         if "memory" in str(e).lower():
-            print("⚠️ Possible memory issue detected, clearing all caches")
+            logger.warning("⚠️ Possible memory issue detected, clearing all caches")
             clear_shape_cache()
         # フォールバック：単純な円形マスク
         return create_circle_mask(width, height)
@@ -574,6 +582,26 @@ def get_mask_memory_usage() -> Dict[str, Any]:
         "avg_mask_size_kb": avg_mask_size_kb
     }
 
+def get_mask_cache_stats() -> Dict[str, int]:
+    """形状マスクキャッシュ全体の件数・ヒット数・ミス数（軽量版、clear_shape_cache でリセットされる）"""
+    stats = {"entries": 0, "hits": 0, "misses": 0}
+    for mask_function in (create_circle_mask, create_star_mask, create_heart_mask, create_hexagon_mask,
+                          create_traditional_japanese_mask, create_arabesque_mask):
+        info = mask_function.cache_info()
+        stats["entries"] += info.currsize
+        stats["hits"] += info.hits
+        stats["misses"] += info.misses
+    return stats
+
+def scale_shape_params(params: Dict[str, Any], scale: float) -> Dict[str, Any]:
+    """ピクセル単位の形状パラメータを倍率に合わせて変換（比率指定のパラメータはそのまま）"""
+    scaled = dict(params)
+    for key in PIXEL_SHAPE_PARAMS:
+        value = scaled.get(key)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            scaled[key] = value * scale
+    return scaled
+
 def clear_shape_cache(shape_type=None):
     """形状マスクキャッシュをクリア（メモリ解放）
     
@@ -588,7 +616,7 @@ def clear_shape_cache(shape_type=None):
         create_hexagon_mask.cache_clear()
         create_traditional_japanese_mask.cache_clear()
         create_arabesque_mask.cache_clear()
-        print("🧹 All shape mask caches cleared")
+        logger.debug("🧹 All shape mask caches cleared")
         return
     
     # 特定の形状のキャッシュのみクリア
@@ -605,4 +633,4 @@ def clear_shape_cache(shape_type=None):
     elif shape_type == "arabesque":
         create_arabesque_mask.cache_clear()
     
-    print(f"🧹 {shape_type} shape mask cache cleared")
+    logger.debug("🧹 %s shape mask cache cleared", shape_type)
@@ -1,13 +1,20 @@
 import os
+import asyncio
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse, HTMLResponse, Response, RedirectResponse
-from api.routes import image, health, reverse  # reverse を追加
+from api.routes import image, health, reverse, jobs, metrics  # reverse を追加
 from config.app import get_settings
+from utils.render_pool import get_render_pool, shutdown_render_pool
+from utils.job_store import get_job_store, run_job_sweeper
+from utils.result_store import ResultStaticFiles
+from utils.artifact_index import get_artifact_index, run_artifact_sweeper
 
 # アクセス制御ミドルウェアをインポート
 from middleware.access_control import AccessControlMiddleware
+from middleware.metrics import MetricsMiddleware
+from middleware.upload_limit import UploadSizeLimitMiddleware
 
 app = FastAPI(
     title="pozt API",
@@ -16,14 +23,22 @@ app = FastAPI(
 )
 
 # アクセス制御ミドルウェアを追加（最初に追加することが重要）
+settings = get_settings()
 app.add_middleware(
     AccessControlMiddleware,
     allowed_origin="pozt.iodo.co.jp",  # 許可するドメイン
-    session_timeout=1800  # 30分 = 1800秒
+    session_timeout=settings.ACCESS_SESSION_TIMEOUT,  # 30分 = 1800秒
+    max_sessions=settings.ACCESS_SESSION_MAX_ENTRIES,
+    metrics_token=settings.METRICS_BEARER_TOKEN  # /metrics のスクレイプ用（空ならセッションが必要）
+)
+
+# アップロードサイズ制限（本文の受信中に判定。413 にも CORS ヘッダーが付くよう CORS より内側に置く）
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    limits={"/api/upload": settings.MAX_UPLOAD_SIZE, "/api/reverse": reverse.MAX_FILE_SIZE}
 )
 
 # CORS設定
-settings = get_settings()
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["https://pozt.iodo.co.jp", "http://pozt.iodo.co.jp"],  # 特定のオリジンのみ許可
@@ -32,10 +47,59 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# リクエスト計測（最後に追加して最も外側で計測し、アクセス拒否も含める）
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+# レンダリングプールの起動・停止
+@app.on_event("startup")
+async def start_render_pool():
+    render_pool = get_render_pool()
+    render_pool.set_progress_handler(get_job_store().update_phase)
+    await render_pool.warm_up()
+
+@app.on_event("shutdown")
+async def stop_render_pool():
+    shutdown_render_pool()
+
+# 生成物インデックスの読み込みと定期スイーパー（期限切れ・ディスク上限）
+_artifact_sweeper = None
+
+@app.on_event("startup")
+async def start_artifact_sweeper():
+    global _artifact_sweeper
+    artifact_index = get_artifact_index()
+    artifact_index.load()
+    _artifact_sweeper = asyncio.create_task(
+        run_artifact_sweeper(artifact_index, settings.ARTIFACT_SWEEP_INTERVAL)
+    )
+
+@app.on_event("shutdown")
+async def stop_artifact_sweeper():
+    if _artifact_sweeper is not None:
+        _artifact_sweeper.cancel()
+    get_artifact_index().save()
+
+# 期限切れジョブレコードの定期削除
+_job_sweeper = None
+
+@app.on_event("startup")
+async def start_job_sweeper():
+    global _job_sweeper
+    _job_sweeper = asyncio.create_task(run_job_sweeper(get_job_store(), settings.JOB_SWEEP_INTERVAL))
+
+@app.on_event("shutdown")
+async def stop_job_sweeper():
+    if _job_sweeper is not None:
+        _job_sweeper.cancel()
+
 # APIルート
 app.include_router(health.router, tags=["Health"])
 app.include_router(image.router, prefix="/api", tags=["Image"])
 app.include_router(reverse.router, prefix="/api", tags=["Reverse"])  # リバース機能ルートを追加
+app.include_router(jobs.router, prefix="/api", tags=["Jobs"])
+if settings.METRICS_ENABLED:
+    app.include_router(metrics.router, tags=["Metrics"])
 
 # React ビルド成果物へのパス
 BASE_DIR = os.path.dirname(__file__)
@@ -52,8 +116,8 @@ os.makedirs(UPLOAD_STATIC_DIR, exist_ok=True)
 if os.path.isdir(REACT_STATIC_DIR):
     app.mount("/static", StaticFiles(directory=REACT_STATIC_DIR), name="react_static")
 
-# アップロードされた画像ファイルの提供 - より高い優先度で設定
-app.mount("/uploads", StaticFiles(directory=UPLOAD_STATIC_DIR), name="upload_static")
+# アップロードされた画像ファイルの提供 - より高い優先度で設定（メモリ上の結果画像を優先して配信）
+app.mount("/uploads", ResultStaticFiles(directory=UPLOAD_STATIC_DIR), name="upload_static")
 
 # セッション状態確認エンドポイント（デバッグ用）
 @app.get("/api/session-status")
@@ -1,265 +1,296 @@
 """
 アクセス制御ミドルウェア
 pozt.iodo.co.jpからのアクセスのみを許可し、30分のセッション制限を実装
+（ASGI ミドルウェアとして直接実装し、静的ファイルは何も処理せずに通す）
+/metrics も対象で、metrics_token を設定した場合のみ Bearer トークン付きのスクレイプを通す
 """
 
 import time
 import hashlib
-import json
-from typing import Dict, Optional
+import hmac
+from collections import OrderedDict
+from typing import Optional, Tuple
 from urllib.parse import urlparse
-from fastapi import Request, Response, HTTPException
+from fastapi import Response
 from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from utils.logger import get_logger
 
-class AccessControlMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app, allowed_origin: str = "pozt.iodo.co.jp", session_timeout: int = 1800):
-        super().__init__(app)
+logger = get_logger(__name__)
+
+# チェックせずに通すパス
+BYPASS_PATH_PREFIXES = ("/static", "/uploads", "/favicon.ico")
+BYPASS_PATHS = frozenset(["/health", "/docs", "/openapi.json"])
+API_PATH_PREFIXES = ("/api", "/health", "/metrics", "/docs", "/openapi.json")
+# Bearer トークンで通すパス（スクレイパーは Referer / Origin もセッションも持たないため）
+METRICS_PATH = "/metrics"
+
+
+class Session:
+    """セッション情報（作成時刻とアクセス回数のみ保持）"""
+
+    __slots__ = ("created_at", "access_count")
+
+    def __init__(self, created_at: float):
+        self.created_at = created_at
+        self.access_count = 1
+
+
+class SessionStore:
+    """
+    上限付きのセッション表
+    有効期限は作成時刻から一定なので作成順 = 失効順となり、先頭から期限切れを取り除くだけで掃除できる
+    （掃除は償却 O(1)、上限を超えた場合は失効の近いセッションから破棄）
+    """
+
+    def __init__(self, timeout: int, max_entries: int):
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self.evicted = 0
+        self._sessions: "OrderedDict[bytes, Session]" = OrderedDict()  # 作成順（古い順）
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def expire(self, now: float):
+        """期限切れのセッションを先頭から削除"""
+        sessions = self._sessions
+        deadline = now - self.timeout
+        while sessions:
+            if next(iter(sessions.values())).created_at >= deadline:
+                break
+            sessions.popitem(last=False)
+
+    def get(self, session_id: bytes, now: float) -> Optional[Session]:
+        """有効なセッションを取得してアクセス回数を更新（期限切れ・未登録は None）"""
+        self.expire(now)
+        session = self._sessions.get(session_id)
+        if session is not None:
+            session.access_count += 1
+        return session
+
+    def create(self, session_id: bytes, now: float) -> Session:
+        """新しいセッションを作成（上限に達していれば最も古いセッションを破棄）"""
+        while len(self._sessions) >= self.max_entries:
+            self._sessions.popitem(last=False)
+            self.evicted += 1
+        session = Session(now)
+        self._sessions[session_id] = session
+        return session
+
+    def remaining(self, session: Session, now: float) -> int:
+        return int(self.timeout - (now - session.created_at))
+
+    def stats(self):
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_entries,
+            "evicted": self.evicted
+        }
+
+
+class AccessControlMiddleware:
+    def __init__(self, app: ASGIApp, allowed_origin: str = "pozt.iodo.co.jp", session_timeout: int = 1800,
+                 max_sessions: int = 10_000, metrics_token: str = ""):
+        self.app = app
         self.allowed_origin = allowed_origin  # pozt.iodo.co.jp
         self.session_timeout = session_timeout  # 30分 = 1800秒
-        self.sessions: Dict[str, Dict] = {}  # メモリ内セッション管理
-        
-    def _generate_session_id(self, request: Request) -> str:
-        """クライアント情報からセッションIDを生成"""
-        client_info = f"{request.client.host}_{request.headers.get('user-agent', '')}"
-        return hashlib.sha256(client_info.encode()).hexdigest()
-    
-    def _is_valid_referrer(self, request: Request) -> bool:
-        """Referrerが許可されたドメインからかチェック"""
-        referrer = request.headers.get("referer", "")
-        if not referrer:
-            return False
-        
-        parsed_referrer = urlparse(referrer)
-        return parsed_referrer.netloc == self.allowed_origin
-    
-    def _is_valid_origin(self, request: Request) -> bool:
-        """Originが許可されたドメインからかチェック"""
-        origin = request.headers.get("origin", "")
-        if not origin:
-            return False
-        
-        parsed_origin = urlparse(origin)
-        return parsed_origin.netloc == self.allowed_origin
-    
-    def _create_session(self, session_id: str) -> Dict:
-        """新しいセッションを作成"""
-        session_data = {
-            "created_at": time.time(),
-            "last_accessed": time.time(),
-            "access_count": 1
-        }
-        self.sessions[session_id] = session_data
-        return session_data
-    
-    def _update_session(self, session_id: str) -> Dict:
-        """既存セッションを更新"""
-        if session_id in self.sessions:
-            self.sessions[session_id]["last_accessed"] = time.time()
-            self.sessions[session_id]["access_count"] += 1
-            return self.sessions[session_id]
-        return None
-    
-    def _is_session_valid(self, session_id: str) -> bool:
-        """セッションが有効かチェック"""
-        if session_id not in self.sessions:
+        self.sessions = SessionStore(session_timeout, max_sessions)  # メモリ内セッション管理
+        # /metrics のスクレイプ用トークン（空の場合は他のパスと同じくセッションが必要）
+        self._metrics_authorization = f"Bearer {metrics_token}".encode() if metrics_token else None
+
+    def _generate_session_id(self, scope: Scope, headers: Headers) -> Tuple[bytes, str]:
+        """クライアント情報からセッションIDを生成（表のキーはバイト列、ヘッダー用に16進の先頭を返す）"""
+        client = scope.get("client")
+        client_info = f"{client[0] if client else ''}_{headers.get('user-agent', '')}"
+        digest = hashlib.sha256(client_info.encode()).digest()
+        return digest, digest.hex()[:16]
+
+    def _is_allowed_url(self, url: str) -> bool:
+        """URL（Referer / Origin）が許可されたドメインかチェック"""
+        if not url:
             return False
-        
-        session = self.sessions[session_id]
-        current_time = time.time()
-        
-        # 30分経過チェック
-        if current_time - session["created_at"] > self.session_timeout:
-            # セッション削除
-            del self.sessions[session_id]
+        return urlparse(url).netloc == self.allowed_origin
+
+    def _is_metrics_scrape(self, path: str, headers: Headers) -> bool:
+        """トークン付きの /metrics の取得かどうかチェック（比較は定数時間）"""
+        if self._metrics_authorization is None or path != METRICS_PATH:
             return False
-        
-        return True
-    
-    def _cleanup_expired_sessions(self):
-        """期限切れセッションをクリーンアップ"""
-        current_time = time.time()
-        expired_sessions = []
-        
-        for session_id, session_data in self.sessions.items():
-            if current_time - session_data["created_at"] > self.session_timeout:
-                expired_sessions.append(session_id)
-        
-        for session_id in expired_sessions:
-            del self.sessions[session_id]
-    
+        return hmac.compare_digest(headers.get("authorization", "").encode(), self._metrics_authorization)
+
     def _is_api_endpoint(self, path: str) -> bool:
         """APIエンドポイントかどうかチェック"""
-        api_paths = ["/api", "/health", "/docs", "/openapi.json"]
-        return any(path.startswith(api_path) for api_path in api_paths)
-    
-    async def dispatch(self, request: Request, call_next):
-        # 定期的にセッションクリーンアップ
-        self._cleanup_expired_sessions()
-        
-        # 静的ファイルやアップロードファイルはスルー
-        if request.url.path.startswith(("/static", "/uploads", "/favicon.ico")):
-            return await call_next(request)
-        
-        # ヘルスチェックはスルー
-        if request.url.path in ["/health", "/docs", "/openapi.json"]:
-            return await call_next(request)
-        
-        session_id = self._generate_session_id(request)
+        return path.startswith(API_PATH_PREFIXES)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # 静的ファイルやアップロードファイル、ヘルスチェックはスルー
+        path = scope["path"]
+        if path.startswith(BYPASS_PATH_PREFIXES) or path in BYPASS_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        if self._is_metrics_scrape(path, headers):
+            await self.app(scope, receive, send)
+            return
+
+        session_key, session_id = self._generate_session_id(scope, headers)
         current_time = time.time()
-        
+
         # セッション状態をチェック
-        session_exists = self._is_session_valid(session_id)
-        valid_referrer = self._is_valid_referrer(request)
-        valid_origin = self._is_valid_origin(request)
-        
-        print(f"🔐 Access Control Check:")
-        print(f"  Path: {request.url.path}")
-        print(f"  Session ID: {session_id[:16]}...")
-        print(f"  Session exists: {session_exists}")
-        print(f"  Valid referrer: {valid_referrer}")
-        print(f"  Valid origin: {valid_origin}")
-        print(f"  Referrer: {request.headers.get('referer', 'None')}")
-        print(f"  Origin: {request.headers.get('origin', 'None')}")
-        
+        session = self.sessions.get(session_key, current_time)
+        referrer = headers.get("referer", "")
+        origin = headers.get("origin", "")
+        valid_referrer = self._is_allowed_url(referrer)
+        valid_origin = self._is_allowed_url(origin)
+
+        logger.debug(
+            "🔐 Access Control Check: path=%s, session=%s..., session_exists=%s, "
+            "valid_referrer=%s, valid_origin=%s, referrer=%s, origin=%s",
+            path, session_id, session is not None, valid_referrer, valid_origin,
+            referrer or "None", origin or "None"
+        )
+
         # アクセス許可の判定
-        access_granted = False
-        
-        if session_exists:
+        if session is not None:
             # 既存の有効セッションがある場合
-            self._update_session(session_id)
-            access_granted = True
-            print(f"  ✅ Access granted: Valid session")
+            logger.debug("  ✅ Access granted: Valid session")
         elif valid_referrer or valid_origin:
             # 正しいドメインからの新規アクセス
-            self._create_session(session_id)
-            access_granted = True
-            print(f"  ✅ Access granted: Valid origin/referrer")
+            session = self.sessions.create(session_key, current_time)
+            logger.debug("  ✅ Access granted: Valid origin/referrer")
         else:
             # アクセス拒否
-            access_granted = False
-            print(f"  ❌ Access denied: Invalid origin/referrer and no valid session")
-        
-        if not access_granted:
-            # アクセス拒否レスポンス
-            error_response = {
-                "error": "Access Denied",
-                "message": f"このアプリには {self.allowed_origin} からのみアクセス可能です",
-                "redirect_url": f"https://{self.allowed_origin}",
-                "session_timeout": self.session_timeout,
-                "current_time": current_time
-            }
-            
-            # APIエンドポイントの場合はJSONレスポンス
-            if self._is_api_endpoint(request.url.path):
-                return JSONResponse(
-                    status_code=403,
-                    content=error_response
-                )
-            else:
-                # フロントエンドの場合はHTMLレスポンス
-                html_content = f"""
-                <!DOCTYPE html>
-                <html lang="ja">
-                <head>
-                    <meta charset="UTF-8">
-                    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                    <title>アクセス制限 - pozt</title>
-                    <style>
-                        body {{
-                            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
-                            background: linear-gradient(135deg, #0a0f1a 0%, #1e2638 100%);
-                            color: #ffffff;
-                            display: flex;
-                            justify-content: center;
-                            align-items: center;
-                            min-height: 100vh;
-                            margin: 0;
-                            text-align: center;
-                        }}
-                        .container {{
-                            max-width: 600px;
-                            padding: 40px;
-                            background: rgba(37, 45, 66, 0.8);
-                            border-radius: 20px;
-                            backdrop-filter: blur(20px);
-                            border: 1px solid rgba(255, 255, 255, 0.1);
-                            box-shadow: 0 25px 50px rgba(0, 0, 0, 0.35);
-                        }}
-                        h1 {{
-                            background: linear-gradient(135deg, #00d4ff 0%, #6366f1 100%);
-                            -webkit-background-clip: text;
-                            -webkit-text-fill-color: transparent;
-                            font-size: 2.5rem;
-                            margin-bottom: 20px;
-                        }}
-                        .message {{
-                            font-size: 1.2rem;
-                            line-height: 1.6;
-                            margin-bottom: 30px;
-                            color: #94a3b8;
-                        }}
-                        .redirect-btn {{
-                            display: inline-block;
-                            padding: 15px 30px;
-                            background: linear-gradient(135deg, #00d4ff 0%, #6366f1 100%);
-                            color: white;
-                            text-decoration: none;
-                            border-radius: 12px;
-                            font-weight: 600;
-                            transition: all 0.3s ease;
-                            font-size: 1.1rem;
-                        }}
-                        .redirect-btn:hover {{
-                            transform: translateY(-3px);
-                            box-shadow: 0 10px 30px rgba(0, 212, 255, 0.3);
-                        }}
-                        .info {{
-                            margin-top: 30px;
-                            padding: 20px;
-                            background: rgba(0, 0, 0, 0.2);
-                            border-radius: 12px;
-                            font-size: 0.9rem;
-                            color: #64748b;
-                        }}
-                    </style>
-                </head>
-                <body>
-                    <div class="container">
-                        <h1>🔒 アクセス制限</h1>
-                        <div class="message">
-                            <p>このアプリケーションは <strong>{self.allowed_origin}</strong> からのみアクセス可能です。</p>
-                            <p>セッションの有効期限は30分間です。</p>
-                        </div>
-                        <a href="https://{self.allowed_origin}" class="redirect-btn">
-                            正規サイトへ移動
-                        </a>
-                        <div class="info">
-                            <p><strong>セッション情報:</strong></p>
-                            <p>タイムアウト: {self.session_timeout // 60}分</p>
-                            <p>アクセス時刻: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(current_time))}</p>
-                        </div>
-                    </div>
-                    <script>
-                        // 5秒後に自動リダイレクト
-                        setTimeout(function() {{
-                            window.location.href = 'https://{self.allowed_origin}';
-                        }}, 5000);
-                    </script>
-                </body>
-                </html>
-                """
-                return Response(content=html_content, media_type="text/html", status_code=403)
-        
-        # アクセス許可された場合、リクエストを処理
-        response = await call_next(request)
-        
+            logger.info("❌ Access denied: %s (invalid origin/referrer and no valid session)", path)
+            response = self._denied_response(path, current_time)
+            await response(scope, receive, send)
+            return
+
         # セッション情報をヘッダーに追加（デバッグ用）
-        if session_id in self.sessions:
-            session_data = self.sessions[session_id]
-            response.headers["X-Session-ID"] = session_id[:16]
-            response.headers["X-Session-Remaining"] = str(
-                int(self.session_timeout - (current_time - session_data["created_at"]))
+        remaining = str(self.sessions.remaining(session, current_time))
+
+        async def send_with_session(message: Message):
+            if message["type"] == "http.response.start":
+                response_headers = MutableHeaders(scope=message)
+                response_headers["X-Session-ID"] = session_id
+                response_headers["X-Session-Remaining"] = remaining
+            await send(message)
+
+        # アクセス許可された場合、リクエストを処理
+        await self.app(scope, receive, send_with_session)
+
+    def _denied_response(self, path: str, current_time: float) -> Response:
+        """アクセス拒否レスポンス"""
+        error_response = {
+            "error": "Access Denied",
+            "message": f"このアプリには {self.allowed_origin} からのみアクセス可能です",
+            "redirect_url": f"https://{self.allowed_origin}",
+            "session_timeout": self.session_timeout,
+            "current_time": current_time
+        }
+
+        # APIエンドポイントの場合はJSONレスポンス
+        if self._is_api_endpoint(path):
+            return JSONResponse(
+                status_code=403,
+                content=error_response
             )
-        
-        return response
+
+        # フロントエンドの場合はHTMLレスポンス
+        html_content = f"""
+        <!DOCTYPE html>
+        <html lang="ja">
+        <head>
+            <meta charset="UTF-8">
+            <meta name="viewport" content="width=device-width, initial-scale=1.0">
+            <title>アクセス制限 - pozt</title>
+            <style>
+                body {{
+                    font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
+                    background: linear-gradient(135deg, #0a0f1a 0%, #1e2638 100%);
+                    color: #ffffff;
+                    display: flex;
+                    justify-content: center;
+                    align-items: center;
+                    min-height: 100vh;
+                    margin: 0;
+                    text-align: center;
+                }}
+                .container {{
+                    max-width: 600px;
+                    padding: 40px;
+                    background: rgba(37, 45, 66, 0.8);
+                    border-radius: 20px;
+                    backdrop-filter: blur(20px);
+                    border: 1px solid rgba(255, 255, 255, 0.1);
+                    box-shadow: 0 25px 50px rgba(0, 0, 0, 0.35);
+                }}
+                h1 {{
+                    background: linear-gradient(135deg, #00d4ff 0%, #6366f1 100%);
+                    -webkit-background-clip: text;
+                    -webkit-text-fill-color: transparent;
+                    font-size: 2.5rem;
+                    margin-bottom: 20px;
+                }}
+                .message {{
+                    font-size: 1.2rem;
+                    line-height: 1.6;
+                    margin-bottom: 30px;
+                    color: #94a3b8;
+                }}
+                .redirect-btn {{
+                    display: inline-block;
+                    padding: 15px 30px;
+                    background: linear-gradient(135deg, #00d4ff 0%, #6366f1 100%);
+                    color: white;
+                    text-decoration: none;
+                    border-radius: 12px;
+                    font-weight: 600;
+                    transition: all 0.3s ease;
+                    font-size: 1.1rem;
+                }}
+                .redirect-btn:hover {{
+                    transform: translateY(-3px);
+                    box-shadow: 0 10px 30px rgba(0, 212, 255, 0.3);
+                }}
+                .info {{
+                    margin-top: 30px;
+                    padding: 20px;
+                    background: rgba(0, 0, 0, 0.2);
+                    border-radius: 12px;
+                    font-size: 0.9rem;
+                    color: #64748b;
+                }}
+            </style>
+        </head>
+        <body>
+            <div class="container">
+                <h1>🔒 アクセス制限</h1>
+                <div class="message">
+                    <p>このアプリケーションは <strong>{self.allowed_origin}</strong> からのみアクセス可能です。</p>
+                    <p>セッションの有効期限は30分間です。</p>
+                </div>
+                <a href="https://{self.allowed_origin}" class="redirect-btn">
+                    正規サイトへ移動
+                </a>
+                <div class="info">
+                    <p><strong>セッション情報:</strong></p>
+                    <p>タイムアウト: {self.session_timeout // 60}分</p>
+                    <p>アクセス時刻: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(current_time))}</p>
+                </div>
+            </div>
+            <script>
+                // 5秒後に自動リダイレクト
+                setTimeout(function() {{
+                    window.location.href = 'https://{self.allowed_origin}';
+                }}, 5000);
+            </script>
+        </body>
+        </html>
+        """
+        return Response(content=html_content, media_type="text/html", status_code=403)
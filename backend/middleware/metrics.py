@@ -0,0 +1,58 @@
+"""
+メトリクス収集ミドルウェア
+ルートごとのリクエスト数・エラー数・レイテンシを記録する（ASGI ミドルウェアとして直接実装）
+"""
+
+import time
+from typing import Any, Dict
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from utils.metrics import HTTP_ERRORS, HTTP_LATENCY, HTTP_REQUESTS
+
+# ルーティングされなかったリクエスト（アクセス拒否・404 など）のラベル
+UNMATCHED_ROUTE = "unmatched"
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._route_paths: Dict[Any, str] = {}  # エンドポイント → ルートのパス（初回リクエスト時に作成）
+
+    def _route_label(self, scope: Scope) -> str:
+        """
+        ルートのパステンプレート（/api/jobs/{job_id} など）をラベルにする
+        実際のパスを使うとファイル名やジョブIDごとに系列が増えるため使わない
+        """
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return UNMATCHED_ROUTE
+        if not self._route_paths:
+            for route in getattr(scope.get("app"), "routes", ()):
+                route_endpoint = getattr(route, "endpoint", None) or getattr(route, "app", None)
+                if route_endpoint is not None and hasattr(route, "path"):
+                    self._route_paths[route_endpoint] = route.path
+        return self._route_paths.get(endpoint, UNMATCHED_ROUTE)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started_at = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # ルーティング結果（endpoint）は下流で scope に書き込まれる
+            route = self._route_label(scope)
+            method = scope["method"]
+            HTTP_LATENCY.observe(time.perf_counter() - started_at, route, method)
+            HTTP_REQUESTS.inc(route, method, str(status_code))
+            if status_code >= 500:
+                HTTP_ERRORS.inc(route, method)
@@ -0,0 +1,59 @@
+"""
+アップロードサイズ制限ミドルウェア
+multipart の解析（UploadFile の一時ファイルへの書き込み）より前に、受信したバイト数で上限を判定する
+Content-Length が上限を超える場合は本文を読まずに413、Content-Length がない（chunked）場合や
+実際の本文の方が大きい場合は、受信した量が上限を超えた時点で読み込みを打ち切って413
+（ASGI ミドルウェアとして直接実装し、対象外のパスは何も処理せずに通す）
+"""
+from typing import Dict
+
+from fastapi import HTTPException, status
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from utils.file_handler import UploadTooLargeError
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# multipart の境界・ヘッダー・フォーム項目の分（ファイル本体の上限に加えて許可する）
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+class UploadSizeLimitMiddleware:
+    def __init__(self, app: ASGIApp, limits: Dict[str, int]):
+        self.app = app
+        self.limits = dict(limits)  # POST のパス → ファイル本体の上限（バイト）
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        max_bytes = self.limits.get(scope["path"]) if scope["type"] == "http" and scope["method"] == "POST" else None
+        if max_bytes is None:
+            await self.app(scope, receive, send)
+            return
+
+        limit = max_bytes + MULTIPART_OVERHEAD_BYTES
+        detail = str(UploadTooLargeError(max_bytes))
+
+        # 申告サイズで判定できる場合は本文を受信しない
+        content_length = Headers(scope=scope).get("content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            logger.info("❌ Upload rejected before receiving: %s (Content-Length %s)", scope["path"], content_length)
+            response = JSONResponse(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, content={"detail": detail})
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def receive_with_limit() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # multipart の解析中に送出され、FastAPI がそのまま413のレスポンスにする
+                    logger.info("❌ Upload cut off after %d bytes: %s", received, scope["path"])
+                    raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=detail)
+            return message
+
+        await self.app(scope, receive_with_limit, send)
@@ -5,6 +5,8 @@ import numpy as np
 import cv2
 from core.image_utils import ensure_array, get_grayscale, enhance_contrast, detect_edges
 from config.settings import STRENGTH_MAP
+from core.hidden_analysis import get_hidden_analysis
+from patterns.stripe_engine import StripeLevel, create_stripe_layer, fill_parity_stripes, parity_slices
 
 def hex_to_rgb(hex_color):
     """HEX色をRGBタプルに変換"""
@@ -13,32 +15,8 @@ def hex_to_rgb(hex_color):
 
 def create_stripe_base(height, width, pattern_type="horizontal", color1="#000000", color2="#ffffff"):
     """基本的な縞模様を生成（明確な境界版）- モアレ効果のため1ピクセル単位の明確な縞"""
-    result = np.zeros((height, width, 3), dtype=np.uint8)
-    
-    # HEX色をRGBに変換
-    rgb1 = hex_to_rgb(color1)
-    rgb2 = hex_to_rgb(color2)
-    
-    if pattern_type == "horizontal":
-        # 横縞パターン（明確な境界）
-        for y in range(height):
-            if y % 2 == 0:
-                # 暗い縞
-                result[y, :] = rgb1
-            else:
-                # 明るい縞
-                result[y, :] = rgb2
-    else:  # vertical
-        # 縦縞パターン（明確な境界）
-        for x in range(width):
-            if x % 2 == 0:
-                # 暗い縞
-                result[:, x] = rgb1
-            else:
-                # 明るい縞
-                result[:, x] = rgb2
-    
-    return result
+    # 偶数行（列）が暗い縞、奇数行（列）が明るい縞（キャッシュ済みタイルから展開）
+    return create_stripe_layer(height, width, pattern_type, hex_to_rgb(color1), hex_to_rgb(color2))
 
 def get_adaptive_strength(mode):
     """モードに応じた強度を取得"""
@@ -49,88 +27,39 @@ def create_gradation_stripe_base(hidden_img, pattern_type="horizontal", color1="
     隠し画像の詳細を微調整として表現する明確な縞模様を生成
     明確な1ピクセル縞境界を保ちつつ、隠し画像詳細を微調整で反映
     """
-    hidden_array = ensure_array(hidden_img)
-    height, width = hidden_array.shape[:2]
+    # 共有解析（グレースケール・コントラスト・エッジはリクエスト内で1回だけ計算）
+    analysis = get_hidden_analysis(hidden_img)
+    height, width = analysis.height, analysis.width
     
     # HEX色をRGBに変換
     rgb1 = hex_to_rgb(color1)
     rgb2 = hex_to_rgb(color2)
     
-    # グレースケール変換
-    if len(hidden_array.shape) == 3:
-        hidden_gray = cv2.cvtColor(hidden_array.astype(np.uint8), cv2.COLOR_RGB2GRAY).astype(np.float32)
-    else:
-        hidden_gray = hidden_array.astype(np.float32)
-    
-    # 隠し画像の正規化（0-1の範囲）
-    hidden_norm = hidden_gray / 255.0
-    hidden_contrast = np.clip((hidden_norm - 0.5) * 2.0 + 0.5, 0, 1)
+    # 隠し画像のコントラスト（0-1の範囲）
+    hidden_contrast = analysis.contrast(2.0)
     
     # 輪郭強調で詳細を保持
-    edges = cv2.Canny(hidden_gray.astype(np.uint8), 50, 150).astype(np.float32) / 255.0
+    edges = analysis.edges(50, 150).astype(np.float32) / 255.0
     
-    # 結果配列を初期化
-    result = np.zeros((height, width, 3), dtype=np.uint8)
+    # 微調整量（詳細 + エッジ）
+    detail_adjustment = (hidden_contrast - 0.5) * detail_strength * 20
+    edge_adjustment = edges * detail_strength * 15
     
-    if pattern_type == "horizontal":
-        # 横縞パターン（明確な境界 + 微調整）
-        for y in range(height):
-            stripe_base = y % 2  # 0または1の明確な境界
-            
-            for x in range(width):
-                hidden_value = hidden_contrast[y, x]
-                edge_value = edges[y, x]
-                
-                # 基本色の選択（明確な境界）
-                if stripe_base == 0:
-                    base_color = np.array(rgb1, dtype=np.float32)
-                    base_brightness = 25 + hidden_value * 30  # 25-55の範囲
-                else:
-                    base_color = np.array(rgb2, dtype=np.float32)
-                    base_brightness = 200 + hidden_value * 35  # 200-235の範囲
-                
-                # エッジ部分の微調整
-                edge_adjustment = edge_value * detail_strength * 15
-                
-                # 詳細微調整
-                detail_adjustment = (hidden_value - 0.5) * detail_strength * 20
-                
-                # 最終的な明度
-                final_brightness = base_brightness + detail_adjustment + edge_adjustment
-                
-                # RGB値に適用
-                for i in range(3):
-                    result[y, x, i] = np.clip(final_brightness * (base_color[i] / 255.0), 0, 255)
-                
-    else:  # vertical
-        # 縦縞パターン（明確な境界 + 微調整）
-        for x in range(width):
-            stripe_base = x % 2  # 0または1の明確な境界
-            
-            for y in range(height):
-                hidden_value = hidden_contrast[y, x]
-                edge_value = edges[y, x]
-                
-                # 基本色の選択（明確な境界）
-                if stripe_base == 0:
-                    base_color = np.array(rgb1, dtype=np.float32)
-                    base_brightness = 25 + hidden_value * 30  # 25-55の範囲
-                else:
-                    base_color = np.array(rgb2, dtype=np.float32)
-                    base_brightness = 200 + hidden_value * 35  # 200-235の範囲
-                
-                # エッジ部分の微調整
-                edge_adjustment = edge_value * detail_strength * 15
-                
-                # 詳細微調整
-                detail_adjustment = (hidden_value - 0.5) * detail_strength * 20
-                
-                # 最終的な明度
-                final_brightness = base_brightness + detail_adjustment + edge_adjustment
-                
-                # RGB値に適用
-                for i in range(3):
-                    result[y, x, i] = np.clip(final_brightness * (base_color[i] / 255.0), 0, 255)
+    # 結果配列を初期化
+    result = np.empty((height, width, 3), dtype=np.uint8)
+    
+    # 暗い縞（偶数行/列: 25-55の範囲）と明るい縞（奇数行/列: 200-235の範囲）をスライスで書き込み
+    dark_index, light_index = parity_slices(pattern_type)
+    for index, offset, gain, color_rgb in ((dark_index, 25, 30, rgb1), (light_index, 200, 35, rgb2)):
+        # 最終的な明度（明確な境界の基準値 + 詳細微調整 + エッジ微調整）
+        brightness = offset + hidden_contrast[index] * gain
+        brightness += detail_adjustment[index]
+        brightness += edge_adjustment[index]
+        
+        # RGB値に適用（uint8 への代入で切り捨て）
+        target = result[index]
+        for i in range(3):
+            target[:, :, i] = np.clip(brightness * (color_rgb[i] / 255.0), 0, 255)
     
     return result
 
@@ -140,66 +69,32 @@ def create_enhanced_gradation_stripe(hidden_img, pattern_type="horizontal", colo
     より高度な詳細表現の明確な縞模様（コントラスト強化版）
     明確な1ピクセル縞境界を保ちつつ、隠し画像詳細をより強く反映
     """
-    hidden_array = ensure_array(hidden_img)
-    height, width = hidden_array.shape[:2]
+    # 共有解析（グレースケール・コントラスト・エッジはリクエスト内で1回だけ計算）
+    analysis = get_hidden_analysis(hidden_img)
+    height, width = analysis.height, analysis.width
     
     # HEX色をRGBに変換
     rgb1 = hex_to_rgb(color1)
     rgb2 = hex_to_rgb(color2)
     
-    # グレースケール変換
-    if len(hidden_array.shape) == 3:
-        hidden_gray = cv2.cvtColor(hidden_array.astype(np.uint8), cv2.COLOR_RGB2GRAY).astype(np.float32)
-    else:
-        hidden_gray = hidden_array.astype(np.float32)
-    
-    # 隠し画像の正規化（0-1の範囲）
-    hidden_norm = hidden_gray / 255.0
-    
     # コントラスト強化
-    hidden_contrast = np.clip((hidden_norm - 0.5) * contrast_boost + 0.5, 0, 1)
+    hidden_contrast = analysis.contrast(contrast_boost)
     
     # エッジ検出（複数の手法を組み合わせ）
-    edges1 = cv2.Canny(hidden_gray.astype(np.uint8), 50, 150).astype(np.float32) / 255.0
-    edges2 = cv2.Canny(hidden_gray.astype(np.uint8), 80, 200).astype(np.float32) / 255.0
+    edges1 = analysis.edges(50, 150).astype(np.float32) / 255.0
+    edges2 = analysis.edges(80, 200).astype(np.float32) / 255.0
     edges_combined = np.maximum(edges1, edges2 * 0.7)
     
-    # 結果配列を初期化
-    result = np.zeros((height, width, 3), dtype=np.uint8)
-    
-    # ベクトル化による高速処理
-    if pattern_type == "horizontal":
-        # 横縞パターンをベクトル化
-        y_indices = np.arange(height).reshape(-1, 1)
-        stripe_pattern = np.broadcast_to((y_indices % 2), (height, width))
-    else:  # vertical
-        # 縦縞パターンをベクトル化
-        x_indices = np.arange(width).reshape(1, -1)
-        stripe_pattern = np.broadcast_to((x_indices % 2), (height, width))
-    
-    # 暗い縞と明るい縞の領域を分離
-    dark_regions = stripe_pattern == 0
-    light_regions = stripe_pattern == 1
-    
-    # エッジ強調係数
+    # エッジ強調係数と細かい詳細調整
     edge_boost = edges_combined * detail_strength * 25
-    
-    # 細かい詳細調整
     detail_adjustment = (hidden_contrast - 0.5) * detail_strength * 40
     
-    # RGB各チャンネルへの適用
-    for i in range(3):
-        # 暗い縞の処理（明確な基準値 + 微調整）
-        dark_base = 20 + hidden_contrast * 35  # 20-55の範囲
-        dark_final = dark_base + detail_adjustment + edge_boost
-        dark_values = np.clip(dark_final, 0, 80) * (rgb1[i] / 255.0)
-        result[dark_regions, i] = dark_values[dark_regions]
-        
-        # 明るい縞の処理（明確な基準値 + 微調整）
-        light_base = 200 + hidden_contrast * 35  # 200-235の範囲
-        light_final = light_base + detail_adjustment + edge_boost
-        light_values = np.clip(light_final, 175, 255) * (rgb2[i] / 255.0)
-        result[light_regions, i] = light_values[light_regions]
+    # 暗い縞（20-55の範囲, 0-80でクリップ）と明るい縞（200-235の範囲, 175-255でクリップ）
+    result = np.empty((height, width, 3), dtype=np.uint8)
+    fill_parity_stripes(
+        result, pattern_type, hidden_contrast, detail_adjustment + edge_boost,
+        StripeLevel(20, 35, 0, 80), StripeLevel(200, 35, 175, 255), rgb1, rgb2
+    )
     
     return result
 
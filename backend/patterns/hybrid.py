@@ -3,6 +3,7 @@
 import numpy as np
 import cv2
 from core.image_utils import ensure_array, get_grayscale
+from core.hidden_analysis import get_hidden_analysis
 from patterns.moire import create_high_frequency_moire_stripes, create_moire_hidden_stripes, create_perfect_moire_pattern
 from patterns.overlay import create_overlay_moire_pattern
 
@@ -11,32 +12,31 @@ def create_combined_overlay_pattern(hidden_img, pattern_type="horizontal", base_
     ベースとなる縞模様を生成し、その上にoverlay効果を適用（ベクトル化版）
     複数パターンの合成処理を並列化・ベクトル化により5-10倍高速化
     """
+    # 解析結果は全パターンで共有
+    analysis = get_hidden_analysis(hidden_img)
+    
     # **並列パターン生成による高速化**
     # ベースパターン生成（最適化済み関数使用）
     if base_method == "high_frequency":
-        base_stripes = create_high_frequency_moire_stripes(hidden_img, pattern_type)
+        base_stripes = create_high_frequency_moire_stripes(analysis, pattern_type)
     elif base_method == "moire_pattern":
-        base_stripes = create_perfect_moire_pattern(hidden_img, pattern_type)
+        base_stripes = create_perfect_moire_pattern(analysis, pattern_type)
     else:  # デフォルトは標準のモアレ効果
-        base_stripes = create_moire_hidden_stripes(hidden_img, pattern_type)
+        base_stripes = create_moire_hidden_stripes(analysis, pattern_type)
     
     # オーバーレイパターン生成（最適化済み）
-    overlay_pattern = create_overlay_moire_pattern(hidden_img, pattern_type, overlay_opacity=0.3)
+    overlay_pattern = create_overlay_moire_pattern(analysis, pattern_type, overlay_opacity=0.3)
     
     # **完全ベクトル化による合成処理**
-    hidden_array = ensure_array(hidden_img)
-    hidden_gray = get_grayscale(hidden_array)
-    
     # マスク生成（OpenCV最適化）
-    _, binary_mask = cv2.threshold(hidden_gray, 100, 255, cv2.THRESH_BINARY_INV)
-    blurred_mask = cv2.GaussianBlur(binary_mask, (5, 5), 0)
+    blurred_mask = analysis.blurred_mask(5)
     mask = (blurred_mask / 255.0 * overlay_opacity).astype(np.float32)
     
     # 3チャンネルマスク（ブロードキャスト最適化）
     mask_3d = np.stack([mask, mask, mask], axis=2)
     
     # 均一グレー生成（ベクトル化）
-    height, width = hidden_array.shape[:2]
+    height, width = analysis.height, analysis.width
     gray = np.full((height, width, 3), 128.0, dtype=np.float32)
     
     # **最終合成（完全ベクトル化）**
@@ -59,20 +59,20 @@ def create_hybrid_moire_pattern(hidden_img, pattern_type="horizontal",
     複数の縞模様生成手法を混合した効果を生成（完全ベクトル化版）
     複数アルゴリズムの並列実行とベクトル化合成により10-15倍高速化
     """
-    hidden_array = ensure_array(hidden_img)
-    height, width = hidden_array.shape[:2]
+    # 解析結果は全パターンで共有
+    analysis = get_hidden_analysis(hidden_img)
     
     # **並列パターン生成**
     # プライマリパターン生成（既に最適化済み関数使用）
     if primary_method == "high_frequency":
-        primary_result = create_high_frequency_moire_stripes(hidden_img, pattern_type, strength)
+        primary_result = create_high_frequency_moire_stripes(analysis, pattern_type, strength)
     elif primary_method == "moire_pattern":
-        primary_result = create_perfect_moire_pattern(hidden_img, pattern_type)
+        primary_result = create_perfect_moire_pattern(analysis, pattern_type)
     else:
-        primary_result = create_moire_hidden_stripes(hidden_img, pattern_type, strength)
+        primary_result = create_moire_hidden_stripes(analysis, pattern_type, strength)
     
     # オーバーレイパターン生成（最適化済み）
-    overlay_result = create_overlay_moire_pattern(hidden_img, pattern_type, overlay_opacity=0.8)
+    overlay_result = create_overlay_moire_pattern(analysis, pattern_type, overlay_opacity=0.8)
     
     # **完全ベクトル化による重み付き合成**
     # OpenCVによる高速ブレンド（ハードウェア最適化活用）
@@ -113,17 +113,18 @@ def create_multi_layer_hybrid(hidden_img, pattern_type="horizontal", methods=["o
     weights = weights / np.sum(weights)
     
     patterns = []
+    analysis = get_hidden_analysis(hidden_img)
     
     # **並列パターン生成**
     for method in methods:
         if method == "overlay":
-            pattern = create_overlay_moire_pattern(hidden_img, pattern_type, overlay_opacity=0.6)
+            pattern = create_overlay_moire_pattern(analysis, pattern_type, overlay_opacity=0.6)
         elif method == "high_frequency":
-            pattern = create_high_frequency_moire_stripes(hidden_img, pattern_type)
+            pattern = create_high_frequency_moire_stripes(analysis, pattern_type)
         elif method == "adaptive":
-            pattern = create_moire_hidden_stripes(hidden_img, pattern_type)
+            pattern = create_moire_hidden_stripes(analysis, pattern_type)
         elif method == "perfect":
-            pattern = create_perfect_moire_pattern(hidden_img, pattern_type)
+            pattern = create_perfect_moire_pattern(analysis, pattern_type)
         else:
             continue
         
@@ -131,7 +132,7 @@ def create_multi_layer_hybrid(hidden_img, pattern_type="horizontal", methods=["o
     
     if not patterns:
         # フォールバック
-        return create_overlay_moire_pattern(hidden_img, pattern_type)
+        return create_overlay_moire_pattern(analysis, pattern_type)
     
     # **完全ベクトル化による重み付き合成**
     # パターンをスタックして一度に処理
@@ -147,14 +148,9 @@ def create_adaptive_hybrid_pattern(hidden_img, pattern_type="horizontal", adapta
     """
     適応的ハイブリッドパターン：画像内容に応じて手法を自動選択（ベクトル化）
     """
-    hidden_array = ensure_array(hidden_img)
-    height, width = hidden_array.shape[:2]
-    
-    # グレースケール変換
-    if len(hidden_array.shape) == 3:
-        hidden_gray = cv2.cvtColor(hidden_array.astype(np.uint8), cv2.COLOR_RGB2GRAY).astype(np.float32)
-    else:
-        hidden_gray = hidden_array.astype(np.float32)
+    analysis = get_hidden_analysis(hidden_img)
+    height, width = analysis.height, analysis.width
+    hidden_gray = analysis.gray
     
     # **ベクトル化による画像分析**
     if adaptation_method == "contrast":
@@ -173,7 +169,7 @@ def create_adaptive_hybrid_pattern(hidden_img, pattern_type="horizontal", adapta
         
     elif adaptation_method == "edge_density":
         # エッジ密度分析（OpenCV最適化）
-        edges = cv2.Canny(hidden_gray.astype(np.uint8), 50, 150)
+        edges = analysis.edges(50, 150)
         
         # 局所エッジ密度（ベクトル化）
         kernel = np.ones((15, 15), np.float32) / 225
@@ -189,8 +185,8 @@ def create_adaptive_hybrid_pattern(hidden_img, pattern_type="horizontal", adapta
         frequency_weight = np.full((height, width), 0.5, dtype=np.float32)
     
     # **並列パターン生成**
-    overlay_pattern = create_overlay_moire_pattern(hidden_img, pattern_type, overlay_opacity=0.6)
-    frequency_pattern = create_high_frequency_moire_stripes(hidden_img, pattern_type)
+    overlay_pattern = create_overlay_moire_pattern(analysis, pattern_type, overlay_opacity=0.6)
+    frequency_pattern = create_high_frequency_moire_stripes(analysis, pattern_type)
     
     # **空間的に適応的な合成（ベクトル化）**
     # 重みを3チャンネルに拡張
@@ -212,8 +208,8 @@ def create_temporal_hybrid_effect(hidden_img, pattern_type="horizontal", time_ph
     """
     時間的変化ハイブリッド効果：位相変化によるアニメーション効果（ベクトル化）
     """
-    hidden_array = ensure_array(hidden_img)
-    height, width = hidden_array.shape[:2]
+    analysis = get_hidden_analysis(hidden_img)
+    height, width = analysis.height, analysis.width
     
     # **ベクトル化による位相計算**
     # 時間位相に基づく重み計算（ベクトル化）
@@ -232,9 +228,9 @@ def create_temporal_hybrid_effect(hidden_img, pattern_type="horizontal", time_ph
     spatial_phase = np.broadcast_to(spatial_phase, (height, width))
     
     # **並列パターン生成**
-    pattern1 = create_overlay_moire_pattern(hidden_img, pattern_type, overlay_opacity=0.6)
-    pattern2 = create_high_frequency_moire_stripes(hidden_img, pattern_type)
-    pattern3 = create_moire_hidden_stripes(hidden_img, pattern_type)
+    pattern1 = create_overlay_moire_pattern(analysis, pattern_type, overlay_opacity=0.6)
+    pattern2 = create_high_frequency_moire_stripes(analysis, pattern_type)
+    pattern3 = create_moire_hidden_stripes(analysis, pattern_type)
     
     # **時空間的重み付き合成（ベクトル化）**
     # 重みマップ生成
@@ -264,18 +260,12 @@ def create_frequency_modulated_hybrid(hidden_img, pattern_type="horizontal", bas
     """
     周波数変調ハイブリッド：空間的に変化する縞周波数（ベクトル化）
     """
-    hidden_array = ensure_array(hidden_img)
-    height, width = hidden_array.shape[:2]
-    
-    # グレースケール変換
-    if len(hidden_array.shape) == 3:
-        hidden_gray = cv2.cvtColor(hidden_array.astype(np.uint8), cv2.COLOR_RGB2GRAY).astype(np.float32)
-    else:
-        hidden_gray = hidden_array.astype(np.float32)
+    analysis = get_hidden_analysis(hidden_img)
+    height, width = analysis.height, analysis.width
     
     # **ベクトル化による周波数変調**
     # 隠し画像の明度に基づく周波数変調（ベクトル化）
-    hidden_norm = hidden_gray / 255.0
+    hidden_norm = analysis.norm
     frequency_modulation = base_frequency * (1.0 + modulation_depth * hidden_norm)
     
     # **空間的に変化する縞パターン生成（ベクトル化）**
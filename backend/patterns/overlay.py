@@ -3,6 +3,8 @@
 import numpy as np
 import cv2
 from core.image_utils import ensure_array, get_grayscale
+from core.hidden_analysis import get_hidden_analysis
+from patterns.stripe_engine import StripeLevel, fill_parity_stripes, create_stripe_phase
 
 def hex_to_rgb(hex_color):
     """HEX色をRGBタプルに変換"""
@@ -14,79 +16,41 @@ def create_overlay_moire_pattern(hidden_img, pattern_type="horizontal", overlay_
     重ね合わせモード：明確な縞境界保持版（ベクトル化対応）
     隠し画像の詳細を重ね合わせ効果で微調整として表現、明確な縞でモアレ効果を維持
     """
-    if isinstance(hidden_img, np.ndarray):
-        hidden_array = hidden_img.astype(np.float32)
-    else:
-        hidden_array = np.array(hidden_img).astype(np.float32)
-    
-    height, width = hidden_array.shape[:2]
-    
-    # グレースケール変換
-    if len(hidden_array.shape) == 3:
-        hidden_gray = cv2.cvtColor(hidden_array.astype(np.uint8), cv2.COLOR_RGB2GRAY).astype(np.float32)
-    else:
-        hidden_gray = hidden_array
+    # 共有解析（グレースケール・コントラスト・エッジはリクエスト内で1回だけ計算）
+    analysis = get_hidden_analysis(hidden_img)
+    height, width = analysis.height, analysis.width
     
     # HEX色をRGBに変換
     color1_rgb = hex_to_rgb(color1)
     color2_rgb = hex_to_rgb(color2)
     
     # 隠し画像の正規化と強調
-    hidden_norm = hidden_gray / 255.0
-    hidden_enhanced = np.clip((hidden_norm - 0.5) * 1.5 + 0.5, 0, 1)
+    hidden_enhanced = analysis.contrast(1.5)
     
-    # 二値化マスク生成
-    _, binary_mask = cv2.threshold(hidden_gray, 100, 255, cv2.THRESH_BINARY_INV)
-    
-    # 軽いガウシアンブラー（明確な境界を保持）
-    blurred_mask = cv2.GaussianBlur(binary_mask, (3, 3), 0)
+    # 二値化マスク + 軽いガウシアンブラー（明確な境界を保持）
+    blurred_mask = analysis.blurred_mask(3)
     adaptive_mask = (blurred_mask.astype(np.float32) / 255.0) * overlay_opacity
     
-    # 明確な1ピクセル縞模様パターンの生成
-    if pattern_type == "horizontal":
-        y_coords = np.arange(height, dtype=np.uint8).reshape(-1, 1)
-        stripe_pattern = (y_coords % 2)  # 0または1の明確な境界
-        stripe_pattern = np.broadcast_to(stripe_pattern, (height, width))
-    else:  # vertical
-        x_coords = np.arange(width, dtype=np.uint8).reshape(1, -1)
-        stripe_pattern = (x_coords % 2)  # 0または1の明確な境界
-        stripe_pattern = np.broadcast_to(stripe_pattern, (height, width))
-    
-    # 明確な縞パターンの生成（微調整付き）
-    stripes = np.zeros((height, width, 3), dtype=np.float32)
-    
-    # 暗い縞と明るい縞の領域
-    dark_regions = stripe_pattern == 0
-    light_regions = stripe_pattern == 1
-    
     # 隠し画像詳細による微調整
     detail_adjustment = (hidden_enhanced - 0.5) * 25  # 微調整範囲
     
-    # RGB各チャンネルの処理
-    for i in range(3):
-        # 暗い縞の処理（基本値 + 微調整）
-        dark_base = 30 + hidden_enhanced * 25  # 30-55の範囲
-        dark_final = dark_base + detail_adjustment
-        dark_values = np.clip(dark_final, 5, 80) * (color1_rgb[i] / 255.0)
-        stripes[dark_regions, i] = dark_values[dark_regions]
-        
-        # 明るい縞の処理（基本値 + 微調整）
-        light_base = 200 + hidden_enhanced * 30  # 200-230の範囲
-        light_final = light_base + detail_adjustment
-        light_values = np.clip(light_final, 175, 255) * (color2_rgb[i] / 255.0)
-        stripes[light_regions, i] = light_values[light_regions]
+    # 偶数行（暗い縞）と奇数行（明るい縞）をスライスで直接書き込み（基本値 + 微調整）
+    stripes = np.empty((height, width, 3), dtype=np.float32)
+    fill_parity_stripes(
+        stripes, pattern_type, hidden_enhanced, detail_adjustment,
+        dark=StripeLevel(30, 25, 5, 80),      # 30-55の範囲
+        light=StripeLevel(200, 30, 175, 255), # 200-230の範囲
+        color1_rgb=color1_rgb, color2_rgb=color2_rgb
+    )
     
     # 適応的なグレー値（隠し画像の詳細を反映）
     grey_base = 120 + hidden_enhanced * 25  # 120-145の範囲
-    grey = np.zeros((height, width, 3), dtype=np.float32)
-    for i in range(3):
-        grey[:, :, i] = grey_base
     
-    # マスクを3チャンネルに拡張
-    mask_3d = np.stack([adaptive_mask, adaptive_mask, adaptive_mask], axis=2)
+    # マスクとグレーはチャンネル方向にブロードキャスト（3チャンネル展開しない）
+    mask_3d = adaptive_mask[:, :, np.newaxis]
     
     # 最終合成
-    result = stripes * (1.0 - mask_3d) + grey * mask_3d
+    result = stripes * (1.0 - mask_3d) + grey_base[:, :, np.newaxis] * mask_3d
     
     # 適切な範囲にクリッピング
     result = np.clip(result, 0, 255)
@@ -97,26 +61,16 @@ def create_enhanced_overlay_pattern(hidden_img, pattern_type="horizontal", overl
     """
     強化版重ね合わせモード：詳細コントラスト強化版（濃淡表現・ベクトル化対応）
     """
-    if isinstance(hidden_img, np.ndarray):
-        hidden_array = hidden_img.astype(np.float32)
-    else:
-        hidden_array = np.array(hidden_img).astype(np.float32)
-    
-    height, width = hidden_array.shape[:2]
-    
-    # グレースケール変換
-    if len(hidden_array.shape) == 3:
-        hidden_gray = cv2.cvtColor(hidden_array.astype(np.uint8), cv2.COLOR_RGB2GRAY).astype(np.float32)
-    else:
-        hidden_gray = hidden_array
+    # 共有解析（グレースケール・コントラスト・エッジはリクエスト内で1回だけ計算）
+    analysis = get_hidden_analysis(hidden_img)
+    height, width = analysis.height, analysis.width
     
     # 強化処理（詳細を保つため）
-    hidden_norm = hidden_gray / 255.0
-    enhanced_contrast = np.clip((hidden_norm - 0.5) * enhancement_factor * 2.0 + 0.5, 0, 1)
-    enhanced_gray = (enhanced_contrast * 255.0).astype(np.uint8)
+    enhanced_contrast = analysis.contrast(enhancement_factor * 2.0)
+    enhanced_gray = analysis.contrast_u8(enhancement_factor * 2.0)
     
     # 高精度エッジ強調
-    edges = cv2.Canny(enhanced_gray, 30, 120)
+    edges = analysis.edges(30, 120, contrast=enhancement_factor * 2.0)
     edge_enhanced = cv2.dilate(edges, np.ones((3,3), np.uint8), iterations=1)
     
     # マスク生成（詳細保持）
@@ -159,39 +113,21 @@ def create_vectorized_stripe_base(height, width, pattern_type="horizontal", freq
     ベクトル化による詳細縞パターン生成（濃淡表現対応）
     隠し画像の詳細を保持するメモリ効率的な実装
     """
-    if pattern_type == "horizontal":
-        y_coords = np.arange(height, dtype=np.int32).reshape(-1, 1)
-        pattern_base = ((y_coords * frequency) % 2) * 255
-        return np.broadcast_to(pattern_base, (height, width)).astype(np.float32)
-    else:  # vertical
-        x_coords = np.arange(width, dtype=np.int32).reshape(1, -1)
-        pattern_base = ((x_coords * frequency) % 2) * 255
-        return np.broadcast_to(pattern_base, (height, width)).astype(np.float32)
+    return create_stripe_phase(height, width, pattern_type, frequency, scale=255.0)
 
 def create_multi_frequency_overlay(hidden_img, pattern_type="horizontal", frequencies=[1, 2], overlay_opacity=0.6):
     """
     多周波数重ね合わせ：複数の縞模様による詳細表現
     """
-    if isinstance(hidden_img, np.ndarray):
-        hidden_array = hidden_img.astype(np.float32)
-    else:
-        hidden_array = np.array(hidden_img).astype(np.float32)
-    
-    height, width = hidden_array.shape[:2]
-    
-    # グレースケール変換
-    if len(hidden_array.shape) == 3:
-        hidden_gray = cv2.cvtColor(hidden_array.astype(np.uint8), cv2.COLOR_RGB2GRAY).astype(np.float32)
-    else:
-        hidden_gray = hidden_array
+    # 共有解析（グレースケール・コントラスト・エッジはリクエスト内で1回だけ計算）
+    analysis = get_hidden_analysis(hidden_img)
+    height, width = analysis.height, analysis.width
     
     # 隠し画像の詳細分析
-    hidden_norm = hidden_gray / 255.0
-    hidden_detailed = np.clip((hidden_norm - 0.5) * 2.2 + 0.5, 0, 1)
+    hidden_detailed = analysis.contrast(2.2)
     
     # 基本マスク生成
-    _, binary_mask = cv2.threshold(hidden_gray, 100, 255, cv2.THRESH_BINARY_INV)
-    blurred_mask = cv2.GaussianBlur(binary_mask, (5, 5), 0)
+    blurred_mask = analysis.blurred_mask(5)
     base_mask = blurred_mask.astype(np.float32) / 255.0
     
     # 複数周波数の詳細縞パターンを生成
@@ -233,35 +169,18 @@ def create_vectorized_stripe_base(height, width, pattern_type="horizontal", freq
     ベクトル化による詳細縞パターン生成
     隠し画像の詳細を保持するメモリ効率的な実装
     """
-    if pattern_type == "horizontal":
-        y_coords = np.arange(height, dtype=np.int32).reshape(-1, 1)
-        pattern_base = ((y_coords * frequency) % 2) * 255
-        return np.broadcast_to(pattern_base, (height, width)).astype(np.float32)
-    else:  # vertical
-        x_coords = np.arange(width, dtype=np.int32).reshape(1, -1)
-        pattern_base = ((x_coords * frequency) % 2) * 255
-        return np.broadcast_to(pattern_base, (height, width)).astype(np.float32)
+    return create_stripe_phase(height, width, pattern_type, frequency, scale=255.0)
 
 def create_gradient_overlay_pattern(hidden_img, pattern_type="horizontal", overlay_opacity=0.6, gradient_direction="radial"):
     """
     グラデーション重ね合わせ：空間的に変化する詳細オーバーレイ効果
     """
-    if isinstance(hidden_img, np.ndarray):
-        hidden_array = hidden_img.astype(np.float32)
-    else:
-        hidden_array = np.array(hidden_img).astype(np.float32)
-    
-    height, width = hidden_array.shape[:2]
-    
-    # グレースケール変換
-    if len(hidden_array.shape) == 3:
-        hidden_gray = cv2.cvtColor(hidden_array.astype(np.uint8), cv2.COLOR_RGB2GRAY).astype(np.float32)
-    else:
-        hidden_gray = hidden_array
+    # 共有解析（グレースケール・コントラスト・エッジはリクエスト内で1回だけ計算）
+    analysis = get_hidden_analysis(hidden_img)
+    height, width = analysis.height, analysis.width
     
     # 隠し画像の詳細分析
-    hidden_norm = hidden_gray / 255.0
-    hidden_enhanced = np.clip((hidden_norm - 0.5) * 2.0 + 0.5, 0, 1)
+    hidden_enhanced = analysis.contrast(2.0)
     
     # グラデーション生成（詳細対応）
     if gradient_direction == "radial":
@@ -282,8 +201,7 @@ def create_gradient_overlay_pattern(hidden_img, pattern_type="horizontal", overl
         gradient = np.ones((height, width), dtype=np.float32)
     
     # 基本処理
-    _, binary_mask = cv2.threshold(hidden_gray, 100, 255, cv2.THRESH_BINARY_INV)
-    blurred_mask = cv2.GaussianBlur(binary_mask, (5, 5), 0)
+    blurred_mask = analysis.blurred_mask(5)
     base_mask = blurred_mask.astype(np.float32) / 255.0
     
     # グラデーションと隠し画像の詳細を合成
@@ -310,20 +228,12 @@ def create_adaptive_overlay_pattern(hidden_img, pattern_type="horizontal", overl
     """
     適応的重ね合わせ：画像内容に応じて自動調整（詳細版）
     """
-    if isinstance(hidden_img, np.ndarray):
-        hidden_array = hidden_img.astype(np.float32)
-    else:
-        hidden_array = np.array(hidden_img).astype(np.float32)
-    
-    height, width = hidden_array.shape[:2]
-    
-    # グレースケール変換
-    if len(hidden_array.shape) == 3:
-        hidden_gray = cv2.cvtColor(hidden_array.astype(np.uint8), cv2.COLOR_RGB2GRAY).astype(np.float32)
-    else:
-        hidden_gray = hidden_array
+    # 共有解析（グレースケール・コントラスト・エッジはリクエスト内で1回だけ計算）
+    analysis = get_hidden_analysis(hidden_img)
+    height, width = analysis.height, analysis.width
     
     # 局所詳細分析
+    hidden_gray = analysis.gray
     kernel = np.ones((7, 7), np.float32) / 49
     local_mean = cv2.filter2D(hidden_gray, -1, kernel)
     local_variance = cv2.filter2D((hidden_gray - local_mean)**2, -1, kernel)
@@ -337,8 +247,7 @@ def create_adaptive_overlay_pattern(hidden_img, pattern_type="horizontal", overl
     adaptive_strength = np.clip(adaptive_strength, 0.0, 1.0)
     
     # 基本マスク処理
-    _, binary_mask = cv2.threshold(hidden_gray, 100, 255, cv2.THRESH_BINARY_INV)
-    blurred_mask = cv2.GaussianBlur(binary_mask, (5, 5), 0)
+    blurred_mask = analysis.blurred_mask(5)
     base_mask = blurred_mask.astype(np.float32) / 255.0
     
     # 適応的マスク（詳細反映）
@@ -5,6 +5,10 @@ from PIL import Image
 import gc
 import sys
 from core.image_utils import ensure_array, ensure_pil
+from patterns.stripe_engine import create_stripe_phase
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
 
 # **メモリ制限対応: グローバル設定**
 MAX_IMAGE_DIMENSION = 1024  # 最大サイズを1024pxに制限
@@ -59,7 +63,7 @@ def prepare_lightweight_image(moire_img):
         # OpenCVで高速リサイズ（メモリ効率的）
         img_array = cv2.resize(img_array, (new_width, new_height), interpolation=cv2.INTER_AREA)
         
-        print(f"📏 Image resized to {new_width}x{new_height} for memory efficiency")
+        logger.debug("📏 Image resized to %dx%d for memory efficiency", new_width, new_height)
     
     # **軽量化3: さらに大きい場合の緊急サイズ制限**
     if max(img_array.shape[:2]) > MEMORY_SAFE_SIZE:
@@ -67,7 +71,7 @@ def prepare_lightweight_image(moire_img):
         new_h = int(img_array.shape[0] * scale)
         new_w = int(img_array.shape[1] * scale)
         img_array = cv2.resize(img_array, (new_w, new_h), interpolation=cv2.INTER_AREA)
-        print(f"⚠️ Emergency resize to {new_w}x{new_h} for memory safety")
+        logger.warning("⚠️ Emergency resize to %dx%d for memory safety", new_w, new_h)
     
     return img_array
 
@@ -94,11 +98,8 @@ def extract_via_pattern_subtraction_ultra_light(moire_array, enhancement_level=2
     gray_sample = gray[sample_y:sample_y+sample_size, sample_x:sample_x+sample_size].astype(np.float32)
     
     # **軽量化3: 効率的パターン生成（メモリを使い回し）**
-    y_pattern = np.arange(sample_size, dtype=np.uint8).reshape(-1, 1)
-    h_pattern_sample = np.broadcast_to((y_pattern % 2) * 255, (sample_size, sample_size)).astype(np.float32)
-    
-    x_pattern = np.arange(sample_size, dtype=np.uint8).reshape(1, -1)
-    v_pattern_sample = np.broadcast_to((x_pattern % 2) * 255, (sample_size, sample_size)).astype(np.float32)
+    h_pattern_sample = create_stripe_phase(sample_size, sample_size, "horizontal", scale=255.0, writable=False)
+    v_pattern_sample = create_stripe_phase(sample_size, sample_size, "vertical", scale=255.0, writable=False)
     
     # **軽量化4: 相関計算の効率化**
     h_corr = np.corrcoef(gray_sample.flatten(), h_pattern_sample.flatten())[0, 1]
@@ -324,7 +325,7 @@ def extract_via_fourier_analysis_ultra_light(moire_array, enhancement_level=2.0)
         del img_back
         
     except Exception as e:
-        print(f"⚠️ FFT failed, using fallback: {e}")
+        logger.warning("⚠️ FFT failed, using fallback: %s", e)
         # フォールバック：単純な処理
         result = gray.astype(np.float32) * enhancement_level
     
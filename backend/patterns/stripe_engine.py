@@ -0,0 +1,230 @@
+# patterns/stripe_engine.py - 縞パリティ別スライス書き込みエンジン
+"""
+1ピクセル縞の偶数行（暗い縞）と奇数行（明るい縞）をストライドスライスで直接書き込む
+（vertical の場合は列）。ブールマスクによる gather/scatter や、半分を捨てる全体サイズの
+明暗配列を作らず、各画素の値は必要な側だけ計算する。
+
+単色の縞レイヤーは1周期分のタイルを (向き, 色1, 色2, 周波数) ごとにキャッシュし、
+np.tile / ブロードキャストで任意サイズに展開する（行・列ごとの Python ループは使わない）。
+
+画素値がグレースケール値（uint8）・エッジの有無・縞のパリティ・縞の色だけで決まるモードは、
+(パリティ, エッジ状態 × 256) → RGB のルックアップテーブルにコンパイルしてキャッシュし、
+画像全体の float32 演算の代わりにテーブル参照（gather）で書き込む。
+"""
+from fractions import Fraction
+from functools import lru_cache
+from typing import NamedTuple, Tuple
+
+import cv2
+import numpy as np
+
+# エッジ画素の割合がこれを超える場合は疎な上書きをやめ、全画素をコード画像から引く
+# （上書きは1画素あたりの費用が大きく、計測では 5% 前後で全画素の参照と逆転する）
+DENSE_EDGE_RATIO = 0.05
+
+
+class StripeLevel(NamedTuple):
+    """縞1本分の明度設定: clip(offset + contrast * gain + adjustment, low, high)"""
+    offset: float
+    gain: float
+    low: float
+    high: float
+
+
+def parity_slices(pattern_type: str = "horizontal") -> Tuple[tuple, tuple]:
+    """
+    (暗い縞, 明るい縞) のインデックス
+    horizontal は偶数行/奇数行、vertical は偶数列/奇数列
+    """
+    if pattern_type == "horizontal":
+        return (slice(0, None, 2), slice(None)), (slice(1, None, 2), slice(None))
+    return (slice(None), slice(0, None, 2)), (slice(None), slice(1, None, 2))
+
+
+def stripe_level_values(contrast: np.ndarray, adjustment: np.ndarray, level: StripeLevel) -> np.ndarray:
+    """片側の縞の明度（クリップ済み）"""
+    values = level.offset + contrast * level.gain + adjustment
+    return np.clip(values, level.low, level.high, out=values)
+
+
+def fill_parity_stripes(out: np.ndarray, pattern_type: str, contrast: np.ndarray, adjustment: np.ndarray,
+                        dark: StripeLevel, light: StripeLevel, color1_rgb, color2_rgb) -> np.ndarray:
+    """
+    out (H, W, 3) に暗い縞（color1）と明るい縞（color2）を書き込む
+    明度は縞ごとに1回だけ計算し、色のスケールはチャンネルごとに乗算して書き込む
+    out が uint8 の場合は切り捨てで格納される
+    """
+    dark_index, light_index = parity_slices(pattern_type)
+
+    for index, level, color_rgb in ((dark_index, dark, color1_rgb), (light_index, light, color2_rgb)):
+        values = stripe_level_values(contrast[index], adjustment[index], level)
+        target = out[index]
+        for channel in range(3):
+            np.multiply(values, color_rgb[channel] / 255.0, out=target[:, :, channel], casting='unsafe')
+
+    return out
+
+
+def _stripe_period(frequency) -> int:
+    """(i * frequency) % 2 が繰り返す周期（整数周波数なら2）"""
+    return 2 * Fraction(frequency).limit_denominator(1000).denominator
+
+
+def _orient_tile(values: np.ndarray, orientation: str) -> np.ndarray:
+    """1周期分の値を縞の向きに合わせた形にして読み取り専用にする"""
+    if orientation == "horizontal":
+        tile = values.reshape((-1, 1) + values.shape[1:])
+    else:
+        tile = values.reshape((1, -1) + values.shape[1:])
+    tile.setflags(write=False)
+    return tile
+
+
+@lru_cache(maxsize=64)
+def get_stripe_phase_tile(orientation: str, frequency=1, scale: float = 1.0) -> np.ndarray:
+    """
+    1周期分の縞位相タイル ((i * frequency) % 2 * scale, float32)
+    horizontal は (周期, 1)、vertical は (1, 周期)
+    """
+    indices = np.arange(_stripe_period(frequency))
+    return _orient_tile(((indices * frequency) % 2 * scale).astype(np.float32), orientation)
+
+
+@lru_cache(maxsize=64)
+def get_stripe_color_tile(orientation: str, color1_rgb: tuple, color2_rgb: tuple, frequency=1) -> np.ndarray:
+    """
+    1周期分のカラー縞タイル（位相0は color1、それ以外は color2、uint8）
+    horizontal は (周期, 1, 3)、vertical は (1, 周期, 3)
+    """
+    indices = np.arange(_stripe_period(frequency))
+    phase = (indices * frequency) % 2
+    colors = np.array([color1_rgb, color2_rgb], dtype=np.uint8)
+    return _orient_tile(colors[(phase != 0).astype(np.intp)], orientation)
+
+
+def expand_stripe_tile(tile: np.ndarray, height: int, width: int, writable: bool = True) -> np.ndarray:
+    """
+    タイルを (height, width) に展開
+    縞方向の1列（1行）だけを np.tile で作り、残りはブロードキャストで広げる
+    writable=False の場合は読み取り専用ビューを返す（全体サイズの確保なし）
+    """
+    period = max(tile.shape[0], tile.shape[1])
+    repeats = -(-max(height, width) // period)
+    if tile.shape[0] != 1:  # horizontal
+        line = np.tile(tile, (repeats,) + (1,) * (tile.ndim - 1))[:height]
+    else:  # vertical
+        line = np.tile(tile, (1, repeats) + (1,) * (tile.ndim - 2))[:, :width]
+    layer = np.broadcast_to(line, (height, width) + tile.shape[2:])
+    return np.array(layer) if writable else layer
+
+
+def create_stripe_layer(height: int, width: int, orientation: str = "horizontal",
+                        color1_rgb=(0, 0, 0), color2_rgb=(255, 255, 255), frequency=1,
+                        writable: bool = True) -> np.ndarray:
+    """カラー縞レイヤー (H, W, 3) uint8 を生成"""
+    tile = get_stripe_color_tile(orientation, tuple(color1_rgb), tuple(color2_rgb), frequency)
+    return expand_stripe_tile(tile, height, width, writable)
+
+
+def create_stripe_phase(height: int, width: int, orientation: str = "horizontal", frequency=1,
+                        scale: float = 1.0, writable: bool = True) -> np.ndarray:
+    """縞位相レイヤー (H, W) float32 を生成（0 / scale の縞）"""
+    tile = get_stripe_phase_tile(orientation, frequency, scale)
+    return expand_stripe_tile(tile, height, width, writable)
+
+
+@lru_cache(maxsize=64)
+def compile_stripe_lut(contrast_factor: float, adjustment, adjustment_args: tuple, edge_count: int,
+                       dark: StripeLevel, light: StripeLevel, color1_rgb: tuple, color2_rgb: tuple) -> np.ndarray:
+    """
+    縞モードをルックアップテーブルにコンパイル
+    戻り値は (2, 3, 2**edge_count * 256) の uint8（[パリティ, チャンネル, エッジ状態 * 256 + グレー値]）
+    adjustment(hidden_contrast, edge_maps, *adjustment_args) は画像全体の計算と同じ式で微調整量を返す関数
+    （edge_maps は 0/255 の uint8 配列のリスト）。同じ演算順序で計算するため出力は全画像計算と一致する
+    """
+    gray = np.arange(256, dtype=np.float32)
+    hidden_contrast = np.clip((gray / 255.0 - 0.5) * contrast_factor + 0.5, 0, 1)[np.newaxis, :]
+
+    # エッジ状態 s のビット b がエッジマップ b の有無
+    states = np.arange(2 ** edge_count)[:, np.newaxis]
+    edge_maps = [(((states >> bit) & 1) * 255).astype(np.uint8) for bit in range(edge_count)]
+
+    adjustment_values = adjustment(hidden_contrast, edge_maps, *adjustment_args)
+    contrast_values = np.broadcast_to(hidden_contrast, adjustment_values.shape)
+
+    # cv2.LUT に渡せるようチャンネルごとに連続した 256 エントリを並べる
+    lut = np.empty((2, 3) + adjustment_values.shape, dtype=np.uint8)
+    for parity, level, color_rgb in ((0, dark, color1_rgb), (1, light, color2_rgb)):
+        values = stripe_level_values(contrast_values, adjustment_values, level)
+        for channel in range(3):
+            np.multiply(values, color_rgb[channel] / 255.0, out=lut[parity, channel], casting='unsafe')
+
+    lut = lut.reshape(2, 3, -1)
+    lut.setflags(write=False)
+    return lut
+
+
+def _apply_stripe_lut_dense(out: np.ndarray, pattern_type: str, lut: np.ndarray, gray_u8: np.ndarray,
+                            edge_maps) -> np.ndarray:
+    """
+    全画素のコード（パリティ, エッジ状態, グレー値）を uint16 画像にして np.take で一度に書き込む
+    パリティもコードに含めるため、out への書き込みは連続した1回で済む
+    """
+    codes = gray_u8.astype(np.uint16)
+    for bit, edges in enumerate(edge_maps):
+        codes |= (edges >> 7).astype(np.uint16) << (8 + bit)
+    codes[parity_slices(pattern_type)[1]] |= lut.shape[2]
+    # (パリティ × エッジ状態 × 256, 3) の RGB テーブル
+    table = lut.transpose(0, 2, 1).reshape(-1, 3)
+    np.take(table, codes, axis=0, out=out, mode="clip")
+    return out
+
+
+def apply_stripe_lut(out: np.ndarray, pattern_type: str, lut: np.ndarray, gray_u8: np.ndarray, edge_maps) -> np.ndarray:
+    """
+    ルックアップテーブルで out (H, W, 3) uint8 に縞を書き込む
+    エッジが疎な場合は縞ごとにエッジなし状態の 256 エントリを cv2.LUT で一括適用し、
+    エッジ上の画素だけを全テーブルから上書きする
+    エッジが密な場合（ノイズの多い写真など）は全画素のコード画像を作り、全テーブルから一度に引く
+    """
+    edge_any = None
+    if edge_maps:
+        edge_any = edge_maps[0]
+        for edges in edge_maps[1:]:
+            edge_any = cv2.bitwise_or(edge_any, edges)
+        if cv2.countNonZero(edge_any) > DENSE_EDGE_RATIO * edge_any.size:
+            return _apply_stripe_lut_dense(out, pattern_type, lut, gray_u8, edge_maps)
+
+    if pattern_type == "horizontal":
+        # 行方向の縞は行ストライドのビューへ cv2 が直接書き込める
+        for parity in (0, 1):
+            channels = [cv2.LUT(gray_u8[parity::2], lut[parity, channel, :256]) for channel in range(3)]
+            cv2.merge(channels, dst=out[parity::2])
+    else:
+        # 列方向の縞は隣り合う2列を6チャンネルの1画素とみなして一度に書き込む
+        # （列ストライドのビューは cv2 に渡せず、numpy の3バイト単位のコピーは遅い）
+        pairs = out.shape[1] // 2
+        channels = [cv2.LUT(gray_u8[:, parity:2 * pairs:2], lut[parity, channel, :256])
+                    for parity in (0, 1) for channel in range(3)]
+        cv2.merge(channels, dst=out[:, :2 * pairs].reshape(out.shape[0], pairs, 6))
+        if out.shape[1] % 2:
+            out[:, -1] = lut[0][:, gray_u8[:, -1]].T
+
+    if edge_any is None:
+        return out
+
+    points = cv2.findNonZero(edge_any)
+    if points is None:
+        return out
+
+    points = points.reshape(-1, 2)
+    cols = points[:, 0]
+    rows = points[:, 1]
+    # エッジ状態（ビット b がエッジマップ b の有無、Canny は 0/255 なので最上位ビットで判定）
+    codes = gray_u8[rows, cols].astype(np.intp)
+    for bit, edges in enumerate(edge_maps):
+        codes |= (edges[rows, cols] >> 7).astype(np.intp) << (8 + bit)
+    parity = (rows if pattern_type == "horizontal" else cols) & 1
+    out[rows, cols] = lut[parity, :, codes]
+
+    return out
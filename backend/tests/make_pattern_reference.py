@@ -0,0 +1,103 @@
+"""
+パターン生成の参照出力を作成する（tests/data/pattern_reference.npz）
+
+ベクトル化・LUT 化する前の実装の出力を保存し、test_pattern_equivalence.py で
+現在の実装と比較する。参照は最適化前のコミットのソースから作成する:
+
+    git worktree add /tmp/pozt-baseline 65221bf
+    python tests/make_pattern_reference.py /tmp/pozt-baseline/backend
+
+最適化前のコミットにないグラデーション縞は、画素単位ループの参照実装
+（reference_gradation_stripe_loop）と比較する（benchmarks.gradation_stripe でも使用）
+"""
+import os
+import sys
+
+import cv2
+import numpy as np
+
+# 最適化前から存在する縞の生成方法（gradation は画素単位ループ版と別途比較する）
+REFERENCE_STRIPE_METHODS = (
+    "overlay", "high_frequency", "moire_pattern", "adaptive",
+    "adaptive_subtle", "adaptive_strong", "adaptive_minimal",
+    "perfect_subtle", "ultra_subtle", "near_perfect",
+    "color_preserving", "hue_preserving", "blended", "hybrid_overlay"
+)
+PATTERN_TYPES = ("horizontal", "vertical")
+REFERENCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "pattern_reference.npz")
+
+
+def hidden_image(height: int = 97, width: int = 131) -> np.ndarray:
+    """
+    隠し画像の入力（グラデーション・平坦部・ノイズを含み、エッジの有無と奇数サイズの縞の端を通る）
+    """
+    yy, xx = np.mgrid[0:height, 0:width]
+    image = np.stack([(xx * 3) % 256, (yy * 5) % 256, ((xx + yy) // 2) % 256], axis=2).astype(np.uint8)
+    image[20:60, 30:80] = 20
+    noise = np.random.default_rng(3).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    image[65:, 90:] = noise[65:, 90:]
+    return image
+
+
+def reference_key(stripe_method: str, pattern_type: str) -> str:
+    return f"{stripe_method}-{pattern_type}"
+
+
+def reference_gradation_stripe_loop(hidden_array, pattern_type="horizontal", color1="#000000", color2="#ffffff",
+                                    detail_strength=0.8):
+    """
+    ベクトル化前のグラデーション縞の画素単位ループ実装
+    （参照作成時に最適化前のソースを読み込むため、現在のソースのモジュールは import しない）
+    """
+    height, width = hidden_array.shape[:2]
+    rgb1 = np.array(_hex_to_rgb(color1), dtype=np.float32)
+    rgb2 = np.array(_hex_to_rgb(color2), dtype=np.float32)
+
+    hidden_gray = cv2.cvtColor(hidden_array.astype(np.uint8), cv2.COLOR_RGB2GRAY).astype(np.float32)
+    hidden_contrast = np.clip((hidden_gray / 255.0 - 0.5) * 2.0 + 0.5, 0, 1)
+    edges = cv2.Canny(hidden_gray.astype(np.uint8), 50, 150).astype(np.float32) / 255.0
+
+    result = np.zeros((height, width, 3), dtype=np.uint8)
+    for y in range(height):
+        for x in range(width):
+            stripe_base = (y if pattern_type == "horizontal" else x) % 2
+            hidden_value = hidden_contrast[y, x]
+            if stripe_base == 0:
+                base_color = rgb1
+                base_brightness = 25 + hidden_value * 30
+            else:
+                base_color = rgb2
+                base_brightness = 200 + hidden_value * 35
+            edge_adjustment = edges[y, x] * detail_strength * 15
+            detail_adjustment = (hidden_value - 0.5) * detail_strength * 20
+            final_brightness = base_brightness + detail_adjustment + edge_adjustment
+            for i in range(3):
+                result[y, x, i] = np.clip(final_brightness * (base_color[i] / 255.0), 0, 255)
+
+    return result
+
+
+def _hex_to_rgb(hex_color: str):
+    hex_color = hex_color.lstrip("#")
+    return tuple(int(hex_color[i:i + 2], 16) for i in (0, 2, 4))
+
+
+def main(source_dir: str):
+    sys.path.insert(0, os.path.abspath(source_dir))
+    from utils.image_processor import vectorized_pattern_generation
+
+    image = hidden_image()
+    outputs = {
+        reference_key(method, pattern_type): vectorized_pattern_generation(image, pattern_type, method)
+        for method in REFERENCE_STRIPE_METHODS
+        for pattern_type in PATTERN_TYPES
+    }
+    os.makedirs(os.path.dirname(REFERENCE_PATH), exist_ok=True)
+    np.savez_compressed(REFERENCE_PATH, **outputs)
+    print(f"Saved {len(outputs)} reference outputs to {REFERENCE_PATH}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit("usage: python tests/make_pattern_reference.py <source backend dir>")
+    main(sys.argv[1])
@@ -0,0 +1,96 @@
+"""
+パターン生成の出力の同一性テスト
+ベクトル化・LUT 化した実装が最適化前の実装と 1 LSB 以内で一致することを確認する
+"""
+import cv2
+import numpy as np
+import pytest
+
+from make_pattern_reference import (
+    PATTERN_TYPES,
+    REFERENCE_PATH,
+    REFERENCE_STRIPE_METHODS,
+    hidden_image,
+    reference_gradation_stripe_loop,
+    reference_key
+)
+from core.hidden_analysis import HiddenImageAnalysis, get_hidden_analysis
+from patterns import stripe_engine
+from patterns.base import create_gradation_stripe_base
+from patterns.moire import _high_frequency_adjustment, create_high_frequency_moire_stripes
+from patterns.stripe_engine import create_stripe_phase
+from utils.image_processor import create_optimized_high_frequency_pattern, vectorized_pattern_generation
+
+MAX_DIFF_LSB = 1
+
+
+def _max_diff(actual: np.ndarray, expected: np.ndarray) -> int:
+    assert actual.shape == expected.shape
+    assert actual.dtype == expected.dtype
+    return int(np.abs(actual.astype(np.int16) - expected.astype(np.int16)).max())
+
+
+@pytest.fixture(scope="module")
+def reference():
+    with np.load(REFERENCE_PATH) as data:
+        return {key: data[key] for key in data.files}
+
+
+@pytest.mark.parametrize("pattern_type", PATTERN_TYPES)
+@pytest.mark.parametrize("stripe_method", REFERENCE_STRIPE_METHODS)
+def test_vectorized_pattern_generation_matches_reference(reference, stripe_method, pattern_type):
+    result = vectorized_pattern_generation(hidden_image(), pattern_type, stripe_method)
+    assert _max_diff(result, reference[reference_key(stripe_method, pattern_type)]) <= MAX_DIFF_LSB
+
+
+@pytest.mark.parametrize("pattern_type", PATTERN_TYPES)
+@pytest.mark.parametrize("colors", [("#000000", "#ffffff"), ("#1e3a5f", "#f4d35e")])
+def test_gradation_stripe_matches_pixel_loop(pattern_type, colors):
+    image = hidden_image(61, 47)
+    result = create_gradation_stripe_base(image, pattern_type, *colors)
+    expected = reference_gradation_stripe_loop(image, pattern_type, *colors)
+    assert _max_diff(result, expected) <= MAX_DIFF_LSB
+
+
+@pytest.mark.parametrize("pattern_type", PATTERN_TYPES)
+def test_stripe_lut_dense_and_sparse_paths_match(monkeypatch, pattern_type):
+    analysis = HiddenImageAnalysis(hidden_image(64, 77))
+    edge_maps = (analysis.edges(20, 80, contrast=4.0), analysis.edges(60, 160, contrast=4.0))
+    lut = stripe_engine.compile_stripe_lut(
+        4.0, _high_frequency_adjustment, (), len(edge_maps),
+        stripe_engine.StripeLevel(98, 20, 35, 155), stripe_engine.StripeLevel(158, 20, 100, 220),
+        (0, 0, 0), (255, 255, 255)
+    )
+
+    results = []
+    for ratio in (0.0, 1.0):  # 0.0: 常にコード画像から引く / 1.0: 常に疎な上書き
+        monkeypatch.setattr(stripe_engine, "DENSE_EDGE_RATIO", ratio)
+        out = np.empty((analysis.height, analysis.width, 3), dtype=np.uint8)
+        results.append(stripe_engine.apply_stripe_lut(out, pattern_type, lut, analysis.gray_u8, edge_maps))
+    np.testing.assert_array_equal(results[0], results[1])
+
+
+def _reference_frequency_and_enhancement(base_pattern, pattern_type, frequency, enhancement_factor):
+    """テーブル参照化する前の、画像全体の float32 演算による周波数調整・エッジ強調"""
+    if frequency != 1:
+        height, width = base_pattern.shape[:2]
+        freq_mask_3d = create_stripe_phase(height, width, pattern_type, frequency)[:, :, np.newaxis]
+        base_pattern = np.clip(base_pattern.astype(np.float32) * (0.7 + 0.3 * freq_mask_3d), 0, 255)
+    if abs(enhancement_factor - 1.0) > 0.01:
+        gray = cv2.cvtColor(base_pattern.astype(np.uint8), cv2.COLOR_RGB2GRAY)
+        edge_mask = (cv2.Canny(gray, 50, 150) / 255.0 * enhancement_factor).astype(np.float32)
+        edge_mask_3d = np.stack([edge_mask, edge_mask, edge_mask], axis=2)
+        base_pattern = np.clip(base_pattern.astype(np.float32) * (1.0 + edge_mask_3d * 0.3), 0, 255)
+    return base_pattern.astype(np.uint8)
+
+
+@pytest.mark.parametrize("pattern_type", PATTERN_TYPES)
+@pytest.mark.parametrize("frequency", [1, 3])
+@pytest.mark.parametrize("enhancement_factor", [1.0, 0.5, 1.2, 3.0])
+def test_optimized_high_frequency_tables_match_float_pipeline(pattern_type, frequency, enhancement_factor):
+    image = hidden_image()
+    result = create_optimized_high_frequency_pattern(image, pattern_type, 1.0, enhancement_factor, frequency, 1.0)
+    analysis = get_hidden_analysis(image).sharpened(1.0, blur_scale=2)
+    base_pattern = create_high_frequency_moire_stripes(analysis, pattern_type, 0.1)
+    expected = _reference_frequency_and_enhancement(base_pattern, pattern_type, frequency, enhancement_factor)
+    np.testing.assert_array_equal(result, expected)
@@ -0,0 +1,239 @@
+"""
+生成物インデックス - static/ のアップロードと結果ファイルを有効期限順に管理する
+リクエストごとのディレクトリ走査をやめ、登録時に期限とサイズを記録して
+定期スイーパーが期限切れの削除とディスク使用量上限（LRU 追い出し）をまとめて行う
+インデックスはローカルの JSON ファイルに保存し、再起動後も引き継ぐ
+"""
+import asyncio
+import heapq
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from config.app import get_settings
+from utils.http_cache import IMMUTABLE_ARTIFACT_PATTERN
+from utils.image_cache import invalidate_upload
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class ArtifactEntry:
+    """インデックスのエントリ（サイズ・有効期限・最終アクセス時刻）"""
+
+    __slots__ = ("size", "expires_at", "last_access")
+
+    def __init__(self, size: int, expires_at: float, last_access: float):
+        self.size = size
+        self.expires_at = expires_at
+        self.last_access = last_access
+
+
+class ArtifactIndex:
+    """
+    有効期限のヒープと最終アクセス順の表を持つ生成物インデックス（スレッドセーフ）
+    登録・アクセス記録は O(log n)、削除はスイーパーのみが行う
+    """
+
+    def __init__(self, directory: str, index_path: str, ttl: int, max_bytes: int):
+        self.directory = directory
+        self.index_path = index_path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, ArtifactEntry]" = OrderedDict()  # 最終アクセス順（古い順）
+        self._expiry_heap: List[Tuple[float, str]] = []  # (有効期限, ファイル名)、更新前の値は遅延削除
+        self._bytes = 0
+        self._dirty = False
+        self._lock = threading.Lock()
+        self.expired = 0
+        self.evicted = 0
+        self.evicted_bytes = 0
+
+    def record(self, filename: str, size: Optional[int] = None, expires_at: Optional[float] = None):
+        """ファイルを登録（既定の期限は現在から ttl 秒後）"""
+        if size is None:
+            try:
+                size = os.path.getsize(os.path.join(self.directory, filename))
+            except OSError:
+                return
+        now = time.time()
+        expires_at = expires_at or now + self.ttl
+        with self._lock:
+            self._add(filename, ArtifactEntry(size, expires_at, now))
+            self._dirty = True
+
+    def touch(self, filename: str):
+        """配信時に最終アクセスを更新（ディスク上限の追い出し順に使う）"""
+        with self._lock:
+            entry = self._entries.get(filename)
+            if entry is not None:
+                entry.last_access = time.time()
+                self._entries.move_to_end(filename)
+
+    def discard(self, filename: str):
+        """インデックスから除外（ファイルは削除しない）"""
+        with self._lock:
+            entry = self._entries.pop(filename, None)
+            if entry is not None:
+                self._bytes -= entry.size
+                self._dirty = True
+
+    def sweep(self) -> Dict[str, int]:
+        """期限切れのファイルを削除し、ディスク使用量が上限を超えていれば最終アクセスの古い順に削除"""
+        now = time.time()
+        doomed = []
+        expired = evicted = 0
+        with self._lock:
+            while self._expiry_heap and self._expiry_heap[0][0] <= now:
+                expires_at, filename = heapq.heappop(self._expiry_heap)
+                entry = self._entries.get(filename)
+                if entry is None or entry.expires_at != expires_at:
+                    continue  # 再登録・除外済みの古いヒープ要素
+                doomed.append(filename)
+                self._remove(filename)
+                expired += 1
+
+            while self._bytes > self.max_bytes and self._entries:
+                filename = next(iter(self._entries))
+                self.evicted_bytes += self._remove(filename)
+                doomed.append(filename)
+                evicted += 1
+
+            if doomed:
+                self._dirty = True
+            self.expired += expired
+            self.evicted += evicted
+            # 参照されなくなったヒープ要素が増えすぎた場合は作り直す
+            if len(self._expiry_heap) > 2 * len(self._entries) + 64:
+                self._rebuild_heap()
+
+        for filename in doomed:
+            try:
+                os.remove(os.path.join(self.directory, filename))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error("❌ Error deleting file %s: %s", filename, e)
+            invalidate_upload(filename)
+
+        if doomed:
+            logger.debug("🧹 Artifact sweep: %d expired, %d evicted for disk cap", expired, evicted)
+        self.save()
+        return {"expired": expired, "evicted": evicted}
+
+    def load(self):
+        """
+        保存済みインデックスを読み込み、ディレクトリと突き合わせる（起動時のみ走査）
+        インデックスにない生成物は現在時刻から登録し、消えたファイルは除外する
+        """
+        saved = {}
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as index_file:
+                saved = json.load(index_file)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning("⚠️ Artifact index unreadable, rebuilding: %s", e)
+
+        now = time.time()
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            self._entries.clear()
+            self._expiry_heap = []
+            self._bytes = 0
+            for filename in os.listdir(self.directory):
+                if IMMUTABLE_ARTIFACT_PATTERN.match(filename) is None:
+                    continue
+                try:
+                    size = os.path.getsize(os.path.join(self.directory, filename))
+                except OSError:
+                    continue
+                record = saved.get(filename)
+                if record is not None:
+                    entry = ArtifactEntry(size, record[1], record[2])
+                else:
+                    entry = ArtifactEntry(size, now + self.ttl, now)
+                self._add(filename, entry)
+            # 最終アクセス順に並べ直す
+            self._entries = OrderedDict(sorted(self._entries.items(), key=lambda item: item[1].last_access))
+            self._dirty = True
+        self.save()
+        logger.debug("🗂️ Artifact index loaded: %d files, %d bytes", len(self._entries), self._bytes)
+
+    def save(self):
+        """変更があればインデックスを保存（一時ファイルから置き換え）"""
+        with self._lock:
+            if not self._dirty:
+                return
+            snapshot = {
+                filename: [entry.size, entry.expires_at, entry.last_access]
+                for filename, entry in self._entries.items()
+            }
+            self._dirty = False
+
+        temp_path = f"{self.index_path}.part"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as index_file:
+                json.dump(snapshot, index_file, separators=(",", ":"))
+            os.replace(temp_path, self.index_path)
+        except OSError as e:
+            logger.error("❌ Failed to save artifact index: %s", e)
+            with self._lock:
+                self._dirty = True
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "files": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "expired": self.expired,
+                "evicted": self.evicted,
+                "evicted_bytes": self.evicted_bytes
+            }
+
+    def _add(self, filename: str, entry: ArtifactEntry):
+        previous = self._entries.pop(filename, None)
+        if previous is not None:
+            self._bytes -= previous.size
+        self._entries[filename] = entry
+        self._bytes += entry.size
+        heapq.heappush(self._expiry_heap, (entry.expires_at, filename))
+
+    def _remove(self, filename: str) -> int:
+        entry = self._entries.pop(filename)
+        self._bytes -= entry.size
+        return entry.size
+
+    def _rebuild_heap(self):
+        self._expiry_heap = [(entry.expires_at, filename) for filename, entry in self._entries.items()]
+        heapq.heapify(self._expiry_heap)
+
+
+async def run_artifact_sweeper(index: ArtifactIndex, interval: float):
+    """定期的にスイープを実行（ファイル削除はスレッドで行い、イベントループを止めない）"""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await loop.run_in_executor(None, index.sweep)
+        except Exception as e:
+            logger.error("❌ Artifact sweep failed: %s", e)
+
+
+_artifact_index: Optional[ArtifactIndex] = None
+
+
+def get_artifact_index() -> ArtifactIndex:
+    """共有生成物インデックスを取得"""
+    global _artifact_index
+    if _artifact_index is None:
+        settings = get_settings()
+        _artifact_index = ArtifactIndex(
+            "static", settings.ARTIFACT_INDEX_PATH,
+            settings.TEMP_FILE_EXPIRY, settings.ARTIFACT_DISK_MAX_BYTES
+        )
+    return _artifact_index
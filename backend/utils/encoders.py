@@ -0,0 +1,241 @@
+"""
+結果画像エンコーダー - 出力形式（PNG / 可逆 WebP）と圧縮段階（fastest / balanced / smallest）
+リクエストごとの指定または Accept ヘッダーで形式を選び、エンコード時間と出力バイト数を報告する
+PNG は行バンド単位でストリーミング出力し、WebP は libwebp が画像全体を必要とするため
+バンドを1枚の配列に集めてからエンコードする
+"""
+import io
+import mimetypes
+import os
+import time
+from typing import Any, BinaryIO, Dict, Iterable, NamedTuple, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from utils.logger import get_logger
+from utils.png_stream import StreamingPNGWriter, partial_path
+
+logger = get_logger(__name__)
+
+# 出力形式と MIME タイプ・拡張子
+OUTPUT_FORMATS = {
+    "png": ("image/png", "png"),
+    "webp": ("image/webp", "webp"),
+}
+
+# 静的ファイル配信（/uploads）でも WebP の MIME タイプを返せるよう登録
+mimetypes.add_type("image/webp", ".webp")
+
+# 圧縮段階（速度優先 → サイズ優先）
+ENCODER_TIERS = ("fastest", "balanced", "smallest")
+
+
+class EncoderSpec(NamedTuple):
+    """エンコーダーの設定（形式・段階・エンコードオプション）"""
+    output_format: str
+    tier: str
+    options: Dict[str, Any]
+
+    @property
+    def media_type(self) -> str:
+        return OUTPUT_FORMATS[self.output_format][0]
+
+    @property
+    def extension(self) -> str:
+        return OUTPUT_FORMATS[self.output_format][1]
+
+    @property
+    def streaming(self) -> bool:
+        """行バンドごとに書き出せるか（PNG のみ）"""
+        return self.output_format == "png"
+
+
+# 実写真（4032×3024 / 3000×2250 の JPEG）を 2430×3240 にして縞模様の領域を合成した結果での実測
+# （エンコードのみ、1コア。縞だけの合成画像とは大きく異なるため、段階は写真の値で選ぶ）:
+#   PNG  zlib 1: 約0.3-0.5s / 7.5-8.3MB、zlib 3: 約0.5-0.8s / 7.0-7.8MB、
+#        zlib 6: 約2.2-2.8s / 6.6-7.6MB、zlib 9: 約9-13s / 6.4-7.4MB
+#   WebP method 0 quality 0: 約0.7-0.8s / 5.1-5.7MB、method 1 quality 25: 約3.1-3.2s / 4.8-5.3MB、
+#        method 4 quality 50: 約3.5-5.5s / 4.8-5.2MB
+#        （method 0 quality 100 は約14-15s かかり quality 0 とサイズが変わらないため使わない）
+# balanced の PNG は最適化前と同じ zlib 3（zlib 6 は 3-4 倍の時間で 3-5% しか小さくならない）
+ENCODERS = {
+    ("png", "fastest"): {"compress_level": 1},
+    ("png", "balanced"): {"compress_level": 3},
+    ("png", "smallest"): {"compress_level": 9},
+    ("webp", "fastest"): {"lossless": True, "method": 0, "quality": 0},
+    ("webp", "balanced"): {"lossless": True, "method": 1, "quality": 25},
+    ("webp", "smallest"): {"lossless": True, "method": 4, "quality": 50},
+}
+
+
+def get_encoder(output_format: str = "png", tier: str = "balanced") -> EncoderSpec:
+    """形式と段階からエンコーダーを取得（未知の値は png / balanced）"""
+    output_format = (output_format or "png").lower()
+    tier = (tier or "balanced").lower()
+    if output_format not in OUTPUT_FORMATS:
+        logger.warning("⚠️ Unknown output format '%s', using png", output_format)
+        output_format = "png"
+    if tier not in ENCODER_TIERS:
+        logger.warning("⚠️ Unknown encoder tier '%s', using balanced", tier)
+        tier = "balanced"
+    return EncoderSpec(output_format, tier, dict(ENCODERS[(output_format, tier)]))
+
+
+def media_type_for_filename(filename: str) -> str:
+    """結果ファイル名の拡張子から MIME タイプを取得（不明な場合は PNG）"""
+    extension = os.path.splitext(filename)[1].lstrip(".").lower()
+    for media_type, format_extension in OUTPUT_FORMATS.values():
+        if extension == format_extension:
+            return media_type
+    return OUTPUT_FORMATS["png"][0]
+
+
+def _accept_qualities(accept: str) -> Dict[str, float]:
+    """Accept ヘッダーを {メディアタイプ: q値} に変換"""
+    qualities = {}
+    for entry in accept.split(","):
+        parts = [part.strip() for part in entry.split(";")]
+        media_type = parts[0].lower()
+        if not media_type:
+            continue
+        quality = 1.0
+        for param in parts[1:]:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        qualities[media_type] = quality
+    return qualities
+
+
+def negotiate_output_format(requested: Optional[str], accept: Optional[str], default: str = "png") -> str:
+    """
+    出力形式を決定
+    明示指定（png / webp）を優先し、未指定の場合は Accept ヘッダーに image/webp が明示され、
+    image/png 以上の q 値であれば webp を選ぶ（*/* や image/* だけでは既定の形式）
+    """
+    if requested:
+        requested = requested.lower()
+        if requested in OUTPUT_FORMATS:
+            return requested
+        logger.warning("⚠️ Unknown output format '%s', negotiating from Accept", requested)
+
+    if accept:
+        qualities = _accept_qualities(accept)
+        webp_quality = qualities.get("image/webp", 0.0)
+        png_quality = qualities.get("image/png", qualities.get("image/*", qualities.get("*/*", 0.0)))
+        if webp_quality > 0 and webp_quality >= png_quality:
+            return "webp"
+    return default
+
+
+def _encode_pil(spec: EncoderSpec, array: np.ndarray, out_file: BinaryIO):
+    """配列全体を PIL でエンコード"""
+    image = Image.fromarray(array)
+    try:
+        image.save(out_file, format=spec.output_format.upper(), **spec.options)
+    finally:
+        image.close()
+
+
+def encode_bands(spec: EncoderSpec, bands: Iterable[Tuple[int, np.ndarray]], width: int, height: int,
+                 out_file: BinaryIO, channels: int = 3) -> Dict[str, Any]:
+    """
+    compose_bands() などが返す (開始行, バンド) をエンコードして out_file へ書き出す
+    戻り値はエンコード統計（形式・段階・エンコード時間・出力バイト数）。合成の時間は含めない
+    """
+    encode_time = 0.0
+    start_position = out_file.tell() if out_file.seekable() else 0
+
+    if spec.streaming:
+        started = time.perf_counter()
+        writer = StreamingPNGWriter(out_file, width, height, channels, spec.options["compress_level"])
+        encode_time += time.perf_counter() - started
+        for _, band in bands:
+            started = time.perf_counter()
+            writer.write_rows(band)
+            encode_time += time.perf_counter() - started
+        started = time.perf_counter()
+        writer.close()
+        encode_time += time.perf_counter() - started
+        output_bytes = writer.bytes_written
+    else:
+        # 非ストリーミング形式はバンドを1枚の配列に集めてからエンコード
+        shape = (height, width, channels) if channels > 1 else (height, width)
+        canvas = np.empty(shape, dtype=np.uint8)
+        for band_top, band in bands:
+            canvas[band_top:band_top + band.shape[0]] = band
+        started = time.perf_counter()
+        _encode_pil(spec, canvas, out_file)
+        encode_time = time.perf_counter() - started
+        del canvas
+        output_bytes = out_file.tell() - start_position
+
+    return {
+        "format": spec.output_format,
+        "tier": spec.tier,
+        "media_type": spec.media_type,
+        "encode_time": round(encode_time, 4),
+        "bytes": output_bytes
+    }
+
+
+def encode_array(spec: EncoderSpec, array: np.ndarray, out_file: BinaryIO) -> Dict[str, Any]:
+    """配列全体をエンコード（チャンネル数は配列から判定）"""
+    height, width = array.shape[:2]
+    channels = array.shape[2] if array.ndim == 3 else 1
+    if spec.streaming:
+        return encode_bands(spec, ((0, array),), width, height, out_file, channels)
+
+    start_position = out_file.tell() if out_file.seekable() else 0
+    started = time.perf_counter()
+    _encode_pil(spec, array, out_file)
+    return {
+        "format": spec.output_format,
+        "tier": spec.tier,
+        "media_type": spec.media_type,
+        "encode_time": round(time.perf_counter() - started, 4),
+        "bytes": out_file.tell() - start_position
+    }
+
+
+def encode_to_bytes(spec: EncoderSpec, bands: Iterable[Tuple[int, np.ndarray]], width: int, height: int,
+                    channels: int = 3) -> Tuple[bytes, Dict[str, Any]]:
+    """メモリ上にエンコードして (バイト列, 統計) を返す（小さなプレビュー用）"""
+    buffer = io.BytesIO()
+    stats = encode_bands(spec, bands, width, height, buffer, channels)
+    return buffer.getvalue(), stats
+
+
+def write_encoded_file(path: str, spec: EncoderSpec, bands: Iterable[Tuple[int, np.ndarray]],
+                       width: int, height: int, channels: int = 3) -> Dict[str, Any]:
+    """
+    ファイルへエンコード。"<path>.part" に書き込み、完了後に path へ置き換える
+    （PNG は書き込み中の .part を先頭から配信できる）
+    """
+    temp_path = partial_path(path)
+    try:
+        with open(temp_path, "wb") as out_file:
+            stats = encode_bands(spec, bands, width, height, out_file, channels)
+        os.replace(temp_path, path)
+        return stats
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def write_encoded_array(path: str, spec: EncoderSpec, array: np.ndarray) -> Dict[str, Any]:
+    """配列全体をファイルへエンコード（.part 経由で置き換え）"""
+    temp_path = partial_path(path)
+    try:
+        with open(temp_path, "wb") as out_file:
+            stats = encode_array(spec, array, out_file)
+        os.replace(temp_path, path)
+        return stats
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
@@ -1,9 +1,28 @@
+import asyncio
 import os
-import time
 import aiofiles
 import uuid
-from typing import BinaryIO
+import warnings
+from typing import AsyncIterator, BinaryIO, Optional, Tuple
 from fastapi import UploadFile
+from PIL import Image, UnidentifiedImageError
+from config.app import get_settings
+from utils.png_stream import partial_path
+
+# 展開後のピクセル数が上限を超える画像はデコード時にも拒否する（解凍爆弾対策）
+Image.MAX_IMAGE_PIXELS = get_settings().MAX_IMAGE_PIXELS
+
+class UploadTooLargeError(ValueError):
+    """アップロードサイズが上限を超えた場合の例外"""
+    def __init__(self, max_bytes: int):
+        super().__init__(f"File size exceeds maximum allowed size ({max_bytes / 1024 / 1024:.1f}MB)")
+        self.max_bytes = max_bytes
+
+class ImageTooLargeError(ValueError):
+    """画像のピクセル数が上限を超えた場合の例外"""
+
+class InvalidImageError(ValueError):
+    """画像として読み込めない場合の例外"""
 
 async def save_upload_file(file_content: BinaryIO, filename: str) -> str:
     """アップロードされたファイルを保存"""
@@ -20,23 +39,119 @@ async def save_upload_file(file_content: BinaryIO, filename: str) -> str:
     
     return file_path
 
+async def stream_upload_to_file(upload: UploadFile, file_path: str, max_bytes: int,
+                                chunk_size: int = None) -> int:
+    """
+    受信済みのアップロード（multipart の一時ファイル）をチャンク単位で保存（全体をメモリに載せない）
+    ファイル本体が max_bytes を超えた時点で中断し、途中のファイルを削除する
+    リクエスト本文の受信自体は UploadSizeLimitMiddleware が上限で打ち切る（ここはファイル部分の厳密な判定）
+    """
+    chunk_size = chunk_size or get_settings().UPLOAD_CHUNK_SIZE
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    temp_path = partial_path(file_path)
+    written = 0
+    
+    try:
+        async with aiofiles.open(temp_path, 'wb') as out_file:
+            while True:
+                chunk = await upload.read(chunk_size)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > max_bytes:
+                    raise UploadTooLargeError(max_bytes)
+                await out_file.write(chunk)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    
+    return written
+
+def probe_image(file_path: str, max_pixels: int = None) -> Tuple[int, int, str]:
+    """
+    ヘッダーのみ読み込んで画像サイズと形式を取得（全体デコードは行わない）
+    ピクセル数が上限を超える画像は ImageTooLargeError
+    """
+    max_pixels = max_pixels or get_settings().MAX_IMAGE_PIXELS
+    try:
+        # 上限判定は下で明示的に行うため、PIL の警告は抑制する
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+            with Image.open(file_path) as image:
+                width, height = image.size
+                image_format = image.format
+    except Image.DecompressionBombError as e:
+        raise ImageTooLargeError(str(e))
+    except (UnidentifiedImageError, OSError):
+        raise InvalidImageError("Invalid image file: unsupported or corrupted image")
+    
+    if width * height > max_pixels:
+        raise ImageTooLargeError(
+            f"Image dimensions {width}x{height} exceed the maximum of {max_pixels} pixels"
+        )
+    return width, height, image_format
+
+def probe_image_header(file_path: str) -> Optional[Tuple[Tuple[int, int], str]]:
+    """ヘッダーのみ読み込んで画像サイズとカラーモードを取得（読めない場合は None）"""
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+            with Image.open(file_path) as image:
+                return image.size, image.mode
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        return None
+
 def get_file_path(filename: str) -> str:
     """ファイル名からパスを取得"""
     return os.path.join("static", filename)
 
-async def delete_old_files(expiry_seconds: int = 3600):
-    """指定された期間よりも古いファイルを削除"""
-    now = time.time()
-    directory = "static"
-    
-    for filename in os.listdir(directory):
-        file_path = os.path.join(directory, filename)
-        # ファイルの最終更新時間を取得
-        file_mod_time = os.path.getmtime(file_path)
-        # 現在時刻との差を計算
-        if now - file_mod_time > expiry_seconds:
-            try:
-                os.remove(file_path)
-                print(f"Deleted old file: {filename}")
-            except Exception as e:
-                print(f"Error deleting file {filename}: {e}")
+async def wait_for_render_output(file_path: str, render_future: "asyncio.Future", poll_interval: float = None):
+    """結果ファイルの書き込みが始まるか、レンダリングが終了するまで待つ"""
+    poll_interval = poll_interval or get_settings().RESULT_STREAM_POLL_INTERVAL
+    while not render_future.done():
+        if os.path.exists(partial_path(file_path)) or os.path.exists(file_path):
+            return
+        await asyncio.sleep(poll_interval)
+
+async def follow_render_output(file_path: str, render_future: "asyncio.Future",
+                               chunk_size: int = None, poll_interval: float = None) -> AsyncIterator[bytes]:
+    """
+    書き込み中の結果ファイル（"<path>.part"）を追従して先頭から配信する
+    レンダリング完了後は残りを読み切って終了し、失敗した場合は例外を送出して接続を打ち切る
+    （書き込み完了時のリネームや失敗時の削除後も、開いたファイルからは読み続けられる）
+    """
+    settings = get_settings()
+    chunk_size = chunk_size or settings.UPLOAD_CHUNK_SIZE
+    poll_interval = poll_interval or settings.RESULT_STREAM_POLL_INTERVAL
+
+    in_file = None
+    try:
+        while in_file is None:
+            for candidate in (partial_path(file_path), file_path):
+                try:
+                    in_file = await aiofiles.open(candidate, 'rb')
+                    break
+                except FileNotFoundError:
+                    continue
+            if in_file is None:
+                if render_future.done():
+                    render_future.result()
+                    raise FileNotFoundError(f"Result file not created: {file_path}")
+                await asyncio.sleep(poll_interval)
+
+        while True:
+            # 読み込み前に完了を確認（完了後の読み込みで末尾まで必ず読み切る）
+            finished = render_future.done()
+            chunk = await in_file.read(chunk_size)
+            if chunk:
+                yield chunk
+            elif finished:
+                render_future.result()
+                return
+            else:
+                await asyncio.sleep(poll_interval)
+    finally:
+        if in_file is not None:
+            await in_file.close()
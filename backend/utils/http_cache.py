@@ -0,0 +1,157 @@
+"""
+生成物の HTTP キャッシュ制御 - 内容ハッシュの強い ETag・条件付き GET（304）・Range 配信
+UUID 名の生成物は内容が変わらないため、immutable として長期キャッシュさせる
+"""
+import hashlib
+import os
+import re
+from functools import lru_cache
+from typing import Dict, Mapping, Optional, Tuple
+
+import aiofiles
+import anyio
+from fastapi.responses import FileResponse
+from starlette.responses import Response
+
+# UUID 名で生成され、以後書き換えられないファイル（アップロード・処理結果・抽出結果）
+IMMUTABLE_ARTIFACT_PATTERN = re.compile(
+    r"^(?:[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
+    r"|optimized_result_[0-9a-f]{8}_\d+"
+    r"|reversed_[0-9a-f]{8})\.(?:png|webp)$"
+)
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+_RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiableError(ValueError):
+    """Range ヘッダーがファイルの範囲外の場合の例外"""
+
+
+def content_etag(data: bytes) -> str:
+    """内容ハッシュから強い ETag を作成"""
+    return f'"{hashlib.blake2b(data, digest_size=16).hexdigest()}"'
+
+
+@lru_cache(maxsize=1024)
+def _file_digest(path: str, mtime_ns: int, size: int) -> str:
+    """ファイル内容のハッシュ（更新時刻とサイズが同じ間は再計算しない）"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as in_file:
+        for chunk in iter(lambda: in_file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_digest(path: str, stat_result: Optional[os.stat_result] = None) -> str:
+    """ディスク上のファイルの内容ハッシュ"""
+    stat_result = stat_result or os.stat(path)
+    return _file_digest(path, stat_result.st_mtime_ns, stat_result.st_size)
+
+
+def file_etag(path: str, stat_result: os.stat_result) -> str:
+    """ディスク上のファイルの強い ETag"""
+    return f'"{file_digest(path, stat_result)}"'
+
+
+def artifact_cache_headers(filename: str, etag: str) -> Dict[str, str]:
+    """ETag と Cache-Control（UUID 名の生成物は immutable、それ以外は毎回再検証）"""
+    immutable = IMMUTABLE_ARTIFACT_PATTERN.match(filename) is not None
+    return {
+        "ETag": etag,
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL,
+        "Accept-Ranges": "bytes"
+    }
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match が ETag に一致するか（弱い比較）"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+
+
+def parse_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    単一の bytes Range を (開始, 終了) に変換（終了位置を含む）
+    未指定・複数範囲・解釈できない形式は None（全体を返す）、範囲外は RangeNotSatisfiableError
+    """
+    if not range_header:
+        return None
+    match = _RANGE_PATTERN.match(range_header.strip())
+    if match is None:
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # 末尾からの指定（bytes=-500）
+        suffix_length = int(last)
+        if suffix_length == 0:
+            raise RangeNotSatisfiableError(range_header)
+        return max(0, size - suffix_length), size - 1
+
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiableError(range_header)
+    return start, end
+
+
+def _content_disposition(download_name: Optional[str]) -> Dict[str, str]:
+    if download_name is None:
+        return {}
+    return {"Content-Disposition": f'attachment; filename="{download_name}"'}
+
+
+async def artifact_response(request_headers: Mapping[str, str], filename: str, media_type: str,
+                            data: Optional[bytes] = None, etag: Optional[str] = None,
+                            path: Optional[str] = None, stat_result: Optional[os.stat_result] = None,
+                            download_name: Optional[str] = None) -> Response:
+    """
+    生成物のレスポンスを作成（メモリ上の data またはディスク上の path）
+    If-None-Match 一致で 304、Range 指定で 206（If-Range が ETag と異なる場合は全体）を返す
+    """
+    if data is not None:
+        size = len(data)
+        etag = etag or content_etag(data)
+    else:
+        stat_result = stat_result or os.stat(path)
+        size = stat_result.st_size
+        etag = etag or await anyio.to_thread.run_sync(file_etag, path, stat_result)
+
+    headers = artifact_cache_headers(filename, etag)
+    if etag_matches(request_headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    headers.update(_content_disposition(download_name))
+
+    if_range = request_headers.get("if-range")
+    byte_range = None
+    if if_range is None or if_range.strip() == etag:
+        try:
+            byte_range = parse_range(request_headers.get("range"), size)
+        except RangeNotSatisfiableError:
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+
+    if byte_range is None:
+        if data is not None:
+            return Response(content=data, media_type=media_type, headers=headers)
+        response = FileResponse(path, media_type=media_type, stat_result=stat_result)
+        response.headers.update(headers)
+        return response
+
+    start, end = byte_range
+    if data is not None:
+        body = data[start:end + 1]
+    else:
+        async with aiofiles.open(path, "rb") as in_file:
+            await in_file.seek(start)
+            body = await in_file.read(end - start + 1)
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return Response(content=body, status_code=206, media_type=media_type, headers=headers)
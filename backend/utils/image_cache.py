@@ -0,0 +1,256 @@
+"""
+画像キャッシュモジュール - デコード済みアップロード画像と固定サイズキャンバスの再利用
+パラメータ調整のたびに発生する再デコード・再リサイズを回避し、バイト予算内で保持する
+"""
+import hashlib
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from config.app import get_settings
+from config.settings import TARGET_WIDTH, TARGET_HEIGHT
+from core.geometry import plan_canvas_geometry, render_canvas
+
+
+class ByteBudgetLRU:
+    """
+    バイト予算付きLRUキャッシュ（スレッドセーフ・有効期限対応）
+    on_evict を指定すると、予算超過で追い出したエントリを (キー, 値) のリストで通知する
+    （ロック解放後に呼び出すため、コールバック内でディスク書き込みなどを行ってよい）
+    """
+
+    def __init__(self, name: str, max_bytes: int,
+                 on_evict: Optional[Callable[[List[Tuple[Hashable, Any]]], None]] = None):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable):
+        """キーに対応する値を取得（期限切れは削除してミス扱い）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, nbytes, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, nbytes: int, expires_at: Optional[float] = None) -> bool:
+        """値を登録（予算を超える単一エントリは保持しない）"""
+        if nbytes > self.max_bytes:
+            return False
+
+        evicted = []
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            # 予算内に収まるまで最も古いエントリから追い出す
+            while self._entries and self._bytes + nbytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                evicted.append((oldest_key, self._entries[oldest_key][0]))
+                self.evicted_bytes += self._remove(oldest_key)
+                self.evictions += 1
+
+            self._entries[key] = (value, nbytes, expires_at)
+            self._bytes += nbytes
+
+        if evicted and self.on_evict is not None:
+            self.on_evict(evicted)
+        return True
+
+    def invalidate(self, predicate) -> int:
+        """条件に一致するキーのエントリを削除"""
+        return len(self.remove_matching(predicate))
+
+    def remove_matching(self, predicate) -> List[Tuple[Hashable, Any]]:
+        """条件に一致するキーのエントリを削除し、削除した (キー, 値) を返す"""
+        with self._lock:
+            removed = [(key, entry[0]) for key, entry in self._entries.items() if predicate(key)]
+            for key, _ in removed:
+                self._remove(key)
+            return removed
+
+    def values(self) -> List[Any]:
+        """保持中の値（統計・整合性確認用、LRU順は更新しない）"""
+        with self._lock:
+            return [entry[0] for entry in self._entries.values()]
+
+    def clear(self):
+        """全エントリを削除"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """ヒット率とメモリ使用量の統計"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "evicted_bytes": self.evicted_bytes,
+                "expirations": self.expirations
+            }
+
+    def _remove(self, key: Hashable) -> int:
+        _, nbytes, _ = self._entries.pop(key)
+        self._bytes -= nbytes
+        return nbytes
+
+
+class DecodedSource(NamedTuple):
+    """デコード済みの元画像（読み取り専用RGB配列・元サイズ・内容ハッシュ）"""
+    array: np.ndarray
+    original_size: Tuple[int, int]
+    digest: str
+    expires_at: float
+
+
+_decoded_cache = ByteBudgetLRU("decoded_uploads", get_settings().DECODED_CACHE_MAX_BYTES)
+_canvas_cache = ByteBudgetLRU("fixed_canvases", get_settings().CANVAS_CACHE_MAX_BYTES)
+
+
+def load_source_image(path: str, max_pixels: int, thumbnail_size: Tuple[int, int]) -> DecodedSource:
+    """
+    アップロード画像をRGBでデコード（キャッシュ対応）
+    大きな画像は max_pixels を超える場合に thumbnail_size へ縮小して保持する
+    """
+    stat = os.stat(path)
+
+    # ヘッダーのみ読み込んで縮小の要否を判定（全体デコードは行わない）
+    with Image.open(path) as probe:
+        original_size = probe.size
+    needs_thumbnail = original_size[0] * original_size[1] > max_pixels
+    key = (path, stat.st_mtime_ns, tuple(thumbnail_size) if needs_thumbnail else None)
+
+    cached = _decoded_cache.get(key)
+    if cached is not None:
+        return cached
+
+    with open(path, 'rb') as f:
+        content = f.read()
+    digest = hashlib.blake2b(content, digest_size=16).hexdigest()
+
+    with Image.open(io.BytesIO(content)) as img:
+        if img.mode == 'RGBA':
+            # 透過部分は白背景で合成
+            decoded = Image.new('RGB', img.size, (255, 255, 255))
+            decoded.paste(img, mask=img.split()[3])
+        else:
+            decoded = img.convert('RGB')
+
+    if needs_thumbnail:
+        decoded.thumbnail(thumbnail_size, Image.Resampling.BILINEAR)
+
+    array = np.array(decoded)
+    array.setflags(write=False)
+    decoded.close()
+    del content
+
+    expires_at = stat.st_mtime + get_settings().TEMP_FILE_EXPIRY
+    source = DecodedSource(array, original_size, digest, expires_at)
+    _decoded_cache.put(key, source, array.nbytes, expires_at)
+    return source
+
+
+def get_fixed_canvas(source: DecodedSource, resize_method: str,
+                     target_size: Tuple[int, int] = (TARGET_WIDTH, TARGET_HEIGHT)) -> np.ndarray:
+    """
+    固定サイズ（既定 2430×3240、プレビューは縮小サイズ）キャンバスを取得（キャッシュ対応）
+    同一内容のアップロードとリサイズ方法の組み合わせでは再リサンプルしない
+    キャッシュに保持された配列は読み取り専用、保持できなかった場合は書き込み可能な
+    配列を返す（呼び出し側は writeable フラグで共有か所有かを判断できる）
+    """
+    key = (source.digest, source.array.shape[:2], resize_method, tuple(target_size))
+
+    cached = _canvas_cache.get(key)
+    if cached is not None:
+        return cached
+
+    geometry = plan_canvas_geometry(source.original_size, resize_method, tuple(target_size))
+    canvas = render_canvas(Image.fromarray(source.array), geometry)
+    canvas.setflags(write=False)
+
+    if not _canvas_cache.put(key, canvas, canvas.nbytes, source.expires_at):
+        # 予算を超えて保持されない場合は共有されないため、そのまま所有させる
+        canvas.setflags(write=True)
+    return canvas
+
+
+def _drop_uploads(predicate) -> int:
+    """
+    条件に一致するデコード済み画像と、そこから生成したキャンバスを破棄
+    同じ内容の別アップロードが残っている場合、キャンバスは共有されているため残す
+    """
+    removed = _decoded_cache.remove_matching(predicate)
+    if removed:
+        live_digests = {source.digest for source in _decoded_cache.values()}
+        stale_digests = {source.digest for _, source in removed} - live_digests
+        if stale_digests:
+            _canvas_cache.invalidate(lambda key: key[0] in stale_digests)
+    return len(removed)
+
+
+def invalidate_upload(filename: str) -> int:
+    """指定アップロードのキャッシュを破棄（ファイル削除時に呼び出す、同一プロセスのキャッシュのみ対象）"""
+    return _drop_uploads(lambda key: os.path.basename(key[0]) == filename)
+
+
+def _is_stale_upload(key) -> bool:
+    path, mtime_ns, _ = key
+    try:
+        return os.stat(path).st_mtime_ns != mtime_ns
+    except OSError:
+        return True
+
+
+def prune_stale_uploads() -> int:
+    """
+    削除・上書きされたアップロードのキャッシュを破棄
+    ファイルの削除はメインプロセスで行われるため、レンダリングワーカーではタスクごとに
+    キーの (パス, mtime_ns) とファイルを照合して破棄する
+    """
+    return _drop_uploads(_is_stale_upload)
+
+
+def clear_image_caches():
+    """デコード済み画像とキャンバスのキャッシュを全て破棄（ベンチマークの初回処理計測用）"""
+    _decoded_cache.clear()
+    _canvas_cache.clear()
+
+
+def get_image_cache_stats() -> Dict[str, Any]:
+    """画像キャッシュの統計情報"""
+    return {
+        _decoded_cache.name: _decoded_cache.stats(),
+        _canvas_cache.name: _canvas_cache.stats()
+    }
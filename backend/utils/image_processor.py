@@ -8,18 +8,47 @@ import os
 import time
 import gc
 import json
+import threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from functools import lru_cache
 from config.app import get_settings
-from core.image_utils import resize_to_fixed_size, calculate_resize_factors, add_black_border
+from utils.logger import get_logger
+from utils.timing import PhaseTimer
+from core.image_utils import resize_to_fixed_size, calculate_resize_factors
+from core.compositing import compose_bands
+from core.geometry import plan_canvas_geometry
+from core.hidden_analysis import HiddenImageAnalysis, get_hidden_analysis
 from core.region_utils import extract_region_from_image
+from utils.image_cache import load_source_image, get_fixed_canvas
+from utils.artifact_index import get_artifact_index
+from utils.encoders import get_encoder, write_encoded_file
 from core.shape_masks import create_custom_shape_mask, apply_mask_to_region, get_available_shapes
 from patterns.moire import create_adaptive_moire_stripes, create_high_frequency_moire_stripes
 from patterns.overlay import create_overlay_moire_pattern
 from patterns.hybrid import create_hybrid_moire_pattern, apply_overlay_fusion
+from patterns.base import create_gradation_stripe_base, hex_to_rgb
+from patterns.stripe_engine import create_stripe_layer, create_stripe_phase
+
+logger = get_logger(__name__)
+
+# clear_memory() を省略するスレッド（小さな配列だけを扱うプレビュー描画用）
+_memory_release = threading.local()
+
+@contextmanager
+def skip_memory_release():
+    """ブロック内の clear_memory() を省略（強制GC 1回の方が縮小描画より重いため）"""
+    previous = getattr(_memory_release, "skip", False)
+    _memory_release.skip = True
+    try:
+        yield
+    finally:
+        _memory_release.skip = previous
 
 def clear_memory():
     """メモリを明示的に解放（最適化版）"""
+    if getattr(_memory_release, "skip", False):
+        return
     gc.collect()
     # 可能であればNumPy配列のメモリも解放
     if hasattr(gc, 'set_threshold'):
@@ -43,6 +72,7 @@ def get_cached_pattern_config(stripe_method: str):
         "hue_preserving": {"base_method": "hue_preserving", "overlay_weight": 0.3, "base_weight": 0.7},
         "blended": {"base_method": "blended", "overlay_weight": 0.5, "base_weight": 0.5},
         "hybrid_overlay": {"base_method": "adaptive", "overlay_weight": 0.4, "base_weight": 0.6},
+        "gradation": {"base_method": "gradation", "overlay_weight": 0.35, "base_weight": 0.65},
     }
     return configs.get(stripe_method, configs["adaptive"])
 
@@ -66,7 +96,7 @@ def vectorized_pattern_generation(hidden_array, pattern_type, stripe_method, pro
     """
     # 入力画像がRGBAの場合はRGBに変換
     if len(hidden_array.shape) == 3 and hidden_array.shape[2] == 4:
-        print(f"⚠️ Hidden array is RGBA in vectorized_pattern_generation: {hidden_array.shape}, converting to RGB")
+        logger.warning("⚠️ Hidden array is RGBA in vectorized_pattern_generation: %s, converting to RGB", hidden_array.shape)
         hidden_array = hidden_array[:, :, :3]
     # 最適化されたデフォルトパラメータ設定
     if processing_params is None:
@@ -97,18 +127,22 @@ def vectorized_pattern_generation(hidden_array, pattern_type, stripe_method, pro
     stripe_color1 = processing_params.get('stripe_color1', '#000000')       # 縞模様カラー1
     stripe_color2 = processing_params.get('stripe_color2', '#FFFFFF')       # 縞模様カラー2
     
+    # 隠し画像の解析（シャープネス・グレースケール・コントラスト・エッジ・マスク）は
+    # 並列に動く全パターン生成で共有し、それぞれ1回だけ計算する
+    analysis = HiddenImageAnalysis(hidden_array)
+    
     try:
         config = get_cached_pattern_config(stripe_method)
-        print(f"🚀 Optimized Vectorized pattern generation: {stripe_method}")
-        print(f"Config: {config}")
-        print(f"Optimized Params: opacity={opacity}, blur={blur_radius}, sharpness={sharpness_boost}")
-        print(f"Stripe Colors: {stripe_color1} - {stripe_color2}")
+        logger.debug("🚀 Optimized Vectorized pattern generation: %s", stripe_method)
+        logger.debug("Config: %s", config)
+        logger.debug("Optimized Params: opacity=%s, blur=%s, sharpness=%s", opacity, blur_radius, sharpness_boost)
+        logger.debug("Stripe Colors: %s - %s", stripe_color1, stripe_color2)
 
         # **最適化パラメータ適用処理**
         # オーバーレイ専用処理（最適化パラメータ対応）
         if stripe_method == "overlay":
             overlay_pattern = create_optimized_overlay_pattern(
-                hidden_array, pattern_type, opacity, blur_radius, contrast_boost, sharpness_boost, stripe_color1, stripe_color2
+                analysis, pattern_type, opacity, blur_radius, contrast_boost, sharpness_boost, stripe_color1, stripe_color2
             )
             return optimize_image_for_processing(overlay_pattern)
 
@@ -118,24 +152,29 @@ def vectorized_pattern_generation(hidden_array, pattern_type, stripe_method, pro
             # オーバーレイパターンを並列生成（最適化パラメータ適用）
             overlay_future = executor.submit(
                 create_optimized_overlay_pattern,
-                hidden_array, pattern_type, opacity, blur_radius, contrast_boost, sharpness_boost, stripe_color1, stripe_color2
+                analysis, pattern_type, opacity, blur_radius, contrast_boost, sharpness_boost, stripe_color1, stripe_color2
             )
             
             # ベースパターンを並列生成（最適化パラメータ適用）
             if config["base_method"] == "high_frequency":
                 base_future = executor.submit(
                     create_optimized_high_frequency_pattern,
-                    hidden_array, pattern_type, strength, enhancement_factor, frequency, sharpness_boost, stripe_color1, stripe_color2
+                    analysis, pattern_type, strength, enhancement_factor, frequency, sharpness_boost, stripe_color1, stripe_color2
+                )
+            elif config["base_method"] == "gradation":
+                base_future = executor.submit(
+                    create_gradation_stripe_base,
+                    analysis, pattern_type, stripe_color1, stripe_color2
                 )
             elif config["base_method"] and "adaptive" in config["base_method"]:
                 base_future = executor.submit(
                     create_optimized_adaptive_pattern,
-                    hidden_array, pattern_type, strength, contrast_boost, color_shift, sharpness_boost, stripe_color1, stripe_color2
+                    analysis, pattern_type, strength, contrast_boost, color_shift, sharpness_boost, stripe_color1, stripe_color2
                 )
             else:
                 base_future = executor.submit(
                     create_optimized_adaptive_pattern,
-                    hidden_array, pattern_type, strength, contrast_boost, color_shift, sharpness_boost, stripe_color1, stripe_color2
+                    analysis, pattern_type, strength, contrast_boost, color_shift, sharpness_boost, stripe_color1, stripe_color2
                 )
             
             # 結果を並列取得
@@ -144,14 +183,14 @@ def vectorized_pattern_generation(hidden_array, pattern_type, stripe_method, pro
 
         # **超高速ベクトル化合成**
         if base_pattern is None:
-            print("Using optimized overlay-only pattern (vectorized)")
+            logger.debug("Using optimized overlay-only pattern (vectorized)")
             return optimize_image_for_processing(overlay_pattern)
 
-        print(f"Combining optimized patterns with shapes: base={base_pattern.shape}, overlay={overlay_pattern.shape}")
+        logger.debug("Combining optimized patterns with shapes: base=%s, overlay=%s", base_pattern.shape, overlay_pattern.shape)
         
         # 形状チェック（高速）
         if base_pattern.shape != overlay_pattern.shape:
-            print("Shape mismatch, using optimized overlay only")
+            logger.debug("Shape mismatch, using optimized overlay only")
             del base_pattern
             clear_memory()
             return optimize_image_for_processing(overlay_pattern)
@@ -173,22 +212,22 @@ def vectorized_pattern_generation(hidden_array, pattern_type, stripe_method, pro
         del base_pattern, overlay_pattern
         clear_memory()
         
-        print(f"✅ Optimized Vectorized pattern generation completed: {result.shape}")
+        logger.debug("✅ Optimized Vectorized pattern generation completed: %s", result.shape)
         return result
 
     except Exception as e:
-        print(f"❌ Optimized Vectorized pattern generation error: {e}")
+        logger.error("❌ Optimized Vectorized pattern generation error: %s", e)
         
         # **高速フォールバック処理**
         try:
-            print("🔄 Using optimized high-speed fallback pattern generation")
+            logger.debug("🔄 Using optimized high-speed fallback pattern generation")
             overlay_pattern = create_optimized_overlay_pattern(
-                hidden_array, pattern_type, opacity, blur_radius, contrast_boost, sharpness_boost, stripe_color1, stripe_color2
+                analysis, pattern_type, opacity, blur_radius, contrast_boost, sharpness_boost, stripe_color1, stripe_color2
             )
             return optimize_image_for_processing(overlay_pattern)
             
         except Exception as fallback_error:
-            print(f"❌ Optimized fallback error: {fallback_error}")
+            logger.error("❌ Optimized fallback error: %s", fallback_error)
             
             # **最終フォールバック：完全ベクトル化縞模様**
             height, width = hidden_array.shape[:2]
@@ -214,7 +253,7 @@ def batch_process_images(image_configs, max_workers=4):
     """
     バッチ処理：複数画像の並列処理（超高速版）
     """
-    print(f"🚀 Starting batch processing with {max_workers} workers")
+    logger.info("🚀 Starting batch processing with %d workers", max_workers)
     
     results = {}
     
@@ -243,12 +282,12 @@ def batch_process_images(image_configs, max_workers=4):
             try:
                 result = future.result()
                 results[config.get('id', len(results))] = result
-                print(f"✅ Batch item completed: {config.get('id', 'unknown')}")
+                logger.debug("✅ Batch item completed: %s", config.get('id', 'unknown'))
             except Exception as e:
-                print(f"❌ Batch item failed: {e}")
+                logger.error("❌ Batch item failed: %s", e)
                 results[config.get('id', len(results))] = {"error": str(e)}
     
-    print(f"🎉 Batch processing completed: {len(results)} items")
+    logger.info("🎉 Batch processing completed: %d items", len(results))
     return results
 
 def get_processing_performance_info():
@@ -296,7 +335,7 @@ def create_preview_image(result_path, preview_size=(400, 533)):
             return preview_filename
             
     except Exception as e:
-        print(f"❌ Preview generation error: {e}")
+        logger.error("❌ Preview generation error: %s", e)
         return None
 
 def validate_processing_params(params):
@@ -327,7 +366,7 @@ def validate_processing_params(params):
         "overlay", "high_frequency", "adaptive", "adaptive_subtle", 
         "adaptive_strong", "adaptive_minimal", "perfect_subtle", 
         "ultra_subtle", "near_perfect", "color_preserving", 
-        "hue_preserving", "blended", "hybrid_overlay"
+        "hue_preserving", "blended", "hybrid_overlay", "gradation"
     }
     if params.get('stripe_method') not in valid_methods:
         errors.append(f"Invalid stripe_method. Must be one of: {valid_methods}")
@@ -374,7 +413,8 @@ def estimate_processing_time(params):
         "hue_preserving": 0.7,       # やや重い
         "blended": 0.6,              # 中重い
         "hybrid_overlay": 0.5,       # 中速
-        "moire_pattern": 0.8         # 重い
+        "moire_pattern": 0.8,        # 重い
+        "gradation": 0.4             # 高速（ベクトル化）
     }
     
     stripe_method = params.get('stripe_method', 'adaptive')
@@ -407,52 +447,17 @@ def estimate_processing_time(params):
 
 def cleanup_old_files(max_age_hours=1):
     """
-    古いファイルのクリーンアップ（ベクトル化版）
+    古いファイルのクリーンアップ（後方互換性のため残す）
+    有効期限は登録時に生成物インデックスへ記録されるため、max_age_hours は使用しない
     """
     try:
-        static_dir = "static"
-        if not os.path.exists(static_dir):
-            return 0
-        
-        current_time = time.time()
-        max_age_seconds = max_age_hours * 3600
-        deleted_count = 0
-        
-        # ファイル一覧取得
-        files = [f for f in os.listdir(static_dir) if f.endswith(('.png', '.jpg', '.jpeg'))]
-        
-        # **ベクトル化による高速処理**
-        if files:
-            # ファイル情報を一括取得
-            file_paths = [os.path.join(static_dir, f) for f in files]
-            file_times = []
-            
-            for file_path in file_paths:
-                try:
-                    file_times.append(os.path.getmtime(file_path))
-                except OSError:
-                    file_times.append(current_time)  # アクセスできない場合は現在時刻
-            
-            # NumPyで一括処理
-            file_times = np.array(file_times)
-            ages = current_time - file_times
-            old_files_mask = ages > max_age_seconds
-            
-            # 古いファイルを削除
-            for i, is_old in enumerate(old_files_mask):
-                if is_old:
-                    try:
-                        os.remove(file_paths[i])
-                        deleted_count += 1
-                        print(f"🗑️ Deleted old file: {files[i]}")
-                    except OSError as e:
-                        print(f"❌ Failed to delete {files[i]}: {e}")
-        
-        print(f"🧹 Cleanup completed: {deleted_count} files deleted")
+        result = get_artifact_index().sweep()
+        deleted_count = result["expired"] + result["evicted"]
+        logger.debug("🧹 Cleanup completed: %d files deleted", deleted_count)
         return deleted_count
         
     except Exception as e:
-        print(f"❌ Cleanup error: {e}")
+        logger.error("❌ Cleanup error: %s", e)
         return 0
 
 def get_system_resource_usage():
@@ -765,53 +770,34 @@ def evaluate_pattern_quality(pattern_result):
         return min(1.0, quality_score)
         
     except Exception as e:
-        print(f"Quality evaluation error: {e}")
+        logger.warning("⚠️ Quality evaluation error: %s", e)
         return 0.0
 
 def create_optimized_overlay_pattern(hidden_array, pattern_type, opacity, blur_radius, contrast_boost, sharpness_boost, stripe_color1="#000000", stripe_color2="#FFFFFF"):
     """最適化パラメータ対応オーバーレイパターン生成（縞模様カラー対応）"""
     
-    print(f"🎯 Creating optimized overlay pattern: opacity={opacity}, blur={blur_radius}, sharpness={sharpness_boost}")
-    print(f"🎨 Stripe colors: {stripe_color1} - {stripe_color2}")
+    logger.debug("🎯 Creating optimized overlay pattern: opacity=%s, blur=%s, sharpness=%s", opacity, blur_radius, sharpness_boost)
+    logger.debug("🎨 Stripe colors: %s - %s", stripe_color1, stripe_color2)
     
     # PIL画像に変換（シャープネス処理用）
-    hidden_pil = Image.fromarray(hidden_array.astype('uint8'))
-    
-    # 1. シャープネス強化の適用（新機能）
-    if abs(sharpness_boost) > 0.001:
-        if sharpness_boost > 0:
-            # プラス値：シャープネス強化
-            enhancer = ImageEnhance.Sharpness(hidden_pil)
-            hidden_pil = enhancer.enhance(1.0 + sharpness_boost)
-            print(f"  ✅ Sharpness enhanced by {sharpness_boost}")
-        else:
-            # マイナス値：ソフト化（ブラー効果）
-            blur_amount = abs(sharpness_boost) * 3  # -1.0 = 3px blur
-            hidden_pil = hidden_pil.filter(ImageFilter.GaussianBlur(radius=blur_amount))
-            print(f"  ✅ Softened with blur radius {blur_amount}")
+    # 1. シャープネス強化の適用（解析オブジェクトで共有、マイナス値は -1.0 = 3px のぼかし）
+    analysis = get_hidden_analysis(hidden_array).sharpened(sharpness_boost, blur_scale=3)
+    if sharpness_boost > 0.001:
+        logger.debug("  ✅ Sharpness enhanced by %s", sharpness_boost)
+    elif sharpness_boost < -0.001:
+        logger.debug("  ✅ Softened with blur radius %s", abs(sharpness_boost) * 3)
     
-    # NumPy配列に戻す
-    processed_hidden_array = np.array(hidden_pil)
-    height, width = processed_hidden_array.shape[:2]
+    height, width = analysis.height, analysis.width
     
     # 2. プロトタイプと同じオーバーレイ処理を実装
-    print(f"  📋 Using prototype-compatible overlay processing")
+    logger.debug("  📋 Using prototype-compatible overlay processing")
     
     # opacity=0の場合はプロトタイプのデフォルト0.6を使用
     effective_opacity = opacity if opacity > 0.001 else 0.6
-    print(f"  🎯 Effective opacity: {effective_opacity}")
-    
-    # グレースケール変換
-    if len(processed_hidden_array.shape) == 3:
-        hidden_gray = cv2.cvtColor(processed_hidden_array, cv2.COLOR_RGB2GRAY).astype(np.float32)
-    else:
-        hidden_gray = processed_hidden_array.astype(np.float32)
+    logger.debug("  🎯 Effective opacity: %s", effective_opacity)
     
-    # 隠し画像を二値化 - 黒い部分（暗い部分）を抽出（プロトタイプと同じ）
-    _, binary_mask = cv2.threshold(hidden_gray, 100, 255, cv2.THRESH_BINARY_INV)
-    
-    # マスクをぼかして滑らかにする（プロトタイプと同じ）
-    blurred_mask = cv2.GaussianBlur(binary_mask, (5, 5), 0)
+    # 隠し画像を二値化して黒い部分（暗い部分）を抽出し、ぼかして滑らかにする（プロトタイプと同じ）
+    blurred_mask = analysis.blurred_mask(5)
     
     # マスクを正規化（プロトタイプと同じ）
     mask = blurred_mask / 255.0 * effective_opacity
@@ -824,21 +810,10 @@ def create_optimized_overlay_pattern(hidden_array, pattern_type, opacity, blur_r
     color1_rgb = hex_to_rgb(stripe_color1)
     color2_rgb = hex_to_rgb(stripe_color2)
     
-    print(f"  🎨 Using stripe colors: {color1_rgb} - {color2_rgb}")
-    
-    # カスタム色で縞模様を作成
-    stripes = np.zeros((height, width, 3), dtype=np.uint8)
+    logger.debug("  🎨 Using stripe colors: %s - %s", color1_rgb, color2_rgb)
     
-    if pattern_type == "horizontal":
-        # 横縞パターン（カスタム色対応）
-        for y in range(height):
-            color = color1_rgb if y % 2 == 0 else color2_rgb
-            stripes[y, :] = [color[0], color[1], color[2]]
-    else:
-        # 縦縞パターン（カスタム色対応）
-        for x in range(width):
-            color = color1_rgb if x % 2 == 0 else color2_rgb
-            stripes[:, x] = [color[0], color[1], color[2]]
+    # カスタム色で縞模様を作成（キャッシュ済みタイルの読み取り専用ビュー）
+    stripes = create_stripe_layer(height, width, pattern_type, color1_rgb, color2_rgb, writable=False)
     
     # 均一なグレー（プロトタイプと同じ）
     gray = np.ones((height, width, 3), dtype=np.float32) * 128
@@ -856,15 +831,15 @@ def create_optimized_overlay_pattern(hidden_array, pattern_type, opacity, blur_r
         mean_val = np.mean(result)
         result = (result - mean_val) * contrast_boost + mean_val
         result = np.clip(result, 0, 255)
-        print(f"  ✅ Contrast adjusted by {contrast_boost}")
+        logger.debug("  ✅ Contrast adjusted by %s", contrast_boost)
     
     # 4. ブラー調整（blur_radius=0がデフォルト）
     if blur_radius > 0:
         result = cv2.GaussianBlur(result.astype(np.uint8), 
                                  (blur_radius*2+1, blur_radius*2+1), 0)
-        print(f"  ✅ Blur applied: {blur_radius}px")
+        logger.debug("  ✅ Blur applied: %spx", blur_radius)
     else:
-        print(f"  🎯 No blur applied (optimal for hidden image)")
+        logger.debug("  🎯 No blur applied (optimal for hidden image)")
     
     return result.astype(np.uint8)
 
@@ -872,88 +847,81 @@ def create_optimized_high_frequency_pattern(hidden_array, pattern_type, strength
     """最適化パラメータ対応高周波パターン生成（縞模様カラー対応）"""
     from patterns.moire import create_high_frequency_moire_stripes
     
-    print(f"🌊 Creating optimized high frequency pattern: strength={strength}, freq={frequency}, sharpness={sharpness_boost}")
-    print(f"🎨 Stripe colors: {stripe_color1} - {stripe_color2}")
+    logger.debug("🌊 Creating optimized high frequency pattern: strength=%s, freq=%s, sharpness=%s", strength, frequency, sharpness_boost)
+    logger.debug("🎨 Stripe colors: %s - %s", stripe_color1, stripe_color2)
     
-    # シャープネス前処理
-    if abs(sharpness_boost) > 0.001:
-        hidden_pil = Image.fromarray(hidden_array.astype('uint8'))
-        
-        if sharpness_boost > 0:
-            enhancer = ImageEnhance.Sharpness(hidden_pil)
-            hidden_pil = enhancer.enhance(1.0 + sharpness_boost)
-        else:
-            blur_amount = abs(sharpness_boost) * 2
-            hidden_pil = hidden_pil.filter(ImageFilter.GaussianBlur(radius=blur_amount))
-        
-        processed_hidden_array = np.array(hidden_pil)
-    else:
-        processed_hidden_array = hidden_array
+    # シャープネス前処理（解析オブジェクトで共有）
+    analysis = get_hidden_analysis(hidden_array).sharpened(sharpness_boost, blur_scale=2)
     
     # 強度調整
     adjusted_strength = max(0.005, min(0.1, strength))
     
     # 基本パターンを生成（カスタム色対応）
-    base_pattern = create_high_frequency_moire_stripes(processed_hidden_array, pattern_type, adjusted_strength, stripe_color1, stripe_color2)
+    base_pattern = create_high_frequency_moire_stripes(analysis, pattern_type, adjusted_strength, stripe_color1, stripe_color2)
     
-    # 周波数調整（より明確な差を出すため）
-    if frequency != 1:
-        height, width = base_pattern.shape[:2]
-        if pattern_type == "horizontal":
-            y_coords = np.arange(height).reshape(-1, 1)
-            freq_mask = ((y_coords * frequency) % 2).astype(np.float32)
-        else:
-            x_coords = np.arange(width).reshape(1, -1)
-            freq_mask = ((x_coords * frequency) % 2).astype(np.float32)
-        
-        freq_mask = np.broadcast_to(freq_mask, (height, width))
-        freq_mask_3d = np.stack([freq_mask, freq_mask, freq_mask], axis=2)
-        
-        # 周波数マスクを適用
-        base_pattern = base_pattern.astype(np.float32)
-        base_pattern = base_pattern * (0.7 + 0.3 * freq_mask_3d)
-        base_pattern = np.clip(base_pattern, 0, 255)
+    enhance = abs(enhancement_factor - 1.0) > 0.01
+    if frequency == 1 and not enhance:
+        return base_pattern
     
-    # エンハンスメント調整
-    if abs(enhancement_factor - 1.0) > 0.01:
-        # エッジ強調
-        gray = cv2.cvtColor(base_pattern.astype(np.uint8), cv2.COLOR_RGB2GRAY)
-        edges = cv2.Canny(gray, 50, 150)
-        edge_mask = (edges / 255.0 * enhancement_factor).astype(np.float32)
-        edge_mask_3d = np.stack([edge_mask, edge_mask, edge_mask], axis=2)
-        
-        enhanced = base_pattern.astype(np.float32) * (1.0 + edge_mask_3d * 0.3)
-        base_pattern = np.clip(enhanced, 0, 255)
+    # 周波数調整とエッジ強調は、画素値と2値の状態（縞の位相・エッジの有無）だけで決まるため
+    # 状態ごとの 256 エントリのテーブル参照で行う（画像全体の float32 の一時配列を作らない）
+    # テーブルは最適化前の画像全体の計算と同じ float32 の演算で作るため、出力は一致する
+    height, width = base_pattern.shape[:2]
+    values = np.arange(256, dtype=np.float32)
+    state = np.zeros((height, width), dtype=np.uint8)  # ビット0: 縞の位相、ビット1: エッジの有無
     
-    return base_pattern.astype(np.uint8)
+    # 周波数調整（より明確な差を出すため、位相 0 の縞を 0.7 倍）
+    scaled = values[np.newaxis, :]  # (位相, 256)
+    if frequency != 1:
+        phase = create_stripe_phase(height, width, pattern_type, frequency, writable=False)
+        np.bitwise_or(state, phase > 0, out=state)
+        phase_levels = np.array([[0.0], [1.0]], dtype=np.float32)
+        scaled = np.clip(values * (0.7 + 0.3 * phase_levels), 0, 255)
+    
+    # エンハンスメント調整（周波数調整後の画像のエッジ上を強調）
+    edge_scales = np.ones(1, dtype=np.float32)
+    if enhance:
+        adjusted = _apply_state_tables(base_pattern, scaled.astype(np.uint8), state)
+        edges = cv2.Canny(cv2.cvtColor(adjusted, cv2.COLOR_RGB2GRAY), 50, 150)
+        del adjusted
+        np.bitwise_or(state, (edges >> 7) << 1, out=state)
+        edge_levels = (np.array([0, 255], dtype=np.uint8) / 255.0 * enhancement_factor).astype(np.float32)
+        edge_scales = 1.0 + edge_levels * 0.3
+    
+    tables = np.empty((4, 256), dtype=np.uint8)
+    for code in range(4):
+        phase_index = code & 1 if len(scaled) > 1 else 0
+        edge_index = code >> 1 if len(edge_scales) > 1 else 0
+        tables[code] = np.clip(scaled[phase_index] * edge_scales[edge_index], 0, 255).astype(np.uint8)
+    return _apply_state_tables(base_pattern, tables, state)
+
+def _apply_state_tables(values: np.ndarray, tables: np.ndarray, state: np.ndarray) -> np.ndarray:
+    """
+    uint8 画像 values を画素ごとの状態 state (H, W) に応じたテーブル tables[状態] (256,) で変換
+    状態ごとに cv2.LUT を適用し、その状態の画素だけを書き込む
+    """
+    result = cv2.LUT(values, tables[0])
+    for code in range(1, len(tables)):
+        mask = state == code
+        if mask.any():
+            np.copyto(result, cv2.LUT(values, tables[code]), where=mask[:, :, np.newaxis])
+    return result
 
 def create_optimized_adaptive_pattern(hidden_array, pattern_type, strength, contrast_boost, color_shift, sharpness_boost, stripe_color1="#000000", stripe_color2="#FFFFFF"):
     """最適化パラメータ対応適応パターン生成（縞模様カラー対応）"""
     from patterns.moire import create_adaptive_moire_stripes
     
-    print(f"🎯 Creating optimized adaptive pattern: strength={strength}, contrast={contrast_boost}, sharpness={sharpness_boost}")
-    print(f"🎨 Stripe colors: {stripe_color1} - {stripe_color2}")
+    logger.debug("🎯 Creating optimized adaptive pattern: strength=%s, contrast=%s, sharpness=%s", strength, contrast_boost, sharpness_boost)
+    logger.debug("🎨 Stripe colors: %s - %s", stripe_color1, stripe_color2)
     
-    # シャープネス前処理
-    if abs(sharpness_boost) > 0.001:
-        hidden_pil = Image.fromarray(hidden_array.astype('uint8'))
-        
-        if sharpness_boost > 0:
-            enhancer = ImageEnhance.Sharpness(hidden_pil)
-            hidden_pil = enhancer.enhance(1.0 + sharpness_boost)
-        else:
-            blur_amount = abs(sharpness_boost) * 2
-            hidden_pil = hidden_pil.filter(ImageFilter.GaussianBlur(radius=blur_amount))
-        
-        processed_hidden_array = np.array(hidden_pil)
-    else:
-        processed_hidden_array = hidden_array
+    # シャープネス前処理（解析オブジェクトで共有）
+    analysis = get_hidden_analysis(hidden_array).sharpened(sharpness_boost, blur_scale=2)
     
     # 強度調整
     adjusted_strength = max(0.005, min(0.1, strength))
     
     # 基本パターンを生成（カスタム色対応）
-    base_pattern = create_adaptive_moire_stripes(processed_hidden_array, pattern_type, "adaptive", stripe_color1, stripe_color2)
+    base_pattern = create_adaptive_moire_stripes(analysis, pattern_type, "adaptive", stripe_color1, stripe_color2)
     
     # コントラスト調整
     if abs(contrast_boost - 1.0) > 0.01:
@@ -1016,161 +984,61 @@ def process_hidden_image(
         processing_params['stripe_color1'] = stripe_color1
         processing_params['stripe_color2'] = stripe_color2
     
-    start_time = time.time()
+    timer = PhaseTimer()
     settings = get_settings()
 
-    print(f"🚀 Starting ULTRA-FAST optimized vectorized processing...")
-    print(f"Parameters: {pattern_type}, {stripe_method}, {resize_method}")
-    print(f"Region: {region}")
-    print(f"Optimized Params: opacity={processing_params.get('opacity')}, blur={processing_params.get('blur_radius')}, sharpness={processing_params.get('sharpness_boost')}")
-    print(f"Stripe Colors: {processing_params.get('stripe_color1')} - {processing_params.get('stripe_color2')}")
+    logger.debug("🚀 Starting ULTRA-FAST optimized vectorized processing...")
+    logger.debug("Parameters: %s, %s, %s", pattern_type, stripe_method, resize_method)
+    logger.debug("Region: %s", region)
+    logger.debug("Optimized Params: opacity=%s, blur=%s, sharpness=%s", processing_params.get('opacity'), processing_params.get('blur_radius'), processing_params.get('sharpness_boost'))
+    logger.debug("Stripe Colors: %s - %s", processing_params.get('stripe_color1'), processing_params.get('stripe_color2'))
 
     try:
         # === フェーズ1: 超高速画像読み込み ===
-        phase_start = time.time()
+        timer.begin("load")
 
         if not os.path.exists(base_img_path):
             raise FileNotFoundError(f"Base image not found: {base_img_path}")
 
-        # **PIL最適化読み込み**
-        base_img_orig = Image.open(base_img_path)
-        original_size = (base_img_orig.width, base_img_orig.height)
-        print(f"Original size: {original_size}")
-        
-        # RGBAの場合はRGBに変換（アルファチャンネルを削除）
-        if base_img_orig.mode == 'RGBA':
-            base_img = Image.new('RGB', base_img_orig.size, (255, 255, 255))
-            base_img.paste(base_img_orig, mask=base_img_orig.split()[3])
-            base_img_orig.close()
-            print(f"Converted base image from RGBA to RGB")
-        else:
-            base_img = base_img_orig
-        
-        # 大画像の事前リサイズ（高速化）
-        if base_img.width * base_img.height > 8000000:
-            print("⚡ Large image detected, applying fast pre-resize...")
-            base_img.thumbnail((3000, 3000), Image.Resampling.BILINEAR)
+        # **デコード済みキャッシュから読み込み（8MP以上は事前縮小済み）**
+        source = load_source_image(base_img_path, max_pixels=8000000, thumbnail_size=(3000, 3000))
+        original_size = source.original_size
+        logger.debug("Original size: %s", original_size)
 
-        # **超高速領域抽出（PIL最適化）**
-        x, y, width, height = region
-        
-        # 境界チェック（ベクトル化）
-        bounds = np.array([x, y, width, height])
-        img_bounds = np.array([0, 0, base_img.width, base_img.height])
-        
-        x = max(0, min(x, base_img.width - 1))
-        y = max(0, min(y, base_img.height - 1))
-        width = min(width, base_img.width - x)
-        height = min(height, base_img.height - y)
-        
-        # 高速クロップ
-        region_pil = base_img.crop((x, y, x + width, y + height))
-        print(f"🖼️ Fast PIL crop completed: {region_pil.size}")
-        
-        # region_pilもRGBAの場合はRGBに変換
-        if region_pil.mode == 'RGBA':
-            rgb_pil = Image.new('RGB', region_pil.size, (255, 255, 255))
-            rgb_pil.paste(region_pil, mask=region_pil.split()[3])
-            region_pil = rgb_pil
-            print(f"Converted cropped region from RGBA to RGB")
+        # **固定サイズキャンバス（キャッシュ対応・読み取り専用）**
+        base_fixed_array = get_fixed_canvas(source, resize_method)
 
-        # **NumPy最適化変換**
-        hidden_img = optimize_image_for_processing(np.array(region_pil))
-        print(f"Hidden image optimized: {hidden_img.shape}")
-
-        # **高速リサイズ処理**
-        base_fixed = resize_to_fixed_size(base_img, method=resize_method)
-        base_fixed_array = optimize_image_for_processing(np.array(base_fixed))
-        
-        # メモリ解放
-        base_img.close()
-
-        del base_img, region_pil
-        clear_memory()
-
-        phase_time = time.time() - phase_start
-        print(f"⚡ Phase 1 (Optimized Image loading): {phase_time:.2f}s")
+        logger.debug("⚡ Phase 1 (Optimized Image loading): %.2fs", timer.end())
 
         # === フェーズ2: 超高速座標変換 ===
-        phase_start = time.time()
-        
-        img_width, img_height = original_size
+        timer.begin("transform")
         
-        # **ベクトル化による座標変換**
-        scale_factors = np.array([settings.TARGET_WIDTH / img_width, settings.TARGET_HEIGHT / img_height])
+        # **キャンバス生成と共通のジオメトリ計画による座標変換**
+        geometry = plan_canvas_geometry(original_size, resize_method)
+        x_fixed, y_fixed, width_fixed, height_fixed = geometry.map_region(region)
         
-        if resize_method == 'contain':
-            scale = np.min(scale_factors)
-            new_size = np.array([img_width, img_height]) * scale
-            offsets = (np.array([settings.TARGET_WIDTH, settings.TARGET_HEIGHT]) - new_size) // 2
-            
-            # 変換後座標（ベクトル化）
-            region_coords = np.array([x, y, width, height]) * scale
-            final_coords = region_coords + np.array([offsets[0], offsets[1], 0, 0])
-            
-        elif resize_method == 'cover':
-            scale = np.max(scale_factors)
-            crop_offset = ((np.array([img_width, img_height]) * scale - 
-                           np.array([settings.TARGET_WIDTH, settings.TARGET_HEIGHT])) / 2).astype(int)
-            
-            # 変換後座標（ベクトル化）
-            region_coords = np.array([x, y, width, height]) * scale
-            final_coords = region_coords - np.array([crop_offset[0], crop_offset[1], 0, 0])
-            
-        else:  # stretch
-            # スケール別変換（ベクトル化）
-            final_coords = np.array([x * scale_factors[0], y * scale_factors[1], 
-                                   width * scale_factors[0], height * scale_factors[1]])
+        logger.debug("Fixed region (vectorized): x=%s, y=%s, w=%s, h=%s", x_fixed, y_fixed, width_fixed, height_fixed)
 
-        # 境界クリッピング（ベクトル化）
-        x_fixed, y_fixed, width_fixed, height_fixed = final_coords.astype(int)
-        clipping_bounds = np.array([
-            [0, settings.TARGET_WIDTH - 1],   # x range
-            [0, settings.TARGET_HEIGHT - 1], # y range
-            [1, settings.TARGET_WIDTH],       # width range
-            [1, settings.TARGET_HEIGHT]       # height range
-        ])
-        
-        x_fixed = np.clip(x_fixed, clipping_bounds[0, 0], clipping_bounds[0, 1])
-        y_fixed = np.clip(y_fixed, clipping_bounds[1, 0], clipping_bounds[1, 1])
-        width_fixed = min(width_fixed, settings.TARGET_WIDTH - x_fixed)
-        height_fixed = min(height_fixed, settings.TARGET_HEIGHT - y_fixed)
-        
-        print(f"Fixed region (vectorized): x={x_fixed}, y={y_fixed}, w={width_fixed}, h={height_fixed}")
-
-        phase_time = time.time() - phase_start
-        print(f"⚡ Phase 2 (Optimized Coordinate transform): {phase_time:.2f}s")
+        logger.debug("⚡ Phase 2 (Optimized Coordinate transform): %.2fs", timer.end())
 
         # === フェーズ3: 超高速隠し画像準備 ===
-        phase_start = time.time()
-        
-        # **PIL高速リサイズ**
-        hidden_pil = Image.fromarray(hidden_img.astype('uint8'))
-        hidden_resized = hidden_pil.resize((width_fixed, height_fixed), Image.Resampling.BILINEAR)
-        
-        # RGBAの場合はRGBに変換
-        if hidden_resized.mode == 'RGBA':
-            rgb_hidden = Image.new('RGB', hidden_resized.size, (255, 255, 255))
-            rgb_hidden.paste(hidden_resized, mask=hidden_resized.split()[3])
-            hidden_resized = rgb_hidden
-            print(f"Converted hidden_resized from RGBA to RGB")
+        timer.begin("prepare")
         
-        hidden_array = optimize_image_for_processing(np.array(hidden_resized))
-        
-        print(f"Hidden array optimized: {hidden_array.shape}")
+        # **キャンバスから領域を切り出し（再リサイズ不要）**
+        hidden_array = optimize_image_for_processing(
+            base_fixed_array[y_fixed:y_fixed + height_fixed, x_fixed:x_fixed + width_fixed]
+        )
         
-        del hidden_img, hidden_pil, hidden_resized
-        clear_memory()
+        logger.debug("Hidden array optimized: %s", hidden_array.shape)
 
-        phase_time = time.time() - phase_start
-        print(f"⚡ Phase 3 (Optimized Hidden image prep): {phase_time:.2f}s")
+        logger.debug("⚡ Phase 3 (Optimized Hidden image prep): %.2fs", timer.end())
 
         # === フェーズ4: 形状マスク生成と適用 ===
-        phase_start = time.time()
+        timer.begin("pattern")
         
         # **形状マスクの生成（新機能）**
         if shape_type != "rectangle":
-            print(f"🎭 Creating shape mask: {shape_type}")
+            logger.debug("🎭 Creating shape mask: %s", shape_type)
             
             # 形状パラメータの準備（JSON文字列から辞書へ）
             try:
@@ -1183,14 +1051,14 @@ def process_hidden_image(
                 else:
                     shape_params_dict = shape_params or {}
             except json.JSONDecodeError as e:
-                print(f"⚠️ Error parsing shape params: {e}")
+                logger.warning("⚠️ Error parsing shape params: %s", e)
                 shape_params_dict = {}
             
             # 形状マスクの生成
             shape_mask = create_custom_shape_mask(
                 width_fixed, height_fixed, shape_type, **shape_params_dict
             )
-            print(f"Shape mask created: {shape_mask.shape}")
+            logger.debug("Shape mask created: %s", shape_mask.shape)
             
             # 隠し画像に形状マスクを適用
             if len(hidden_array.shape) == 3:  # カラー画像
@@ -1199,7 +1067,7 @@ def process_hidden_image(
             else:  # グレースケール
                 hidden_array = (hidden_array * (shape_mask / 255.0)).astype(np.uint8)
             
-            print(f"Shape mask applied to hidden image")
+            logger.debug("Shape mask applied to hidden image")
         
         # **最適化パラメータベクトル化パターン生成**
         stripe_pattern = vectorized_pattern_generation(
@@ -1208,118 +1076,85 @@ def process_hidden_image(
         
         # パターンがRGBAの場合はRGBに変換
         if len(stripe_pattern.shape) == 3 and stripe_pattern.shape[2] == 4:
-            print(f"⚠️ Stripe pattern is RGBA: {stripe_pattern.shape}, converting to RGB")
+            logger.warning("⚠️ Stripe pattern is RGBA: %s, converting to RGB", stripe_pattern.shape)
             stripe_pattern = stripe_pattern[:, :, :3]
         
-        print(f"Optimized vectorized pattern generated: {stripe_pattern.shape}")
+        logger.debug("Optimized vectorized pattern generated: %s", stripe_pattern.shape)
         
         del hidden_array
         clear_memory()
 
-        phase_time = time.time() - phase_start
-        print(f"⚡ Phase 4 (Shape mask + Pattern generation): {phase_time:.2f}s")
+        logger.debug("⚡ Phase 4 (Shape mask + Pattern generation): %.2fs", timer.end())
 
-        # === フェーズ5: 超高速最終合成 ===
-        phase_start = time.time()
+        # === フェーズ5: 超高速合成準備 ===
+        timer.begin("compose")
         
         # **ベクトル化による高速合成**
         # base_fixed_arrayがRGBAの場合はRGBに変換
         if len(base_fixed_array.shape) == 3 and base_fixed_array.shape[2] == 4:
-            print(f"⚠️ Base fixed array is RGBA: {base_fixed_array.shape}, converting to RGB")
+            logger.warning("⚠️ Base fixed array is RGBA: %s, converting to RGB", base_fixed_array.shape)
             base_fixed_array = base_fixed_array[:, :, :3]
         
-        print(f"Base fixed array shape: {base_fixed_array.shape}")
-        print(f"Stripe pattern shape for replacement: {stripe_pattern.shape}")
+        logger.debug("Base fixed array shape: %s", base_fixed_array.shape)
+        logger.debug("Stripe pattern shape for replacement: %s", stripe_pattern.shape)
         
-        result_fixed = base_fixed_array.copy()
+        region_fixed = (x_fixed, y_fixed, width_fixed, height_fixed)
+        composition_mask = None
         
         # **形状マスクを考慮した合成処理**
         if shape_type != "rectangle":
-            print(f"🎭 Applying shape-aware composition for {shape_type}")
-            
-            # 元の領域を取得
-            original_region = result_fixed[y_fixed:y_fixed + height_fixed, x_fixed:x_fixed + width_fixed].copy()
+            logger.debug("🎭 Preparing shape-aware composition for %s", shape_type)
             
             # 形状マスクを再生成（合成用）
-            if shape_type != "rectangle":
-                try:
-                    if isinstance(shape_params, str):
-                        if not shape_params.strip():
-                            shape_params_dict = {}
-                        else:
-                            shape_params_dict = json.loads(shape_params)
+            try:
+                if isinstance(shape_params, str):
+                    if not shape_params.strip():
+                        shape_params_dict = {}
                     else:
-                        shape_params_dict = shape_params or {}
-                except json.JSONDecodeError:
-                    shape_params_dict = {}
-                
-                composition_mask = create_custom_shape_mask(
-                    width_fixed, height_fixed, shape_type, **shape_params_dict
-                )
-                
-                # 3チャンネル用のマスクを作成
-                if len(original_region.shape) == 3:
-                    composition_mask_3d = np.stack([composition_mask, composition_mask, composition_mask], axis=2) / 255.0
+                        shape_params_dict = json.loads(shape_params)
                 else:
-                    composition_mask_3d = composition_mask / 255.0
-                
-                # マスクを使った合成: マスク部分はstripe_pattern、それ以外はoriginal
-                combined_region = (stripe_pattern * composition_mask_3d +
-                                 original_region * (1.0 - composition_mask_3d)).astype(np.uint8)
-                
-                result_fixed[y_fixed:y_fixed + height_fixed, x_fixed:x_fixed + width_fixed] = combined_region
-                print(f"✅ Shape-aware composition completed")
-            else:
-                # 四角形の場合は従来通り
-                result_fixed[y_fixed:y_fixed + height_fixed, x_fixed:x_fixed + width_fixed] = stripe_pattern
-        else:
-            # 四角形の場合は従来通りの領域置換
-            result_fixed[y_fixed:y_fixed + height_fixed, x_fixed:x_fixed + width_fixed] = stripe_pattern
-        
-        # 枠追加（最適化版）
-        if add_border:
-            result_fixed = add_black_border(
-                result_fixed, 
-                (x_fixed, y_fixed, width_fixed, height_fixed), 
-                border_width
+                    shape_params_dict = shape_params or {}
+            except json.JSONDecodeError:
+                shape_params_dict = {}
+            
+            # マスク部分はstripe_pattern、それ以外はoriginal
+            composition_mask = create_custom_shape_mask(
+                width_fixed, height_fixed, shape_type, **shape_params_dict
             )
-        
-        del stripe_pattern, base_fixed_array
-        clear_memory()
 
-        phase_time = time.time() - phase_start
-        print(f"⚡ Phase 5 (Optimized Final composition): {phase_time:.2f}s")
+        logger.debug("⚡ Phase 5 (Optimized Composition setup): %.2fs", timer.end())
 
-        # === フェーズ6: 超高速保存 ===
-        phase_start = time.time()
+        # === フェーズ6: 行バンド合成 + ストリーミング保存 ===
+        timer.begin("encode")
         
         # **高速ファイル保存**
+        encoder = get_encoder(settings.RESULT_OUTPUT_FORMAT, settings.RESULT_ENCODER_TIER)
         timestamp = int(time.time())
         result_id = uuid.uuid4().hex[:8]
-        result_filename = f"optimized_result_{result_id}_{timestamp}.png"
+        result_filename = f"optimized_result_{result_id}_{timestamp}.{encoder.extension}"
 
         os.makedirs("static", exist_ok=True)
         result_path = os.path.join("static", result_filename)
         
-        # PIL最適化保存
-        result_image = Image.fromarray(result_fixed.astype('uint8'))
-        result_image.save(
-            result_path,
-            format="PNG",
-            optimize=False,    # 速度優先
-            compress_level=3   # 圧縮レベルを下げて高速化
+        # 全体キャンバスを作らず、合成したバンドから順にエンコードして書き出す
+        canvas_height, canvas_width = base_fixed_array.shape[:2]
+        encoding = write_encoded_file(
+            result_path, encoder,
+            compose_bands(
+                base_fixed_array, region_fixed, stripe_pattern, composition_mask,
+                border_width if add_border else 0, settings.RESULT_BAND_ROWS
+            ),
+            canvas_width, canvas_height
         )
         
-        del result_fixed, result_image
+        del stripe_pattern, base_fixed_array, composition_mask
         clear_memory()
 
-        phase_time = time.time() - phase_start
-        print(f"⚡ Phase 6 (Optimized File saving): {phase_time:.2f}s")
+        logger.debug("⚡ Phase 6 (Banded composition + streaming save): %.2fs", timer.end())
 
         # === 処理完了 ===
-        total_time = time.time() - start_time
-        print(f"🎉 ULTRA-FAST optimized processing completed: {total_time:.2f}s")
-        print(f"🚀 Optimized speed improvement: ~{20:.1f}x faster than original")
+        total_time = timer.elapsed()
+        logger.info("🎉 ULTRA-FAST optimized processing completed: %.2fs", total_time)
 
         # 最適化状態をログ出力
         optimization_status = {
@@ -1327,22 +1162,22 @@ def process_hidden_image(
             "blur_optimized": processing_params.get('blur_radius', 5) == 0,
             "sharpness_boost_applied": abs(processing_params.get('sharpness_boost', 0.0)) > 0.001
         }
-        print(f"🎯 Optimization status: {optimization_status}")
+        logger.debug("🎯 Optimization status: %s", optimization_status)
 
         result_dict = {
             "result": result_filename,
             "processing_info": {
                 "processing_time": total_time,
                 "optimization_status": optimization_status,
-                "parameters_used": processing_params
+                "parameters_used": processing_params,
+                "encoding": encoding,
+                "timings": timer.as_dict()
             }
         }
-        print(f"Returning optimized result: {result_dict}")
+        logger.debug("Returning optimized result: %s", result_dict)
         return result_dict
 
     except Exception as e:
-        print(f"❌ Ultra-fast optimized processing error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Ultra-fast optimized processing error: %s", e)
         clear_memory()
         raise e
@@ -0,0 +1,159 @@
+"""
+ジョブストア - 非同期レンダリングジョブの状態管理
+レコードは最小限のフィールドのみ保持し、参照する結果ファイルと同じ期限で破棄する
+（期限切れの削除は定期スイーパーが行い、参照時にも期限を確認する）
+"""
+import asyncio
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+from config.app import get_settings
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+TERMINAL_STATES = (JOB_DONE, JOB_FAILED)
+
+
+class JobRecord:
+    """ジョブ1件分の状態（__slots__ でコンパクトに保持）"""
+
+    __slots__ = (
+        "id", "status", "phase", "phase_index", "phase_count",
+        "created_at", "started_at", "finished_at", "expires_at",
+        "phase_times", "result", "error", "version"
+    )
+
+    def __init__(self, job_id: str, phase_count: int, expires_at: float):
+        self.id = job_id
+        self.status = JOB_QUEUED
+        self.phase = None
+        self.phase_index = 0
+        self.phase_count = phase_count
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.expires_at = expires_at
+        self.phase_times = []   # [(phase, 開始時刻の経過秒)]
+        self.result = None
+        self.error = None
+        self.version = 0        # 状態が変わるたびに増加（SSE の差分検出用）
+
+    def elapsed(self) -> float:
+        end = self.finished_at or time.time()
+        return end - self.created_at
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "phase": self.phase,
+            "phase_index": self.phase_index,
+            "phase_count": self.phase_count,
+            "elapsed": round(self.elapsed(), 3),
+            "queue_wait": round(self.started_at - self.created_at, 3) if self.started_at else None,
+            "phases": [{"phase": name, "started_at": offset} for name, offset in self.phase_times],
+            "result": self.result,
+            "error": self.error
+        }
+
+
+class JobStore:
+    """スレッドセーフなジョブレコードの保管庫"""
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self._jobs: Dict[str, JobRecord] = {}
+        self._lock = threading.Lock()
+
+    def create(self, phase_count: int) -> JobRecord:
+        record = JobRecord(uuid.uuid4().hex, phase_count, time.time() + self.ttl)
+        with self._lock:
+            self._jobs[record.id] = record
+        return record
+
+    def get(self, job_id: str) -> Optional[JobRecord]:
+        with self._lock:
+            record = self._jobs.get(job_id)
+            if record is not None and record.expires_at <= time.time():
+                del self._jobs[job_id]
+                return None
+            return record
+
+    def discard(self, job_id: str):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def update_phase(self, job_id: str, phase_index: int, phase: str, timestamp: float):
+        """ワーカーからのフェーズ開始通知を反映"""
+        with self._lock:
+            record = self._jobs.get(job_id)
+            if record is None or record.status in TERMINAL_STATES:
+                return
+            if record.started_at is None:
+                record.started_at = timestamp
+                record.status = JOB_RUNNING
+            record.phase = phase
+            record.phase_index = phase_index
+            record.phase_times.append((phase, round(timestamp - record.created_at, 3)))
+            record.version += 1
+
+    def complete(self, job_id: str, result: Dict[str, Any]):
+        """完了を記録（結果ファイルと同じ期限まで保持）"""
+        with self._lock:
+            record = self._jobs.get(job_id)
+            if record is None:
+                return
+            record.status = JOB_DONE
+            record.result = result
+            record.finished_at = time.time()
+            record.expires_at = record.finished_at + self.ttl
+            record.version += 1
+
+    def fail(self, job_id: str, error: str):
+        with self._lock:
+            record = self._jobs.get(job_id)
+            if record is None:
+                return
+            record.status = JOB_FAILED
+            record.error = error
+            record.finished_at = time.time()
+            record.expires_at = record.finished_at + self.ttl
+            record.version += 1
+
+    def purge_expired(self) -> int:
+        """期限切れのレコードを削除"""
+        now = time.time()
+        with self._lock:
+            expired = [job_id for job_id, record in self._jobs.items() if record.expires_at <= now]
+            for job_id in expired:
+                del self._jobs[job_id]
+            return len(expired)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            counts = {JOB_QUEUED: 0, JOB_RUNNING: 0, JOB_DONE: 0, JOB_FAILED: 0}
+            for record in self._jobs.values():
+                counts[record.status] += 1
+            return counts
+
+
+async def run_job_sweeper(store: JobStore, interval: float):
+    """定期的に期限切れのレコードを削除（ジョブ作成のたびに全件を走査しない）"""
+    while True:
+        await asyncio.sleep(interval)
+        store.purge_expired()
+
+
+_job_store: Optional[JobStore] = None
+
+
+def get_job_store() -> JobStore:
+    """共有ジョブストアを取得"""
+    global _job_store
+    if _job_store is None:
+        _job_store = JobStore(get_settings().TEMP_FILE_EXPIRY)
+    return _job_store
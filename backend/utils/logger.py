@@ -0,0 +1,32 @@
+"""
+ログ出力 - 診断ログをレベルで制御する（LOG_LEVEL、既定は INFO）
+デバッグ用の詳細ログは %s 形式の引数で渡し、無効なレベルでは文字列化も行わない
+"""
+import logging
+import sys
+
+from config.app import get_settings
+
+ROOT_LOGGER_NAME = "pozt"
+
+_configured = False
+
+
+def configure_logging(level: str = None):
+    """pozt 配下のロガーに出力先とレベルを設定（ワーカープロセスでも最初の取得時に呼ばれる）"""
+    global _configured
+    root = logging.getLogger(ROOT_LOGGER_NAME)
+    root.setLevel((level or get_settings().LOG_LEVEL).upper())
+    if not _configured:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        root.addHandler(handler)
+        root.propagate = False
+        _configured = True
+
+
+def get_logger(name: str) -> logging.Logger:
+    """モジュール用のロガーを取得（例: get_logger(__name__) → pozt.utils.optimized_processor）"""
+    if not _configured:
+        configure_logging()
+    return logging.getLogger(f"{ROOT_LOGGER_NAME}.{name}")
@@ -0,0 +1,256 @@
+"""
+メモリ予約によるアドミッション制御
+ジョブごとのピークメモリを入力サイズ・領域・処理方法から見積もり、予算から予約してから実行する
+予算は固定値ではなく、サービス全体の上限（RENDER_MEMORY_LIMIT）から常駐分を引いた残り:
+    上限 - 親プロセスの RSS - 各ワーカーの待機時 RSS（キャッシュを含む） - 親プロセスのキャッシュの空き - 安全余裕
+常駐分はレンダリングプールがジョブの投入・開始・終了ごとに計測して更新する
+予算を超える場合は空くまで待たせ、予算全体でも足りない（単独でも上限を超える）ジョブは実行せずに拒否する
+
+RENDER_WORKERS=1 の場合はワーカーの空き待ちでジョブが1つずつ実行されるため、予約で待つことはなく、
+予算は「単独で実行すると上限を超えるジョブを拒否する」判定にだけ使われる
+（予約による待ち合わせが効くのは RENDER_WORKERS が 2 以上で、同時実行の合計を予算に収める場合）
+
+見積もりの係数は benchmarks/memory_budget.py の計測値から求め、実行時の計測ピークで補正する
+補正にはキャッシュに当たらなかった実行（見積もりが想定する初回処理）の計測値だけを使う
+"""
+import asyncio
+from collections import deque
+from typing import Any, Deque, Dict, NamedTuple, Optional, Tuple
+
+from config.settings import TARGET_WIDTH, TARGET_HEIGHT
+from core.geometry import plan_canvas_geometry
+from core.shape_masks import SHAPE_COMPLEXITY
+
+MB = 1024 * 1024
+
+# === 生成処理の見積もり（バイト/ピクセル） ===
+# 読み込み: デコード中は元画像の数倍を一時的に確保する（RGBA は RGB 変換とアルファ分離の分だけ多い）
+DECODE_BYTES_PER_PIXEL = {"RGBA": 12.0}
+DEFAULT_DECODE_BYTES_PER_PIXEL = 9.5
+CANVAS_BUILD_BYTES_PER_PIXEL = 10.0  # キャンバス生成時のリサンプル作業領域（キャンバスのピクセルあたり）
+DECODED_MAX_PIXELS = 4_000_000       # これを超える画像は縮小して保持（load_source_image と同じ）
+
+# パターン生成: キャンバス上の領域ピクセルあたりの作業領域（縞の生成方法ごと）
+STRIPE_BYTES_PER_PIXEL = {
+    "overlay": 47.0,
+    "high_frequency": 92.0,
+    "gradation": 76.0
+}
+DEFAULT_STRIPE_BYTES_PER_PIXEL = 65.0
+SHAPE_BYTES_PER_COMPLEXITY = 1.0  # 矩形以外の形状マスク（複雑さランク 1 あたり）
+
+# === 隠し画像抽出の見積もり ===
+REVERSE_DECODE_BYTES_PER_PIXEL = {"RGBA": 9.0}
+DEFAULT_REVERSE_DECODE_BYTES_PER_PIXEL = 5.5
+REVERSE_MAX_DIMENSION = 800  # 抽出前に縮小する長辺（extract_hidden_image_to_file と同じ）
+FOURIER_MAX_DIMENSION = 512  # これを超える場合はフーリエ解析を pattern_subtraction に切り替える
+EXTRACTION_BYTES_PER_PIXEL = {
+    "pattern_subtraction": 45.0,
+    "frequency_filtering": 55.0,
+    "adaptive_detection": 48.0,
+    "fourier_analysis": 75.0
+}
+
+BASE_BYTES = 4 * MB  # 見積もりに常に加える固定分
+
+# === 予算 ===
+SAFETY_MARGIN_BYTES = 16 * MB  # 常駐分の計測のずれ・アロケーターの断片化に備えて予算から除く分
+
+# === 実行時の補正 ===
+MIN_CALIBRATION_SAMPLES = 3  # これより少ない間は係数 1.0（見積もりどおり）
+CALIBRATION_MARGIN = 1.05    # 計測値/見積もり の最大値に掛ける余裕
+MIN_CALIBRATION_FACTOR = 0.8  # 係数の範囲（計測の異常値で見積もりを大きく外さないため）
+MAX_CALIBRATION_FACTOR = 2.0
+
+
+class MemoryBudgetExceededError(Exception):
+    """単独でも予算を超えるため実行できない場合の例外"""
+
+    def __init__(self, required: int, limit: int):
+        super().__init__(
+            f"Estimated memory {required / MB:.0f}MB exceeds the available processing memory of {limit / MB:.0f}MB"
+        )
+        self.required = required
+        self.limit = limit
+
+
+class MemoryEstimate(NamedTuple):
+    """ジョブのピークメモリの見積もり（key ごとに実測値で補正する）"""
+    key: str          # render:overlay / preview:overlay / reverse:fourier_analysis など
+    model_bytes: int  # 係数から求めた見積もり（補正前）
+
+
+def _decode_bytes(pixels: int, mode: str, table: Dict[str, float], default: float) -> float:
+    return pixels * table.get(mode, default)
+
+
+def estimate_render_peak(source_size: Tuple[int, int], source_mode: str, region, resize_method: str,
+                         stripe_method: str, shape_type: str = "rectangle",
+                         canvas_size: Optional[Tuple[int, int]] = None) -> int:
+    """
+    生成処理のピークメモリ（ワーカーの RSS 増加分、バイト）
+    読み込み（デコード・キャンバス生成）とパターン生成のうち大きい方を見積もる
+    """
+    canvas_size = tuple(canvas_size) if canvas_size else (TARGET_WIDTH, TARGET_HEIGHT)
+    source_pixels = source_size[0] * source_size[1]
+    canvas_pixels = canvas_size[0] * canvas_size[1]
+
+    load_bytes = max(
+        _decode_bytes(source_pixels, source_mode, DECODE_BYTES_PER_PIXEL, DEFAULT_DECODE_BYTES_PER_PIXEL),
+        canvas_pixels * CANVAS_BUILD_BYTES_PER_PIXEL
+    )
+
+    # パターン生成中もキャンバスとデコード済み画像は保持される
+    retained_bytes = canvas_pixels * 3 + min(source_pixels, DECODED_MAX_PIXELS) * 3
+    _, _, region_width, region_height = plan_canvas_geometry(source_size, resize_method, canvas_size).map_region(region)
+    region_bytes_per_pixel = STRIPE_BYTES_PER_PIXEL.get(stripe_method, DEFAULT_STRIPE_BYTES_PER_PIXEL)
+    if shape_type != "rectangle":
+        region_bytes_per_pixel += SHAPE_BYTES_PER_COMPLEXITY * SHAPE_COMPLEXITY.get(shape_type, 3)
+    pattern_bytes = retained_bytes + region_width * region_height * region_bytes_per_pixel
+
+    return int(max(load_bytes, pattern_bytes) + BASE_BYTES)
+
+
+def reverse_extraction_method(source_size: Tuple[int, int], extraction_method: str) -> str:
+    """縮小後のサイズで実際に使われる抽出方法（大きい画像のフーリエ解析は切り替わる）"""
+    work_dimension = min(max(source_size), REVERSE_MAX_DIMENSION)
+    if extraction_method == "fourier_analysis" and work_dimension > FOURIER_MAX_DIMENSION:
+        return "pattern_subtraction"
+    return extraction_method
+
+
+def estimate_reverse_peak(source_size: Tuple[int, int], source_mode: str, extraction_method: str) -> int:
+    """隠し画像抽出のピークメモリ（デコードと縮小後の抽出処理のうち大きい方、バイト）"""
+    width, height = source_size
+    ratio = min(1.0, REVERSE_MAX_DIMENSION / max(width, height))
+    work_pixels = int(width * ratio) * int(height * ratio)
+
+    load_bytes = _decode_bytes(width * height, source_mode, REVERSE_DECODE_BYTES_PER_PIXEL,
+                               DEFAULT_REVERSE_DECODE_BYTES_PER_PIXEL)
+    extract_bytes = work_pixels * EXTRACTION_BYTES_PER_PIXEL.get(
+        extraction_method, EXTRACTION_BYTES_PER_PIXEL["pattern_subtraction"]
+    )
+    return int(max(load_bytes, extract_bytes) + BASE_BYTES)
+
+
+class MemoryBudget:
+    """
+    予約済みメモリの合計を予算内に保つ（待機は到着順）
+    予算 = 上限 - 常駐分（update_resident で更新）。予算全体より大きいジョブは check で拒否する
+    状態はイベントループのスレッドからのみ更新する
+    limit_bytes=0 の場合は制御しない
+    """
+
+    def __init__(self, limit_bytes: int, calibration_window: int = 20):
+        self.limit = max(0, limit_bytes)
+        self.resident = 0
+        self.budget = max(0, self.limit - SAFETY_MARGIN_BYTES)
+        self.calibration_window = max(1, calibration_window)
+        self.reserved = 0
+        self.max_reserved = 0
+        self.rejected = 0
+        self.waited = 0
+        self._waiters: Deque[Tuple[int, "asyncio.Future"]] = deque()
+        self._ratios: Dict[str, Deque[float]] = {}  # key → 直近の 計測値/見積もり
+
+    @property
+    def enabled(self) -> bool:
+        return self.limit > 0
+
+    def update_resident(self, resident_bytes: int):
+        """常駐分の計測値から予算を更新し、増えた分で実行できる待機中のジョブを再開する"""
+        if not self.enabled:
+            return
+        self.resident = max(0, resident_bytes)
+        self.budget = max(0, self.limit - self.resident - SAFETY_MARGIN_BYTES)
+        self._wake()
+
+    def factor(self, key: str) -> float:
+        """見積もりに掛ける補正係数（直近の計測値/見積もりの最大値 + 余裕）"""
+        ratios = self._ratios.get(key)
+        if not ratios or len(ratios) < MIN_CALIBRATION_SAMPLES:
+            return 1.0
+        return min(MAX_CALIBRATION_FACTOR, max(MIN_CALIBRATION_FACTOR, max(ratios) * CALIBRATION_MARGIN))
+
+    def reservation_bytes(self, estimate: MemoryEstimate) -> int:
+        """補正後の予約量"""
+        return int(estimate.model_bytes * self.factor(estimate.key))
+
+    def check(self, nbytes: int):
+        """予算全体を超える場合は MemoryBudgetExceededError（他のジョブを待っても実行できないため）"""
+        if self.enabled and nbytes > self.budget:
+            self.rejected += 1
+            raise MemoryBudgetExceededError(nbytes, self.budget)
+
+    def _grant(self, nbytes: int):
+        self.reserved += nbytes
+        self.max_reserved = max(self.max_reserved, self.reserved)
+
+    async def reserve(self, nbytes: int) -> int:
+        """
+        予算内に収まるまで待ってから予約し、予約量を返す（先に待っているジョブを追い越さない）
+        check の後に常駐分が増えて予算より大きくなった場合は予算全体を予約する（単独で実行）
+        """
+        if not self.enabled:
+            return 0
+        nbytes = min(nbytes, self.budget)
+        if not self._waiters and self.reserved + nbytes <= self.budget:
+            self._grant(nbytes)
+            return nbytes
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append((nbytes, waiter))
+        self.waited += 1
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # 予約済みになった直後に取り消された場合は返却する
+                self.release(nbytes)
+            else:
+                self._waiters = deque(item for item in self._waiters if item[1] is not waiter)
+                self._wake()
+            raise
+        return nbytes
+
+    def release(self, nbytes: int):
+        """予約を返却し、収まるようになった待機中のジョブを再開する"""
+        if not self.enabled:
+            return
+        self.reserved = max(0, self.reserved - nbytes)
+        self._wake()
+
+    def _wake(self):
+        while self._waiters:
+            nbytes, waiter = self._waiters[0]
+            if waiter.done():
+                self._waiters.popleft()
+                continue
+            if self.reserved + nbytes > self.budget:
+                break
+            self._waiters.popleft()
+            self._grant(nbytes)
+            waiter.set_result(None)
+
+    def calibrate(self, estimate: MemoryEstimate, measured_bytes: Optional[int]):
+        """
+        ワーカーで計測したピーク（RSS 増加分）を記録して以降の見積もりを補正
+        キャッシュに当たった実行は計測値が小さくなるため、呼び出し側で None にして除く
+        """
+        if measured_bytes is None or estimate.model_bytes <= 0:
+            return
+        ratios = self._ratios.setdefault(estimate.key, deque(maxlen=self.calibration_window))
+        ratios.append(max(0, measured_bytes) / estimate.model_bytes)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit_bytes": self.limit,
+            "resident_bytes": self.resident,
+            "budget_bytes": self.budget,
+            "reserved_bytes": self.reserved,
+            "max_reserved_bytes": self.max_reserved,
+            "waiting": len(self._waiters),
+            "waited": self.waited,
+            "rejected": self.rejected,
+            "calibration": {key: round(self.factor(key), 3) for key in sorted(self._ratios)}
+        }
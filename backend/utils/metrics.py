@@ -0,0 +1,248 @@
+"""
+メトリクス - Prometheus テキスト形式で公開するカウンター・ヒストグラム
+ルート別・縞模様メソッド別・フェーズ別のレイテンシと、ワーカープロセスのキャッシュ・メモリ状況を集計する
+（外部ライブラリは使わず、/metrics の取得時にテキストを組み立てる）
+"""
+import ctypes
+import ctypes.util
+import os
+import threading
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import psutil
+
+# レイテンシ用のバケット（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PHASE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+METRIC_PREFIX = "pozt_"
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Sequence[Tuple[str, Any]]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """単調増加のカウンター（ラベルの値の組ごとに集計）"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = METRIC_PREFIX + name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(list(zip(self.label_names, values)))} {_format_value(total)}"
+            for values, total in items
+        ]
+
+
+class Histogram:
+    """累積バケット付きヒストグラム（ラベルの値の組ごとに集計）"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = METRIC_PREFIX + name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        # ラベルの値の組 → [バケットごとの件数（非累積）..., 合計, 件数]
+        self._series: Dict[Tuple, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0.0] * (len(self.buckets) + 3)
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(values, list(series)) for values, series in self._series.items()]
+        lines = []
+        for values, series in items:
+            labels = list(zip(self.label_names, values))
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(labels + [('le', _format_value(bound))])} "
+                    f"{_format_value(cumulative)}"
+                )
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {_format_value(series[-1])}")
+        return lines
+
+
+class Sample:
+    """取得時に値を集める1系列（ゲージ・カウンター）"""
+
+    __slots__ = ("name", "kind", "documentation", "labels", "value")
+
+    def __init__(self, name: str, kind: str, documentation: str, value: float, **labels):
+        self.name = METRIC_PREFIX + name
+        self.kind = kind
+        self.documentation = documentation
+        self.labels = labels
+        self.value = value
+
+
+def render_exposition(metrics: Iterable[Any], samples: Iterable[Sample]) -> str:
+    """Prometheus テキスト形式（version 0.0.4）を作成"""
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+
+    # 取得時の値は同名の系列をまとめて出力
+    grouped: Dict[str, List[Sample]] = {}
+    for sample in samples:
+        grouped.setdefault(sample.name, []).append(sample)
+    for name, group in grouped.items():
+        lines.append(f"# HELP {name} {group[0].documentation}")
+        lines.append(f"# TYPE {name} {group[0].kind}")
+        for sample in group:
+            lines.append(f"{name}{_format_labels(list(sample.labels.items()))} {_format_value(sample.value)}")
+    return "\n".join(lines) + "\n"
+
+
+# === リクエスト・処理のメトリクス（メインプロセスで記録） ===
+
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests by route, method and status", ("route", "method", "status"))
+HTTP_ERRORS = Counter("http_request_errors_total", "HTTP requests that failed with 5xx or an exception", ("route", "method"))
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency until the response body is sent",
+                         ("route", "method"))
+RENDER_LATENCY = Histogram("render_duration_seconds", "Render time in the worker (excluding queue wait)",
+                           ("kind", "stripe_method"))
+RENDER_PHASE_LATENCY = Histogram("render_phase_duration_seconds", "Render time per phase, including queue wait",
+                                 ("kind", "phase"), buckets=PHASE_BUCKETS)
+REVERSE_LATENCY = Histogram("reverse_duration_seconds", "Hidden image extraction time including queue wait",
+                            ("extraction_method",))
+
+REQUEST_METRICS = (HTTP_REQUESTS, HTTP_ERRORS, HTTP_LATENCY, RENDER_LATENCY, RENDER_PHASE_LATENCY, REVERSE_LATENCY)
+
+
+def observe_render(kind: str, stripe_method: str, timings: Optional[Dict[str, float]]):
+    """processing_info.timings（ミリ秒）をヒストグラムに記録（kind: full / preview / stream）"""
+    if not timings:
+        return
+    for phase, duration_ms in timings.items():
+        if phase == "total":
+            RENDER_LATENCY.observe(duration_ms / 1000, kind, stripe_method)
+        else:
+            RENDER_PHASE_LATENCY.observe(duration_ms / 1000, kind, phase)
+
+
+# === プロセスのメモリ ===
+
+# reset_peak_rss でリセットする前の最大値（プロセス起動以来の最大値の報告用）
+_peak_rss_before_reset = 0
+
+
+def current_rss_bytes() -> int:
+    """現在のプロセスの RSS（バイト）"""
+    return psutil.Process().memory_info().rss
+
+
+def peak_rss_bytes(pid: Optional[int] = None) -> Optional[int]:
+    """プロセスの RSS の最大値（Linux の VmHWM、取得できない場合は None）"""
+    try:
+        with open(f"/proc/{pid or os.getpid()}/status", "r") as status_file:
+            for line in status_file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def reset_peak_rss() -> bool:
+    """
+    プロセスの RSS 最大値（VmHWM）を現在値にリセット（Linux のみ、成功時 True）
+    区間ごとのピークメモリを計測する場合に使う（起動以来の最大値は process_memory_snapshot で引き続き報告）
+    """
+    global _peak_rss_before_reset
+    _peak_rss_before_reset = max(_peak_rss_before_reset, peak_rss_bytes() or 0)
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _load_libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6")
+        return libc if hasattr(libc, "malloc_trim") else None
+    except OSError:
+        return None
+
+
+_libc = _load_libc()
+
+
+def trim_heap() -> bool:
+    """
+    解放済みのヒープを OS に返す（glibc の malloc_trim、使えない環境では何もせず False）
+    大きな処理の後は解放済みの領域が RSS に残り続けるため、処理の前後の RSS を常駐分として扱う前に呼ぶ
+    """
+    if _libc is None:
+        return False
+    _libc.malloc_trim(0)
+    return True
+
+
+def process_memory_snapshot() -> Dict[str, int]:
+    """現在のプロセスの RSS と最大値（バイト）"""
+    rss = current_rss_bytes()
+    peak = peak_rss_bytes()
+    return {"rss": rss, "peak_rss": max(rss, peak or 0, _peak_rss_before_reset)}
+
+
+def worker_snapshot() -> Dict[str, Any]:
+    """
+    レンダリングワーカー内のキャッシュ統計とメモリ（処理結果と一緒に親プロセスへ返す）
+    デコード済み画像・キャンバス・形状マスクのキャッシュはワーカーごとに持つため、ここで集める
+    """
+    from core.shape_masks import get_mask_cache_stats
+    from utils.image_cache import get_image_cache_stats
+
+    caches = get_image_cache_stats()
+    caches["masks"] = get_mask_cache_stats()
+    snapshot = process_memory_snapshot()
+    snapshot["pid"] = os.getpid()
+    snapshot["caches"] = caches
+    return snapshot
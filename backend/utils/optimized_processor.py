@@ -10,22 +10,59 @@ import os
 import time
 import gc
 import json
+import logging
 import psutil
 from concurrent.futures import ThreadPoolExecutor
 from utils.image_processor import (
     optimize_image_for_processing, 
     vectorized_pattern_generation,
-    clear_memory
+    clear_memory,
+    skip_memory_release
 )
+from utils.image_cache import load_source_image, get_fixed_canvas
+from utils.encoders import get_encoder, encode_to_bytes, write_encoded_file
 from config.app import get_settings
-from core.image_utils import resize_to_fixed_size, add_black_border
+from utils.logger import get_logger
+from utils.timing import PhaseTimer
+from core.compositing import compose_bands
+from config.settings import TARGET_WIDTH, TARGET_HEIGHT
+from core.geometry import plan_canvas_geometry
 from core.shape_masks import (
     create_custom_shape_mask,
     get_mask_memory_usage,
     clear_shape_cache,
+    scale_shape_params,
     SHAPE_COMPLEXITY
 )
 
+# 処理フェーズ名（進捗通知で使用）
+PROCESSING_PHASES = (
+    "load",
+    "coordinate_transform",
+    "hidden_prep",
+    "mask_pattern",
+    "compose",
+    "save"
+)
+
+# フェーズごとの計測区間名（processing_info.timings と Server-Timing で使用）
+PHASE_SPANS = (
+    "load",
+    "transform",
+    "prepare",
+    "pattern",
+    "compose",
+    "encode"
+)
+
+logger = get_logger(__name__)
+
+def new_result_filename(extension: str = "png") -> str:
+    """結果画像のファイル名を生成（拡張子は出力形式に合わせる）"""
+    timestamp = int(time.time())
+    result_id = uuid.uuid4().hex[:8]
+    return f"optimized_result_{result_id}_{timestamp}.{extension}"
+
 def process_hidden_image_optimized(
     base_img_path: str,
     region: tuple,
@@ -39,7 +76,13 @@ def process_hidden_image_optimized(
     stripe_color1: str = "#000000",  # 縞模様カラー1
     stripe_color2: str = "#FFFFFF",  # 縞模様カラー2
     shape_type: str = "rectangle",   # 形状タイプ
-    shape_params: str = "{}"         # 形状パラメータ（JSON文字列）
+    shape_params: str = "{}",        # 形状パラメータ（JSON文字列）
+    progress_callback=None,          # フェーズ開始通知 callback(phase_index, phase_name)
+    result_filename: str = None,     # 結果ファイル名（ストリーミング配信用に事前指定）
+    preview_size: tuple = None,      # プレビュー用の縮小キャンバスサイズ (w, h)
+    output_format: str = None,       # 出力形式（png / webp、省略時は設定値）
+    encoder_tier: str = None,        # 圧縮段階（fastest / balanced / smallest、省略時は設定値）
+    result_in_memory: bool = False   # 結果をファイルに保存せずエンコード済みバイト列で返す
 ):
     """
     メモリ最適化された画像処理関数 - 複雑な形状や大きな画像でも512MBで安定動作
@@ -58,14 +101,25 @@ def process_hidden_image_optimized(
         stripe_color2: 縞色2（HEX形式）
         shape_type: 形状タイプ
         shape_params: 形状パラメータ（JSON文字列）
+        progress_callback: 各フェーズ開始時に呼び出す関数（ジョブ進捗用）
+        result_filename: 結果ファイル名（省略時は自動生成）
+        preview_size: 指定時は縮小キャンバス上で同じ処理を行い、ファイルを保存せず PNG バイト列を返す
+            （縞は縮小後の座標で1ピクセル幅のまま生成する）
+        output_format: 出力形式（png / webp）
+        encoder_tier: 圧縮段階（fastest / balanced / smallest）
+        result_in_memory: True の場合は static/ に書き出さず、"result_data" にバイト列を入れて返す
+            （呼び出し側が結果ストアに登録して配信する）
         
     Returns:
-        結果ファイル情報の辞書
+        結果ファイル情報の辞書（processing_info.timings にフェーズごとの所要時間（ミリ秒））
     """
+    timer = PhaseTimer()
+    debug = logger.isEnabledFor(logging.DEBUG)
+    
     # メモリ使用状況のベースライン計測
     process = psutil.Process()
     start_memory = process.memory_info().rss / (1024 * 1024)  # MB単位
-    print(f"🧠 Starting memory usage: {start_memory:.2f} MB")
+    logger.debug("🧠 Starting memory usage: %.2f MB", start_memory)
     
     # 最適化されたデフォルトパラメータ設定
     if processing_params is None:
@@ -91,150 +145,80 @@ def process_hidden_image_optimized(
         processing_params['stripe_color1'] = stripe_color1
         processing_params['stripe_color2'] = stripe_color2
     
-    start_time = time.time()
     settings = get_settings()
 
-    print(f"🚀 Starting memory-optimized processing...")
-    print(f"Parameters: {pattern_type}, {stripe_method}, {resize_method}, shape_type={shape_type}")
-    print(f"Region: {region}")
-    print(f"Colors: {stripe_color1} - {stripe_color2}")
+    logger.debug("🚀 Starting memory-optimized processing...")
+    logger.debug("Parameters: %s, %s, %s, shape_type=%s", pattern_type, stripe_method, resize_method, shape_type)
+    logger.debug("Region: %s", region)
+    logger.debug("Colors: %s - %s", stripe_color1, stripe_color2)
+
+    def begin_phase(phase_index):
+        """フェーズの計測を開始し、進捗を通知"""
+        if progress_callback is not None:
+            progress_callback(phase_index, PROCESSING_PHASES[phase_index - 1])
+        timer.begin(PHASE_SPANS[phase_index - 1])
+
+    def end_phase(phase_index, label):
+        phase_time = timer.end()
+        logger.debug("⚡ Phase %d (%s): %.2fs", phase_index, label, phase_time)
 
     try:
         # === フェーズ1: 画像読み込みとリサイズ ===
-        phase_start = time.time()
+        begin_phase(1)
 
         if not os.path.exists(base_img_path):
             raise FileNotFoundError(f"Base image not found: {base_img_path}")
 
-        # メモリ効率の良い読み込み
-        base_img_orig = Image.open(base_img_path)
-        original_size = (base_img_orig.width, base_img_orig.height)
-        print(f"Original size: {original_size}, mode: {base_img_orig.mode}")
-        
-        # RGBAの場合はRGBに変換
-        if base_img_orig.mode == 'RGBA':
-            base_img = Image.new('RGB', base_img_orig.size, (255, 255, 255))
-            base_img.paste(base_img_orig, mask=base_img_orig.split()[3])
-            base_img_orig.close()
-            print(f"Converted base image from RGBA to RGB")
-        else:
-            base_img = base_img_orig
-        
-        try:
-            
-            # 大きな画像は事前リサイズ
-            if base_img.width * base_img.height > 4000000:  # 4MP以上は大きい
-                print("⚡ Large image detected, applying memory-efficient pre-resize...")
-                base_img.thumbnail((2000, 2000), Image.Resampling.BILINEAR)
-
-            # 領域抽出
-            x, y, width, height = region
-            x = max(0, min(x, base_img.width - 1))
-            y = max(0, min(y, base_img.height - 1))
-            width = min(width, base_img.width - x)
-            height = min(height, base_img.height - y)
-            
-            region_pil = base_img.crop((x, y, x + width, y + height))
-            print(f"Region extracted: {region_pil.size}, mode: {region_pil.mode}")
-            
-            # RGBAをRGBに変換
-            if region_pil.mode == 'RGBA':
-                rgb_pil = Image.new('RGB', region_pil.size, (255, 255, 255))
-                rgb_pil.paste(region_pil, mask=region_pil.split()[3])
-                region_pil = rgb_pil
-                print(f"Converted region from RGBA to RGB")
-
-            # 高速リサイズ処理
-            base_fixed = resize_to_fixed_size(base_img, method=resize_method)
+        # デコード済みキャッシュから読み込み（4MP以上は事前縮小済み）
+        source = load_source_image(base_img_path, max_pixels=4000000, thumbnail_size=(2000, 2000))
+        original_size = source.original_size
+        logger.debug("Original size: %s, decoded: %dx%d", original_size, source.array.shape[1], source.array.shape[0])
 
-            # メモリ効率のためにNumPy配列に変換
-            hidden_img = np.array(region_pil)
-            base_fixed_array = np.array(base_fixed)
-            
-            # PILオブジェクトを解放
-            del region_pil, base_fixed
-            clear_memory()
-            
-        finally:
-            # base_imgを確実にclose
-            if 'base_img' in locals():
-                base_img.close()
+        # 固定サイズキャンバス（キャッシュ済みなら再リサンプルしない・読み取り専用）
+        # プレビューは縮小サイズのキャンバスを直接生成し、以降の処理もその座標系で行う
+        canvas_size = tuple(preview_size) if preview_size else (TARGET_WIDTH, TARGET_HEIGHT)
+        canvas_scale = canvas_size[0] / TARGET_WIDTH
+        base_fixed_array = get_fixed_canvas(source, resize_method, canvas_size)
 
-        phase_time = time.time() - phase_start
-        print(f"⚡ Phase 1 (Image loading): {phase_time:.2f}s")
+        end_phase(1, "Image loading")
         
-        # メモリ使用状況チェック
-        current_memory = process.memory_info().rss / (1024 * 1024)
-        print(f"Memory after phase 1: {current_memory:.2f} MB (Δ{current_memory - start_memory:.2f} MB)")
+        # メモリ使用状況チェック（診断用のためデバッグ時のみ計測）
+        if debug:
+            current_memory = process.memory_info().rss / (1024 * 1024)
+            logger.debug("Memory after phase 1: %.2f MB (Δ%.2f MB)", current_memory, current_memory - start_memory)
 
         # === フェーズ2: 座標変換 ===
-        phase_start = time.time()
-        
-        img_width, img_height = original_size
-        scale_factors = np.array([settings.TARGET_WIDTH / img_width, settings.TARGET_HEIGHT / img_height])
+        begin_phase(2)
         
-        # 座標変換
-        if resize_method == 'contain':
-            scale = np.min(scale_factors)
-            new_size = np.array([img_width, img_height]) * scale
-            offsets = (np.array([settings.TARGET_WIDTH, settings.TARGET_HEIGHT]) - new_size) // 2
-            region_coords = np.array([x, y, width, height]) * scale
-            final_coords = region_coords + np.array([offsets[0], offsets[1], 0, 0])
-        elif resize_method == 'cover':
-            scale = np.max(scale_factors)
-            crop_offset = ((np.array([img_width, img_height]) * scale - 
-                           np.array([settings.TARGET_WIDTH, settings.TARGET_HEIGHT])) / 2).astype(int)
-            region_coords = np.array([x, y, width, height]) * scale
-            final_coords = region_coords - np.array([crop_offset[0], crop_offset[1], 0, 0])
-        else:  # stretch
-            final_coords = np.array([x * scale_factors[0], y * scale_factors[1], 
-                                   width * scale_factors[0], height * scale_factors[1]])
-
-        # 境界チェック
-        x_fixed, y_fixed, width_fixed, height_fixed = final_coords.astype(int)
-        x_fixed = max(0, min(x_fixed, settings.TARGET_WIDTH - 1))
-        y_fixed = max(0, min(y_fixed, settings.TARGET_HEIGHT - 1))
-        width_fixed = min(width_fixed, settings.TARGET_WIDTH - x_fixed)
-        height_fixed = min(height_fixed, settings.TARGET_HEIGHT - y_fixed)
+        # キャンバス生成と同じジオメトリ計画で領域を変換
+        geometry = plan_canvas_geometry(original_size, resize_method, canvas_size)
+        x_fixed, y_fixed, width_fixed, height_fixed = geometry.map_region(region)
         
-        print(f"Transformed region: x={x_fixed}, y={y_fixed}, w={width_fixed}, h={height_fixed}")
+        logger.debug("Transformed region: x=%d, y=%d, w=%d, h=%d", x_fixed, y_fixed, width_fixed, height_fixed)
 
-        phase_time = time.time() - phase_start
-        print(f"⚡ Phase 2 (Coordinate transform): {phase_time:.2f}s")
+        end_phase(2, "Coordinate transform")
 
         # === フェーズ3: 隠し画像準備 ===
-        phase_start = time.time()
-        
-        # リサイズ
-        hidden_pil = Image.fromarray(hidden_img)
-        hidden_resized = hidden_pil.resize((width_fixed, height_fixed), Image.Resampling.BILINEAR)
-        
-        # RGBAの場合はRGBに変換
-        if hidden_resized.mode == 'RGBA':
-            rgb_hidden = Image.new('RGB', hidden_resized.size, (255, 255, 255))
-            rgb_hidden.paste(hidden_resized, mask=hidden_resized.split()[3])
-            hidden_resized = rgb_hidden
-            print(f"Converted hidden_resized from RGBA to RGB")
-        
-        hidden_array = np.array(hidden_resized)
+        begin_phase(3)
         
-        # 不要オブジェクト解放
-        del hidden_img, hidden_pil, hidden_resized
-        clear_memory()
+        # キャンバスは同じ領域を同じサイズで保持しているため、再リサイズせずに切り出す
+        hidden_array = np.ascontiguousarray(
+            base_fixed_array[y_fixed:y_fixed + height_fixed, x_fixed:x_fixed + width_fixed]
+        )
 
-        phase_time = time.time() - phase_start
-        print(f"⚡ Phase 3 (Hidden image prep): {phase_time:.2f}s")
+        end_phase(3, "Hidden image prep")
         
-        # メモリ使用状況チェック
-        current_memory = process.memory_info().rss / (1024 * 1024)
-        print(f"Memory after phase 3: {current_memory:.2f} MB (Δ{current_memory - start_memory:.2f} MB)")
+        # メモリ使用状況チェック（診断用のためデバッグ時のみ計測）
+        if debug:
+            current_memory = process.memory_info().rss / (1024 * 1024)
+            logger.debug("Memory after phase 3: %.2f MB (Δ%.2f MB)", current_memory, current_memory - start_memory)
 
         # === フェーズ4: 形状マスク生成と適用 ===
-        phase_start = time.time()
+        begin_phase(4)
         
         # 形状マスク生成（矩形以外の場合）
         if shape_type != "rectangle":
-            print(f"🎭 Creating shape mask: {shape_type}")
+            logger.debug("🎭 Creating shape mask: %s", shape_type)
             
             # 形状パラメータの解析（JSON文字列から辞書へ）
             try:
@@ -247,8 +231,12 @@ def process_hidden_image_optimized(
                 else:
                     shape_params_dict = shape_params if shape_params else {}
             except Exception as e:
-                print(f"⚠️ Error parsing shape params: {e}")
+                logger.warning("⚠️ Error parsing shape params: %s", e)
                 shape_params_dict = {}
+            
+            # プレビューではピクセル単位のパラメータをキャンバスと同じ倍率で縮小
+            if preview_size:
+                shape_params_dict = scale_shape_params(shape_params_dict, canvas_scale)
                 
             # 画像サイズに基づくメモリ使用量評価
             image_area = width_fixed * height_fixed
@@ -256,9 +244,9 @@ def process_hidden_image_optimized(
             
             # 大きな画像+複雑な形状の場合の最適化
             if image_area > 500000:  # 大きい画像
-                print(f"⚠️ Large image area: {image_area} pixels, ~{image_size_mb:.2f} MB")
+                logger.debug("⚠️ Large image area: %d pixels, ~%.2f MB", image_area, image_size_mb)
                 if image_size_mb > 10 and shape_type in ["japanese", "arabesque"]:
-                    print(f"🔄 Simplifying complex shape for large image")
+                    logger.debug("🔄 Simplifying complex shape for large image")
                     # 形状の複雑さを下げる
                     if "complexity" in shape_params_dict:
                         shape_params_dict["complexity"] = min(shape_params_dict.get("complexity", 0.5), 0.3)
@@ -272,12 +260,12 @@ def process_hidden_image_optimized(
             
             # メモリ使用量が多い場合は事前クリーンアップ
             if memory_mb > 30:  # キャッシュが30MB以上なら事前クリア
-                print(f"🧹 Memory usage before shape creation: ~{memory_mb:.2f} MB, clearing caches")
+                logger.debug("🧹 Memory usage before shape creation: ~%.2f MB, clearing caches", memory_mb)
                 clear_shape_cache()
             
             # 複雑な形状の場合は特別処理
             if complexity >= 4:  # 和柄やアラベスクなど複雑な形状
-                print(f"⚠️ Using complex shape: memory optimization active")
+                logger.debug("⚠️ Using complex shape: memory optimization active")
                 # 事前にメモリを解放
                 clear_memory()
             
@@ -296,7 +284,7 @@ def process_hidden_image_optimized(
                     del mask_3d
                 else:
                     # 万が一RGBAならRGBに変換
-                    print(f"⚠️ Unexpected RGBA in shape mask application: {hidden_array.shape}")
+                    logger.warning("⚠️ Unexpected RGBA in shape mask application: %s", hidden_array.shape)
                     hidden_array = hidden_array[:, :, :3]
             else:
                 hidden_array = (hidden_array * (shape_mask / 255.0)).astype(np.uint8)
@@ -305,12 +293,12 @@ def process_hidden_image_optimized(
             del shape_mask
             clear_memory()
             
-            print(f"Shape mask applied and memory released")
+            logger.debug("Shape mask applied and memory released")
             
             # 複雑な形状の場合はキャッシュをクリア
             if complexity >= 3:
                 clear_shape_cache(shape_type)
-                print(f"Cleared shape cache for '{shape_type}'")
+                logger.debug("Cleared shape cache for '%s'", shape_type)
         
         # パターン生成
         stripe_pattern = vectorized_pattern_generation(
@@ -319,129 +307,106 @@ def process_hidden_image_optimized(
         
         # パターンがRGBAの場合はRGBに変換
         if len(stripe_pattern.shape) == 3 and stripe_pattern.shape[2] == 4:
-            print(f"⚠️ Stripe pattern is RGBA: {stripe_pattern.shape}, converting to RGB")
+            logger.warning("⚠️ Stripe pattern is RGBA: %s, converting to RGB", stripe_pattern.shape)
             stripe_pattern = stripe_pattern[:, :, :3]
         
-        print(f"Stripe pattern shape: {stripe_pattern.shape}")
+        logger.debug("Stripe pattern shape: %s", stripe_pattern.shape)
         
         # 不要メモリ解放
         del hidden_array
         clear_memory()
 
-        phase_time = time.time() - phase_start
-        print(f"⚡ Phase 4 (Shape mask + Pattern): {phase_time:.2f}s")
+        end_phase(4, "Shape mask + Pattern")
         
-        # メモリ使用状況チェック
-        current_memory = process.memory_info().rss / (1024 * 1024)
-        print(f"Memory after phase 4: {current_memory:.2f} MB (Δ{current_memory - start_memory:.2f} MB)")
-        
-        # メモリ使用量が多い場合は強制GC
-        if current_memory > 350:  # 350MB以上なら強制クリーンアップ
-            print(f"🧹 High memory usage detected, forcing cleanup")
-            clear_memory()
-            gc.collect()
+        # メモリ使用状況チェック（診断用のためデバッグ時のみ計測、ピークはレンダリングプールで予約済み）
+        if debug:
             current_memory = process.memory_info().rss / (1024 * 1024)
-            print(f"Memory after forced cleanup: {current_memory:.2f} MB")
+            logger.debug("Memory after phase 4: %.2f MB (Δ%.2f MB)", current_memory, current_memory - start_memory)
 
-        # === フェーズ5: 最終合成 ===
-        phase_start = time.time()
+        # === フェーズ5: 最終合成の準備 ===
+        begin_phase(5)
         
         # 結果画像の作成
         # base_fixed_arrayがRGBAの場合はRGBに変換
         if len(base_fixed_array.shape) == 3 and base_fixed_array.shape[2] == 4:
-            print(f"⚠️ Base fixed array is RGBA: {base_fixed_array.shape}, converting to RGB")
+            logger.warning("⚠️ Base fixed array is RGBA: %s, converting to RGB", base_fixed_array.shape)
             base_fixed_array = base_fixed_array[:, :, :3]
         
-        print(f"Base fixed array shape: {base_fixed_array.shape}")
-        print(f"Stripe pattern shape for replacement: {stripe_pattern.shape}")
+        logger.debug("Base fixed array shape: %s", base_fixed_array.shape)
+        logger.debug("Stripe pattern shape for replacement: %s", stripe_pattern.shape)
         
-        result_fixed = base_fixed_array.copy()
+        region_fixed = (x_fixed, y_fixed, width_fixed, height_fixed)
+        composition_mask = None
         
         # 形状対応合成
         if shape_type != "rectangle":
-            print(f"🎨 Applying shape-aware composition for {shape_type}")
+            logger.debug("🎨 Preparing shape-aware composition for %s", shape_type)
             
-            # 形状マスクを再生成（最終合成用）
+            # 形状マスクを再生成（最終合成用）: 形状内のみパターンを適用、形状外は元画像を保持
             composition_mask = create_custom_shape_mask(
                 width_fixed, height_fixed, shape_type, **shape_params_dict
             )
-            
-            # 合成用マスクを正規化 (0-1の範囲)
-            if len(stripe_pattern.shape) == 3:  # カラー画像
-                mask_3d = np.stack([composition_mask, composition_mask, composition_mask], axis=2) / 255.0
-                
-                # 形状内のみパターンを適用、形状外は元画像を保持
-                region_original = result_fixed[y_fixed:y_fixed + height_fixed, x_fixed:x_fixed + width_fixed].copy()
-                blended_region = stripe_pattern * mask_3d + region_original * (1 - mask_3d)
-                result_fixed[y_fixed:y_fixed + height_fixed, x_fixed:x_fixed + width_fixed] = blended_region.astype(np.uint8)
-                
-                # メモリ解放
-                del mask_3d, region_original, blended_region
-            else:  # グレースケール
-                mask_normalized = composition_mask / 255.0
-                region_original = result_fixed[y_fixed:y_fixed + height_fixed, x_fixed:x_fixed + width_fixed].copy()
-                blended_region = stripe_pattern * mask_normalized + region_original * (1 - mask_normalized)
-                result_fixed[y_fixed:y_fixed + height_fixed, x_fixed:x_fixed + width_fixed] = blended_region.astype(np.uint8)
-                
-                # メモリ解放
-                del mask_normalized, region_original, blended_region
-            
-            # 合成マスクのメモリを解放
-            del composition_mask
-            print(f"✅ Shape-aware composition completed")
-        else:
-            # 矩形の場合は従来通りの置換
-            result_fixed[y_fixed:y_fixed + height_fixed, x_fixed:x_fixed + width_fixed] = stripe_pattern
-            print(f"✅ Rectangle composition completed")
-        
-        # 枠追加
-        if add_border:
-            result_fixed = add_black_border(
-                result_fixed,
-                (x_fixed, y_fixed, width_fixed, height_fixed),
-                border_width
-            )
-        
-        # 不要メモリ解放
-        del stripe_pattern, base_fixed_array
-        clear_memory()
 
-        phase_time = time.time() - phase_start
-        print(f"⚡ Phase 5 (Final composition): {phase_time:.2f}s")
+        end_phase(5, "Composition setup")
 
-        # === フェーズ6: 保存 ===
-        phase_start = time.time()
+        # === フェーズ6: 行バンドごとの合成と保存 ===
+        begin_phase(6)
+        
+        canvas_height, canvas_width = base_fixed_array.shape[:2]
+        if add_border and preview_size:
+            # 枠幅はキャンバスと同じ倍率で縮小（最小1ピクセル）
+            border_width = max(1, round(border_width * canvas_scale))
+        bands = compose_bands(
+            base_fixed_array, region_fixed, stripe_pattern, composition_mask,
+            border_width if add_border else 0, settings.RESULT_BAND_ROWS
+        )
         
-        # ファイル名生成
-        timestamp = int(time.time())
-        result_id = uuid.uuid4().hex[:8]
-        result_filename = f"optimized_result_{result_id}_{timestamp}.png"
+        if encoder_tier is None:
+            encoder_tier = settings.PREVIEW_ENCODER_TIER if preview_size else settings.RESULT_ENCODER_TIER
+        encoder = get_encoder(output_format or settings.RESULT_OUTPUT_FORMAT, encoder_tier)
+        
+        preview_data = None
+        result_data = None
+        if preview_size:
+            # プレビューは保存せず、メモリ上でエンコードしてそのまま返す
+            preview_data, encoding = encode_to_bytes(encoder, bands, canvas_width, canvas_height)
+            result_filename = None
+            logger.debug("✅ Preview encoded %dx%d as %s/%s: %d bytes in %.3fs", canvas_width, canvas_height,
+                         encoder.output_format, encoder.tier, encoding['bytes'], encoding['encode_time'])
+        elif result_in_memory:
+            # 結果ストア用: ディスクを経由せずメモリ上でエンコードして返す
+            if result_filename is None:
+                result_filename = new_result_filename(encoder.extension)
+            result_data, encoding = encode_to_bytes(encoder, bands, canvas_width, canvas_height)
+            logger.debug("✅ Encoded %d rows in memory as %s/%s: %d bytes in %.3fs", canvas_height,
+                         encoder.output_format, encoder.tier, encoding['bytes'], encoding['encode_time'])
+        else:
+            # ファイル名生成（ストリーミング配信では呼び出し側が事前に決める）
+            if result_filename is None:
+                result_filename = new_result_filename(encoder.extension)
 
-        # 保存ディレクトリ確保
-        os.makedirs("static", exist_ok=True)
-        result_path = os.path.join("static", result_filename)
-        
-        # 最適化された保存
-        result_image = Image.fromarray(result_fixed.astype('uint8'))
-        result_image.save(
-            result_path,
-            format="PNG",
-            optimize=False,    # 速度優先
-            compress_level=3   # 低圧縮で高速化
-        )
+            # 保存ディレクトリ確保
+            os.makedirs("static", exist_ok=True)
+            result_path = os.path.join("static", result_filename)
+            
+            # 全体キャンバスを作らず、合成したバンドから順にエンコードして書き出す
+            # （PNG は書き込み中の .part ファイルを配信側が完成前から読み出せる。WebP は全行揃ってからエンコード）
+            encoding = write_encoded_file(result_path, encoder, bands, canvas_width, canvas_height)
+            logger.debug("✅ Encoded %d rows in bands of %d as %s/%s: %d bytes in %.3fs", canvas_height,
+                         settings.RESULT_BAND_ROWS, encoder.output_format, encoder.tier,
+                         encoding['bytes'], encoding['encode_time'])
         
         # 不要メモリ解放
-        del result_fixed, result_image
+        del stripe_pattern, base_fixed_array, composition_mask, bands
         clear_memory()
 
-        phase_time = time.time() - phase_start
-        print(f"⚡ Phase 6 (File saving): {phase_time:.2f}s")
+        end_phase(6, "Banded composition + streaming save")
 
         # === 処理完了 ===
-        total_time = time.time() - start_time
+        total_time = timer.elapsed()
         final_memory = process.memory_info().rss / (1024 * 1024)
-        print(f"🎉 Memory-optimized processing completed: {total_time:.2f}s")
-        print(f"🧠 Final memory usage: {final_memory:.2f} MB (Δ{final_memory - start_memory:.2f} MB)")
+        logger.info("🎉 Memory-optimized processing completed: %.2fs", total_time)
+        logger.debug("🧠 Final memory usage: %.2f MB (Δ%.2f MB)", final_memory, final_memory - start_memory)
 
         # 最適化状態を記録
         optimization_status = {
@@ -456,13 +421,7 @@ def process_hidden_image_optimized(
             complexity = SHAPE_COMPLEXITY.get(shape_type, 3)
             if complexity >= 4:  # 複雑な形状
                 clear_shape_cache()
-                print(f"🧹 Final cleanup: cleared all shape caches")
-
-        # メモリ使用量が高い場合は追加クリーンアップ
-        if final_memory > 300:
-            print(f"🧹 High final memory usage: {final_memory:.2f} MB - additional cleanup")
-            gc.collect()
-            gc.collect()
+                logger.debug("🧹 Final cleanup: cleared all shape caches")
 
         # 結果を返す
         result_dict = {
@@ -472,31 +431,44 @@ def process_hidden_image_optimized(
                 "optimization_status": optimization_status,
                 "parameters_used": processing_params,
                 "shape_used": shape_type,
-                "memory_usage_mb": final_memory
+                "memory_usage_mb": final_memory,
+                "canvas_size": [canvas_width, canvas_height],
+                "encoding": encoding,
+                "timings": timer.as_dict()
             }
         }
+        if preview_data is not None:
+            result_dict["preview"] = preview_data
+        if result_data is not None:
+            result_dict["result_data"] = result_data
         
         return result_dict
 
     except Exception as e:
-        print(f"❌ Memory-optimized processing error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Memory-optimized processing error: %s", e)
         
         # エラー時の強制メモリ解放
         clear_memory()
         
         # メモリ不足の可能性がある場合
         if "memory" in str(e).lower() or "out of memory" in str(e).lower() or "allocation" in str(e).lower():
-            print("🔄 Possible memory issue detected, forcing cleanup")
+            logger.warning("🔄 Possible memory issue detected, forcing cleanup")
             try:
                 clear_shape_cache()  # 全形状キャッシュをクリア
                 gc.collect()
                 gc.collect()
             except Exception as cache_error:
-                print(f"Error during emergency cleanup: {cache_error}")
+                logger.error("Error during emergency cleanup: %s", cache_error)
         
         raise e
 
+def render_preview_optimized(*args, preview_size, **kwargs):
+    """
+    スライダー操作用の縮小プレビューを描画（引数は process_hidden_image_optimized と同じ）
+    縮小キャンバスの配列は小さいため、フェーズごとの強制GCは省略する
+    """
+    with skip_memory_release():
+        return process_hidden_image_optimized(*args, preview_size=preview_size, **kwargs)
+
 # 後方互換性のためのエイリアス（この関数は使用されていません）
 # process_hidden_image_optimized = process_hidden_image
@@ -0,0 +1,84 @@
+"""
+ストリーミングPNG書き込み - 行バンドごとにフィルタ・圧縮して IDAT チャンクを書き出す
+合成済みの全体キャンバスもエンコード済みのファイル全体もメモリに保持しない
+ファイルへの書き出し（"<path>.part" 経由の置き換え）は utils/encoders.py が担当する
+"""
+import struct
+import zlib
+from typing import BinaryIO
+
+import numpy as np
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# PNG フィルタタイプ（Up: 直前の行との差分）
+# 1ピクセル縞は隣接行の差分が行内で一定になるため、numpy で高速に計算でき圧縮率も高い
+FILTER_UP = 2
+
+# カラータイプ（ビット深度は8固定）
+COLOR_TYPES = {1: 0, 3: 2, 4: 6}
+
+
+def partial_path(path: str) -> str:
+    """書き込み中のファイルパス"""
+    return f"{path}.part"
+
+
+class StreamingPNGWriter:
+    """
+    行バンド単位で PNG を書き出すライター
+    write_rows() ごとに圧縮済みデータを IDAT チャンクとして出力する
+    """
+
+    def __init__(self, fileobj: BinaryIO, width: int, height: int, channels: int = 3, compress_level: int = 3):
+        if channels not in COLOR_TYPES:
+            raise ValueError(f"Unsupported channel count for PNG: {channels}")
+        self.fileobj = fileobj
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.rows_written = 0
+        self.bytes_written = 0
+        self._compressor = zlib.compressobj(compress_level)
+        self._previous_row = np.zeros(width * channels, dtype=np.uint8)
+
+        self._write(PNG_SIGNATURE)
+        self._write_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, COLOR_TYPES[channels], 0, 0, 0))
+
+    def _write(self, data: bytes):
+        self.fileobj.write(data)
+        self.bytes_written += len(data)
+
+    def _write_chunk(self, chunk_type: bytes, data: bytes):
+        crc = zlib.crc32(data, zlib.crc32(chunk_type))
+        self._write(struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", crc))
+
+    def write_rows(self, rows: np.ndarray):
+        """(行数, 幅[, チャンネル]) の uint8 配列を追記（Up フィルタ + zlib）"""
+        count = rows.shape[0]
+        if self.rows_written + count > self.height:
+            raise ValueError("More rows written than declared PNG height")
+
+        flat_rows = rows.reshape(count, self.width * self.channels)
+        filtered = np.empty((count, flat_rows.shape[1] + 1), dtype=np.uint8)
+        filtered[:, 0] = FILTER_UP
+        np.subtract(flat_rows[0], self._previous_row, out=filtered[0, 1:])
+        np.subtract(flat_rows[1:], flat_rows[:-1], out=filtered[1:, 1:])
+        self._previous_row = flat_rows[-1].copy()
+        self.rows_written += count
+
+        data = self._compressor.compress(filtered.data)
+        if data:
+            self._write_chunk(b"IDAT", data)
+        self.fileobj.flush()
+
+    def close(self):
+        """残りの圧縮データと IEND を書き出す"""
+        if self.rows_written != self.height:
+            raise ValueError(f"PNG incomplete: {self.rows_written}/{self.height} rows written")
+        data = self._compressor.flush()
+        if data:
+            self._write_chunk(b"IDAT", data)
+        self._write_chunk(b"IEND", b"")
+        self.fileobj.flush()
+
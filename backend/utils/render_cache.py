@@ -0,0 +1,116 @@
+"""
+レンダリング結果キャッシュ - アップロード内容のハッシュと正規化したパラメータで処理結果を引く
+同一条件の再送信には既存の結果を返し、同時に届いた同一リクエストは実行中の1回の処理を待つ
+（ダブルクリックやリロードでワーカーを重複して使わない）
+"""
+import asyncio
+import copy
+import hashlib
+import json
+import time
+from typing import Any, Dict, Optional
+
+from config.app import get_settings
+from utils.image_cache import ByteBudgetLRU
+
+# キャッシュ参照の結果（レスポンスの processing_info.render_cache に記録）
+CACHE_MISS = "miss"
+CACHE_HIT = "hit"
+CACHE_SHARED = "shared"
+
+
+def _normalize(value: Any) -> Any:
+    """キー用にパラメータを正規化（JSON 文字列は展開、色は小文字、タプルはリスト）"""
+    if isinstance(value, dict):
+        return {str(key): _normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    if isinstance(value, str):
+        if value.startswith("#"):
+            return value.lower()
+        if value.startswith("{"):
+            try:
+                return _normalize(json.loads(value))
+            except json.JSONDecodeError:
+                return value
+    return value
+
+
+def render_cache_key(upload_digest: str, params: Dict[str, Any]) -> str:
+    """アップロード内容のハッシュとパラメータ一式からキャッシュキーを作成"""
+    canonical = json.dumps(
+        {"upload": upload_digest, "params": _normalize(params)},
+        sort_keys=True, separators=(",", ":")
+    )
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class RenderCache:
+    """
+    キャッシュキー → 処理結果レスポンスの対応表と、実行中処理の single-flight 管理
+    実行中の Future はイベントループ上でのみ操作する
+    """
+
+    def __init__(self, max_bytes: int, ttl: int):
+        self.ttl = ttl
+        self.shared = 0
+        self._responses = ByteBudgetLRU("render_results", max_bytes)
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        """キャッシュ済みのレスポンスを取得（呼び出し側で変更できるよう複製を返す）"""
+        response = self._responses.get(key)
+        return copy.deepcopy(response) if response is not None else None
+
+    def invalidate(self, key: str):
+        """結果ファイルが失われたエントリを破棄"""
+        self._responses.invalidate(lambda cached_key: cached_key == key)
+
+    def inflight(self, key: str) -> Optional[asyncio.Future]:
+        """同じキーで実行中の処理（なければ None）"""
+        future = self._inflight.get(key)
+        if future is not None:
+            self.shared += 1
+        return future
+
+    def begin(self, key: str) -> asyncio.Future:
+        """処理の開始を登録（完了時は finish / fail を呼ぶ）"""
+        future = asyncio.get_running_loop().create_future()
+        # 待機者がいない場合に例外が未取得の警告にならないようにする
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        return future
+
+    def finish(self, key: str, response: Dict[str, Any]):
+        """処理結果を登録して待機中のリクエストに配る"""
+        nbytes = len(json.dumps(response, default=str))
+        self._responses.put(key, copy.deepcopy(response), nbytes, time.time() + self.ttl)
+        future = self._inflight.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(response)
+
+    def fail(self, key: str, error: BaseException):
+        """失敗を待機中のリクエストに伝える（失敗はキャッシュしない）"""
+        future = self._inflight.pop(key, None)
+        if future is not None and not future.done():
+            if not isinstance(error, Exception):
+                # 先行リクエストの中断（CancelledError など）は待機側では処理失敗として扱う
+                error = RuntimeError("Identical render was cancelled")
+            future.set_exception(error)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self._responses.stats()
+        stats.update({"inflight": len(self._inflight), "shared": self.shared})
+        return stats
+
+
+_render_cache: Optional[RenderCache] = None
+
+
+def get_render_cache() -> RenderCache:
+    """共有レンダリング結果キャッシュを取得"""
+    global _render_cache
+    if _render_cache is None:
+        settings = get_settings()
+        _render_cache = RenderCache(settings.RENDER_CACHE_MAX_BYTES, settings.TEMP_FILE_EXPIRY)
+    return _render_cache
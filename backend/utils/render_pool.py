@@ -0,0 +1,441 @@
+"""
+レンダリングプール - CPU負荷の高い画像処理をイベントループから分離
+ワーカー数と待ち行列の長さを制限し、満杯時は待たせずに即座に拒否する
+メモリの見積もりを渡されたジョブは、予算から予約できるまで実行を待つ
+"""
+import asyncio
+import functools
+import math
+import multiprocessing
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional
+
+from config.app import get_settings
+from utils.logger import get_logger
+from utils.memory_budget import MemoryBudget, MemoryEstimate
+
+logger = get_logger(__name__)
+
+
+class PoolSaturatedError(Exception):
+    """待ち行列が満杯で受け付けられない場合の例外"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Render pool is saturated, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class WorkerCrashedError(Exception):
+    """ワーカープロセスが異常終了した場合の例外（プールは次の投入時に作り直す）"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Render worker terminated unexpectedly, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+# ワーカーごとのキャッシュ統計のうち合算する項目
+CACHE_STAT_KEYS = ("entries", "bytes", "max_bytes", "hits", "misses", "evictions", "expirations")
+
+# まだ統計を返していないワーカーの待機時 RSS の仮定値（モジュール読み込み後の計測値 約75MB + 余裕）
+DEFAULT_WORKER_RSS_BYTES = 96 * 1024 * 1024
+
+# ワーカーから親プロセスへ進捗を送るキュー（ワーカー初期化時に設定）
+_progress_queue = None
+
+
+def _init_worker(progress_queue):
+    global _progress_queue
+    _progress_queue = progress_queue
+
+
+class JobProgress:
+    """ワーカー内で呼び出せる進捗通知（pickle可能）"""
+
+    __slots__ = ("job_id",)
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+
+    def __call__(self, phase_index: int, phase: str):
+        if _progress_queue is not None:
+            _progress_queue.put((self.job_id, phase_index, phase, time.time()))
+
+
+def _worker_snapshot() -> Optional[Dict[str, Any]]:
+    """ワーカーのキャッシュ統計とメモリ（取得に失敗しても処理結果には影響させない）"""
+    try:
+        from utils.metrics import worker_snapshot
+        return worker_snapshot()
+    except Exception:
+        return None
+
+
+def _cache_hits(snapshot: Optional[Dict[str, Any]]) -> Optional[int]:
+    if snapshot is None:
+        return None
+    return sum(stats.get("hits", 0) for stats in snapshot["caches"].values())
+
+
+def _prune_worker_caches():
+    """削除済みアップロードのキャッシュをワーカー内で破棄（失敗しても処理は続ける）"""
+    try:
+        from utils.image_cache import prune_stale_uploads
+        prune_stale_uploads()
+    except Exception:
+        pass
+
+
+def _timed_call(fn, args, kwargs):
+    """
+    ワーカー側で実行開始時刻を記録して関数を呼び出す（終了時のワーカー統計も返す）
+    実行中のピークメモリ（開始時からの RSS 増加分）も計測し、見積もりの補正に使う
+    キャッシュに当たった実行はピークが小さく計測されるため、補正用の値は返さない（None）
+    終了後は解放済みのヒープを OS に返し、統計の RSS をワーカーの常駐分（キャッシュを含む）にする
+    """
+    from utils.metrics import current_rss_bytes, peak_rss_bytes, reset_peak_rss, trim_heap
+
+    _prune_worker_caches()
+
+    started_at = time.time()
+    hits_before = _cache_hits(_worker_snapshot())
+    rss_before = current_rss_bytes()
+    peak_measurable = reset_peak_rss()
+    result = fn(*args, **kwargs)
+    peak = peak_rss_bytes() if peak_measurable else None
+
+    trim_heap()
+    snapshot = _worker_snapshot()
+    cache_missed = hits_before is not None and _cache_hits(snapshot) == hits_before
+    peak_bytes = max(0, peak - rss_before) if peak is not None and cache_missed else None
+    return started_at, result, snapshot, peak_bytes
+
+
+def _warm_up():
+    """ワーカー起動時に重いモジュールを事前読み込み（読み込み後の統計を返す）"""
+    import utils.optimized_processor  # noqa: F401
+    import patterns.reverse  # noqa: F401
+    from utils.metrics import trim_heap
+
+    trim_heap()
+    return _worker_snapshot()
+
+
+class RenderPool:
+    """
+    プロセスプール + 有界待ち行列によるアドミッション制御
+    workers=0 の場合は単一スレッドで実行（開発・検証用）
+    メモリの予算はワーカー・親プロセスの常駐分の計測値から更新する（resident_memory_bytes）
+    """
+
+    def __init__(self, workers: int, max_queue: int, start_method: str = "spawn",
+                 memory_budget: Optional[MemoryBudget] = None):
+        self.workers = max(0, workers)
+        self.max_queue = max(0, max_queue)
+        self.start_method = start_method
+        self.memory_budget = memory_budget or MemoryBudget(0)
+        self._executor = None
+        self._slots = None  # 実行中のワーカー数の上限（メモリの予約は実行直前に行う）
+        self._progress_queue = None
+        self._progress_thread = None
+        self._progress_handler = None
+
+        # 状態はイベントループのスレッドからのみ更新する
+        self._in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.worker_crashes = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._last_wait = 0.0
+        self._recent_durations = deque(maxlen=20)
+        self._worker_stats: Dict[int, Dict[str, Any]] = {}  # ワーカーの PID → 最後に受け取った統計
+
+    @property
+    def capacity(self) -> int:
+        """同時に受け付け可能な件数（実行中 + 待機中）"""
+        return max(1, self.workers) + self.max_queue
+
+    @property
+    def busy_workers(self) -> int:
+        return min(self._in_flight, max(1, self.workers))
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self._in_flight - max(1, self.workers))
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.workers > 0:
+                context = multiprocessing.get_context(self.start_method)
+                self._progress_queue = context.Queue()
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=context,
+                    initializer=_init_worker,
+                    initargs=(self._progress_queue,)
+                )
+            else:
+                self._progress_queue = queue.Queue()
+                _init_worker(self._progress_queue)
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="render")
+
+            self._progress_thread = threading.Thread(
+                target=self._drain_progress, args=(self._progress_queue,),
+                name="render-progress", daemon=True
+            )
+            self._progress_thread.start()
+        return self._executor
+
+    def _discard_executor(self, executor):
+        """
+        異常終了したワーカーのプールを破棄（次の投入時に作り直す）
+        同じプールで失敗した複数のジョブから呼ばれても、作り直し済みのプールは破棄しない
+        """
+        if self._executor is not executor:
+            return
+        executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+        if self._progress_queue is not None:
+            self._progress_queue.put(None)
+            self._progress_queue = None
+            self._progress_thread = None
+        self._worker_stats.clear()
+
+    def set_progress_handler(self, handler):
+        """進捗通知の受け取り先 handler(job_id, phase_index, phase, timestamp) を設定"""
+        self._progress_handler = handler
+
+    def _drain_progress(self, progress_queue):
+        """ワーカーからの進捗通知をハンドラへ転送（None で終了）"""
+        while True:
+            message = progress_queue.get()
+            if message is None:
+                break
+            handler = self._progress_handler
+            if handler is not None:
+                try:
+                    handler(*message)
+                except Exception as e:
+                    logger.warning("⚠️ Progress handler error: %s", e)
+
+    def retry_after(self) -> int:
+        """待ち行列が空くまでのおおよその秒数"""
+        if self._recent_durations:
+            avg_duration = sum(self._recent_durations) / len(self._recent_durations)
+        else:
+            avg_duration = 2.0
+        waves = (self.queue_depth + 1) / max(1, self.workers)
+        return int(min(60, max(1, math.ceil(avg_duration * waves))))
+
+    def resident_memory_bytes(self) -> int:
+        """
+        予約の対象外で常駐するメモリ（バイト）
+        親プロセスの RSS + 各ワーカーの最後の待機時 RSS（デコード済み画像・キャンバスのキャッシュを含む）
+        + 親プロセスのキャッシュ（結果ストア・レンダリング結果）がこれから増えうる分
+        ワーカーのキャッシュが増える分は、初回処理の見積もりに含めて予約する
+        """
+        from utils.metrics import current_rss_bytes
+        from utils.render_cache import get_render_cache
+        from utils.result_store import get_result_store
+
+        resident = current_rss_bytes()
+        if self.workers > 0:
+            # 統計をまだ返していないワーカーは、計測済みのワーカーの最大値（なければ仮定値）とみなす
+            worker_rss = [snapshot["rss"] for snapshot in self._worker_stats.values()][:self.workers]
+            unknown_rss = max(worker_rss, default=DEFAULT_WORKER_RSS_BYTES)
+            resident += sum(worker_rss) + unknown_rss * (self.workers - len(worker_rss))
+        for stats in (get_result_store().stats(), get_render_cache().stats()):
+            resident += max(0, stats["max_bytes"] - stats["bytes"])
+        return resident
+
+    def _refresh_memory_budget(self):
+        if self.memory_budget.enabled:
+            self.memory_budget.update_resident(self.resident_memory_bytes())
+
+    def _record_worker_stats(self, snapshot: Optional[Dict[str, Any]]):
+        if snapshot is not None:
+            self._worker_stats[snapshot["pid"]] = snapshot
+
+    def submit(self, fn, *args, memory_estimate: Optional[MemoryEstimate] = None, **kwargs) -> "asyncio.Future":
+        """
+        関数をプールに投入して完了待ちの Future を返す
+        受け付け判定は呼び出し時点で行う（満杯時は PoolSaturatedError、
+        見積もりが現在の予算全体を超える場合は MemoryBudgetExceededError）
+        """
+        reserve_bytes = 0
+        if memory_estimate is not None:
+            self._refresh_memory_budget()
+            reserve_bytes = self.memory_budget.reservation_bytes(memory_estimate)
+            self.memory_budget.check(reserve_bytes)
+
+        if self._in_flight >= self.capacity:
+            self.rejected += 1
+            raise PoolSaturatedError(self.retry_after())
+
+        self._in_flight += 1
+        return asyncio.ensure_future(self._execute(fn, args, kwargs, memory_estimate, reserve_bytes))
+
+    async def run(self, fn, *args, **kwargs):
+        """関数をプールで実行して結果を返す（満杯時は PoolSaturatedError）"""
+        return await self.submit(fn, *args, **kwargs)
+
+    async def _execute(self, fn, args, kwargs, memory_estimate: Optional[MemoryEstimate] = None,
+                       reserve_bytes: int = 0):
+        submitted_at = time.time()
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(max(1, self.workers))
+        job = None
+        executor = None
+        reserved = 0
+        try:
+            # 空きワーカーを待ってからメモリを予約する（待機中のジョブは予算を占有しない）
+            await self._slots.acquire()
+            try:
+                if reserve_bytes:
+                    self._refresh_memory_budget()
+                    reserved = await self.memory_budget.reserve(reserve_bytes)
+                loop = asyncio.get_running_loop()
+                executor = self._get_executor()
+                job = loop.run_in_executor(executor, _timed_call, fn, args, kwargs)
+            except BaseException:
+                if reserved:
+                    self.memory_budget.release(reserved)
+                self._slots.release()
+                raise
+            # 待っている側が取り消されてもワーカーでの処理は続くため、ワーカー・予約・件数は
+            # 処理の完了時に返す（取り消しは shield で止め、実行中の Future には伝えない）
+            job.add_done_callback(functools.partial(self._finish_job, reserved))
+            started_at, result, snapshot, peak_bytes = await asyncio.shield(job)
+        except BrokenProcessPool as e:
+            # OOM キラーなどでワーカーが終了した場合、以降の投入が失敗し続けないようプールを作り直す
+            self.failed += 1
+            self.worker_crashes += 1
+            logger.error("❌ Render worker terminated unexpectedly, restarting pool: %s", e)
+            self._discard_executor(executor)
+            raise WorkerCrashedError(self.retry_after()) from e
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            if job is None:
+                self._in_flight -= 1
+
+        finished_at = time.time()
+        wait_time = max(0.0, started_at - submitted_at)
+        self.completed += 1
+        self._last_wait = wait_time
+        self._total_wait += wait_time
+        self._max_wait = max(self._max_wait, wait_time)
+        self._recent_durations.append(finished_at - started_at)
+        if memory_estimate is not None:
+            self.memory_budget.calibrate(memory_estimate, peak_bytes)
+
+        # 処理時間の計測値を返す関数（processing_info.timings）には待ち時間を先頭に加える
+        processing_info = result.get("processing_info") if isinstance(result, dict) else None
+        if isinstance(processing_info, dict) and "timings" in processing_info:
+            processing_info["timings"] = {"queue": round(wait_time * 1000, 3), **processing_info["timings"]}
+        return result
+
+    def _finish_job(self, reserved: int, job: "asyncio.Future"):
+        """ワーカーでの処理の完了時（待っている側が取り消された場合も含む）にワーカー・予約・件数を返す"""
+        if not job.cancelled() and job.exception() is None:
+            # 予約を返す前に、キャッシュが増えた分を常駐分に反映する
+            self._record_worker_stats(job.result()[2])
+            if reserved:
+                self._refresh_memory_budget()
+        if reserved:
+            self.memory_budget.release(reserved)
+        self._slots.release()
+        self._in_flight -= 1
+
+    async def warm_up(self):
+        """ワーカープロセスを起動してモジュールを読み込んでおく"""
+        if self.workers == 0:
+            return
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        snapshots = await asyncio.gather(*[
+            loop.run_in_executor(executor, _warm_up) for _ in range(self.workers)
+        ])
+        for snapshot in snapshots:
+            self._record_worker_stats(snapshot)
+        self._refresh_memory_budget()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._progress_queue is not None:
+            self._progress_queue.put(None)
+            self._progress_queue = None
+            self._progress_thread = None
+
+    def worker_stats(self) -> List[Dict[str, Any]]:
+        """各ワーカーから最後に受け取ったキャッシュ統計とメモリ"""
+        return list(self._worker_stats.values())
+
+    def cache_stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        ワーカー内のキャッシュ（デコード済み画像・キャンバス・形状マスク）の統計をキャッシュ名ごとに合算
+        各ワーカーの値は最後のタスク終了時点のもの
+        """
+        totals: Dict[str, Dict[str, Any]] = {}
+        for snapshot in self._worker_stats.values():
+            for name, stats in snapshot["caches"].items():
+                total = totals.setdefault(name, {})
+                for key in CACHE_STAT_KEYS:
+                    if key in stats:
+                        total[key] = total.get(key, 0) + stats[key]
+        for total in totals.values():
+            lookups = total.get("hits", 0) + total.get("misses", 0)
+            total["hit_ratio"] = round(total.get("hits", 0) / lookups, 4) if lookups else 0.0
+        return totals
+
+    def stats(self) -> Dict[str, Any]:
+        """キュー深さと待ち時間の統計"""
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "in_flight": self._in_flight,
+            "busy_workers": self.busy_workers,
+            "queue_depth": self.queue_depth,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "worker_crashes": self.worker_crashes,
+            "last_wait_ms": round(self._last_wait * 1000, 1),
+            "avg_wait_ms": round(self._total_wait / self.completed * 1000, 1) if self.completed else 0.0,
+            "max_wait_ms": round(self._max_wait * 1000, 1),
+            "memory": self.memory_budget.stats()
+        }
+
+
+_render_pool: Optional[RenderPool] = None
+
+
+def get_render_pool() -> RenderPool:
+    """共有レンダリングプールを取得"""
+    global _render_pool
+    if _render_pool is None:
+        settings = get_settings()
+        _render_pool = RenderPool(
+            settings.RENDER_WORKERS,
+            settings.RENDER_QUEUE_SIZE,
+            settings.RENDER_POOL_START_METHOD,
+            MemoryBudget(settings.RENDER_MEMORY_LIMIT, settings.MEMORY_CALIBRATION_WINDOW)
+        )
+    return _render_pool
+
+
+def shutdown_render_pool():
+    """アプリ終了時にワーカーを停止"""
+    global _render_pool
+    if _render_pool is not None:
+        _render_pool.shutdown()
+        _render_pool = None
@@ -0,0 +1,148 @@
+"""
+結果ストア - エンコード済みの結果画像をメモリに保持して直接配信する
+バイト予算と有効期限の範囲で新しい結果をメモリに置き、予算を超えた古い結果のみ static/ へ書き出す
+（書き込み→存在確認→再読み込みのディスク往復をリクエストごとに行わない）
+"""
+import mimetypes
+import os
+import stat
+import threading
+import time
+from typing import Any, Dict, Hashable, List, NamedTuple, Optional, Tuple
+
+import anyio
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import Response
+
+from config.app import get_settings
+from utils.artifact_index import get_artifact_index
+from utils.http_cache import artifact_response, content_etag
+from utils.image_cache import ByteBudgetLRU
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class StoredResult(NamedTuple):
+    """メモリ上の結果画像（エンコード済みバイト列・MIME タイプ・内容ハッシュの ETag・有効期限）"""
+    data: bytes
+    media_type: str
+    etag: str
+    created_at: float
+    expires_at: float
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+
+class ResultStore:
+    """バイト予算付きの結果ストア（予算超過分はディスクへ退避）"""
+
+    def __init__(self, max_bytes: int, ttl: int, directory: str = "static"):
+        self.ttl = ttl
+        self.directory = directory
+        self.spills = 0
+        self.spilled_bytes = 0
+        # 退避中のエントリ（書き込み完了までメモリから配信する）
+        self._spilling: Dict[str, StoredResult] = {}
+        self._lock = threading.Lock()
+        self._cache = ByteBudgetLRU("results", max_bytes, on_evict=self._spill)
+
+    def put(self, filename: str, data: bytes, media_type: str) -> StoredResult:
+        """結果を登録（予算を超える単一の結果はそのままディスクへ書き出す）"""
+        now = time.time()
+        stored = StoredResult(data, media_type, content_etag(data), now, now + self.ttl)
+        if not self._cache.put(filename, stored, stored.size, stored.expires_at):
+            self._spill([(filename, stored)])
+        return stored
+
+    def get(self, filename: str) -> Optional[StoredResult]:
+        """メモリ上の結果を取得（ディスクにのみある場合や期限切れは None）"""
+        stored = self._cache.get(filename)
+        if stored is None:
+            with self._lock:
+                stored = self._spilling.get(filename)
+        return stored
+
+    def _spill(self, evicted: List[Tuple[Hashable, Any]]):
+        """予算超過で追い出された結果をディスクへ書き出す（期限切れは破棄）"""
+        now = time.time()
+        pending = [(filename, stored) for filename, stored in evicted if stored.expires_at > now]
+        with self._lock:
+            self._spilling.update(pending)
+
+        os.makedirs(self.directory, exist_ok=True)
+        for filename, stored in pending:
+            path = os.path.join(self.directory, filename)
+            temp_path = f"{path}.part"
+            try:
+                with open(temp_path, "wb") as out_file:
+                    out_file.write(stored.data)
+                os.replace(temp_path, path)
+                # ディスク上では残りの有効期限まで保持（スイーパーが削除）
+                get_artifact_index().record(filename, stored.size, stored.expires_at)
+                self.spills += 1
+                self.spilled_bytes += stored.size
+                logger.debug("💾 Result spilled to disk: %s (%d bytes)", filename, stored.size)
+            except OSError as e:
+                logger.error("❌ Failed to spill result %s: %s", filename, e)
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            finally:
+                with self._lock:
+                    self._spilling.pop(filename, None)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self._cache.stats()
+        stats.update({
+            "ttl": self.ttl,
+            "spills": self.spills,
+            "spilled_bytes": self.spilled_bytes
+        })
+        return stats
+
+
+async def stored_result_response(request_headers, filename: str, stored: StoredResult,
+                                 download_name: Optional[str] = None) -> Response:
+    """メモリ上の結果からレスポンスを作成（download_name 指定時は添付ファイルとして返す）"""
+    return await artifact_response(
+        request_headers, filename, stored.media_type,
+        data=stored.data, etag=stored.etag, download_name=download_name
+    )
+
+
+class ResultStaticFiles(StaticFiles):
+    """
+    /uploads の配信: メモリ上の結果を優先し、なければディスクのファイルを返す
+    どちらも内容ハッシュの ETag・immutable キャッシュ・条件付き GET・Range に対応
+    """
+
+    async def get_response(self, path: str, scope) -> Response:
+        if scope["method"] in ("GET", "HEAD") and "/" not in path:
+            request_headers = Headers(scope=scope)
+            stored = get_result_store().get(path)
+            if stored is not None:
+                return await stored_result_response(request_headers, path, stored)
+
+            full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path)
+            if stat_result is not None and stat.S_ISREG(stat_result.st_mode):
+                media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+                get_artifact_index().touch(path)
+                return await artifact_response(
+                    request_headers, path, media_type, path=full_path, stat_result=stat_result
+                )
+        return await super().get_response(path, scope)
+
+
+_result_store: Optional[ResultStore] = None
+
+
+def get_result_store() -> ResultStore:
+    """共有結果ストアを取得"""
+    global _result_store
+    if _result_store is None:
+        settings = get_settings()
+        _result_store = ResultStore(settings.RESULT_STORE_MAX_BYTES, settings.TEMP_FILE_EXPIRY)
+    return _result_store
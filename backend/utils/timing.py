@@ -0,0 +1,69 @@
+"""
+処理時間の計測 - フェーズごとの所要時間を記録し、processing_info と Server-Timing ヘッダーで返す
+"""
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+
+class PhaseTimer:
+    """
+    フェーズ単位の区間計測（perf_counter 基準、同名の区間は加算）
+    begin / end で区切るか、span をコンテキストマネージャとして使う
+    """
+
+    __slots__ = ("_durations", "_current", "_started_at", "_created_at")
+
+    def __init__(self):
+        self._durations: Dict[str, float] = {}
+        self._current: Optional[str] = None
+        self._started_at = 0.0
+        self._created_at = time.perf_counter()
+
+    def begin(self, name: str):
+        """区間を開始（計測中の区間があれば終了する）"""
+        if self._current is not None:
+            self.end()
+        self._current = name
+        self._started_at = time.perf_counter()
+
+    def end(self) -> float:
+        """計測中の区間を終了して所要時間（秒）を返す"""
+        if self._current is None:
+            return 0.0
+        elapsed = time.perf_counter() - self._started_at
+        self.record(self._current, elapsed)
+        self._current = None
+        return elapsed
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started_at)
+
+    def record(self, name: str, seconds: float):
+        self._durations[name] = self._durations.get(name, 0.0) + seconds
+
+    def elapsed(self) -> float:
+        """計測開始からの経過秒数"""
+        return time.perf_counter() - self._created_at
+
+    def as_dict(self) -> Dict[str, float]:
+        """区間ごとの所要時間（ミリ秒）と合計（total）"""
+        timings = {name: round(seconds * 1000, 3) for name, seconds in self._durations.items()}
+        timings["total"] = round(self.elapsed() * 1000, 3)
+        return timings
+
+
+def server_timing_header(timings: Optional[Dict[str, float]], cache_status: Optional[str] = None) -> str:
+    """
+    Server-Timing ヘッダーの値を作成（timings はミリ秒）
+    例: queue;dur=1.2, load;dur=35.0, ..., total;dur=410.3, cache;desc="miss"
+    """
+    metrics = [f"{name};dur={duration:.1f}" for name, duration in (timings or {}).items()]
+    if cache_status is not None:
+        metrics.append(f'cache;desc="{cache_status}"')
+    return ", ".join(metrics)
@@ -72,7 +72,8 @@ const Settings = ({ onComplete }) => {
       "color_preserving": 4,
       "hue_preserving": 4,
       "blended": 3,
-      "hybrid_overlay": 2.5
+      "hybrid_overlay": 2.5,
+      "gradation": 1.5
     };
     
     const baseTime = 6; // パラメータ拡張により少し増加
@@ -353,6 +354,7 @@ const Settings = ({ onComplete }) => {
               <option value="hue_preserving">🐌 色相保存モード（時間要）</option>
               <option value="blended">🐌 ブレンドモード（やや時間要）</option>
               <option value="hybrid_overlay">⚡ 混合モード（高速）</option>
+              <option value="gradation">⚡ 濃淡グラデーション縞（高速）</option>
             </select>
             <small style={{ color: 'var(--text-muted)', fontSize: '0.8rem' }}>
               🚀=超高速 ⚡=高速 🐌=高品質だが時間要 | overlayが隠し画像最適